@@ -1,87 +1,5462 @@
+# annotations must not import the lazily loaded modules
+from __future__ import annotations
+
 import os
 import sys
 import time
+
+_T_MODULE_START = time.perf_counter()
+
+import importlib
+import importlib.util
 import threading
+import queue
 import datetime
 import subprocess
 import shutil
+import re
+import signal
+import argparse
+import bisect
+import contextlib
+import json
+import mmap
+import select
+import struct
+import zlib
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import dataclasses
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple
+from collections import deque
+
+
+# ----------------------- STARTUP -----------------------
+class StartupProfile:
+    """
+    Where startup time goes: how long each lazily imported module took on first use,
+    and when milestones (window shown, first frame captured/written) were reached,
+    in seconds since this module started loading. Always collected (a few dict
+    writes); reported by --startup-profile.
+    """
+
+    def __init__(self, t0: float) -> None:
+        self.t0 = t0
+        self.imports: dict = {}  # module -> seconds spent importing it and its imports
+        self.marks: dict = {}  # milestone -> seconds since t0 (first occurrence only)
+
+    def mark(self, name: str) -> None:
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.t0
+
+    @contextlib.contextmanager
+    def timed_import(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.imports.setdefault(name, time.perf_counter() - t)
+
+    def report(self) -> str:
+        """Text in the spirit of `python -X importtime`, then the milestones."""
+        lines = [
+            f"import time: {1e6 * sec:>10.0f} us | {name}"
+            for name, sec in self.imports.items()
+        ]
+        lines += [
+            f"startup:     {1e3 * sec:>10.1f} ms | {name}"
+            for name, sec in sorted(self.marks.items(), key=lambda item: item[1])
+        ]
+        return "\n".join(lines)
+
+    def as_dict(self) -> dict:
+        return {
+            "imports_ms": {k: 1e3 * v for k, v in self.imports.items()},
+            "marks_ms": {k: 1e3 * v for k, v in self.marks.items()},
+        }
+
+
+startup_profile = StartupProfile(_T_MODULE_START)
+
+
+class _LazyModule:
+    """
+    Placeholder for a heavy module bound to a global name: the first attribute access
+    imports it and rebinds the global to the real module, so only that first access
+    goes through here.
+    """
+
+    def __init__(self, name: str, alias: str) -> None:
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_alias", alias)
+
+    def _load(self):
+        with startup_profile.timed_import(self._name):
+            module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value) -> None:
+        setattr(self._load(), attr, value)
+
+
+# GUI (not needed by the headless `record` command)
+tk = _LazyModule("tkinter", "tk")
+ttk = _LazyModule("tkinter.ttk", "ttk")
+messagebox = _LazyModule("tkinter.messagebox", "messagebox")
+filedialog = _LazyModule("tkinter.filedialog", "filedialog")
+
+# Capture and video: imported on the first recording / monitor query
+mss = _LazyModule("mss", "mss")
+cv2 = _LazyModule("cv2", "cv2")
+np = _LazyModule("numpy", "np")
+
+# Optional: global hotkeys and mouse events (may not be available in all envs).
+# pynput connects to the X server on import, so it is loaded on first use too.
+keyboard = pynput_mouse = None
+_HAVE_PYNPUT: Optional[bool] = None  # unknown until _have_pynput()
+
+
+def _have_pynput() -> bool:
+    global keyboard, pynput_mouse, _HAVE_PYNPUT
+    if _HAVE_PYNPUT is None:
+        try:
+            with startup_profile.timed_import("pynput"):
+                from pynput import keyboard, mouse as pynput_mouse
+            _HAVE_PYNPUT = True
+        except Exception:
+            _HAVE_PYNPUT = False
+    return _HAVE_PYNPUT
+
+
+# Optional: LZ4 compression of spooled frames (falls back to zlib)
+lz4_block = None
+_HAVE_LZ4: Optional[bool] = None  # unknown until _have_lz4()
+
+
+def _have_lz4() -> bool:
+    global lz4_block, _HAVE_LZ4
+    if _HAVE_LZ4 is None:
+        try:
+            with startup_profile.timed_import("lz4"):
+                import lz4.block as lz4_block
+            _HAVE_LZ4 = True
+        except Exception:
+            _HAVE_LZ4 = False
+    return _HAVE_LZ4
+
+
+# Optional: direct X11 connection for following the active window
+X = xdisplay = xrandr = None
+_HAVE_XLIB: Optional[bool] = None  # unknown until _have_xlib()
+
+
+def _have_xlib() -> bool:
+    global X, xdisplay, xrandr, _HAVE_XLIB
+    if _HAVE_XLIB is None:
+        try:
+            with startup_profile.timed_import("Xlib"):
+                from Xlib import X, display as xdisplay
+                from Xlib.ext import randr as xrandr
+            _HAVE_XLIB = True
+        except Exception:
+            _HAVE_XLIB = False
+    return _HAVE_XLIB
+
+
+@dataclass
+class BBox:
+    left: int
+    top: int
+    width: int
+    height: int
+
+    def as_mss(self):
+        return {
+            "left": int(self.left),
+            "top": int(self.top),
+            "width": int(self.width),
+            "height": int(self.height),
+        }
+
+
+# ----------------------- CAPTURE PIPELINE -----------------------
+# Drop policies for the bounded queues between pipeline stages.
+DROP_OLDEST = "drop-oldest"  # evict the oldest queued frame (lowest latency)
+DROP_NEWEST = "drop-newest"  # discard the incoming frame, keep what is queued
+DROP_BLOCK = "block"  # wait for room (capture timing then depends on downstream)
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, DROP_BLOCK)
+
+
+class FrameBuffer:
+    """A preallocated frame owned by a FrameBufferPool.
+
+    Reference counted so one buffer can be shared between pipeline stages (e.g.
+    duplicates in the encoder and the last processed frame); it goes back to its
+    pool when the last reference is released.
+    """
+
+    __slots__ = ("array", "_pool", "_refs")
+
+    def __init__(self, array: np.ndarray, pool: "FrameBufferPool") -> None:
+        self.array = array
+        self._pool = pool
+        self._refs = 1
+
+    def retain(self) -> "FrameBuffer":
+        with self._pool._lock:
+            self._refs += 1
+        return self
+
+    def release(self) -> None:
+        self._pool._release(self)
+
+
+class FrameBufferPool:
+    """Free list of same-shaped uint8 frames for the capture hot path.
+
+    Buffers are only reallocated when the requested shape changes (capture bbox
+    or writer size), so steady-state recording does no per-frame allocation.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._shape: Optional[Tuple[int, ...]] = None
+        self._free: list = []
+        self.allocated = 0  # total buffers ever allocated (for diagnostics)
+
+    def acquire(self, shape: Tuple[int, ...]) -> FrameBuffer:
+        with self._lock:
+            if shape != self._shape:
+                # Region changed: forget buffers of the old shape
+                self._shape = shape
+                self._free = []
+            if self._free:
+                buf = self._free.pop()
+                buf._refs = 1
+                return buf
+            self.allocated += 1
+        return FrameBuffer(np.empty(shape, dtype=np.uint8), self)
+
+    def _release(self, buf: FrameBuffer) -> None:
+        with self._lock:
+            buf._refs -= 1
+            if buf._refs == 0 and buf.array.shape == self._shape:
+                self._free.append(buf)
+
+
+@dataclass
+class FramePacket:
+    """A frame travelling through the capture -> process -> encode stages."""
+
+    seq: int
+    t_capture: float
+    repeats: int  # writer slots covered by this frame (CFR scheduling)
+    bbox: BBox
+    frame: np.ndarray  # BGRA after capture, BGR at writer_size after processing
+    buffer: Optional[FrameBuffer] = None  # pooled storage backing `frame`, if any
+    t_media: float = 0.0  # seconds since start, excluding pauses
+    reused: bool = False  # identical to the previous processed frame
+
+    def release(self) -> None:
+        if self.buffer is not None:
+            self.buffer.release()
+            self.buffer = None
+
+
+class FrameQueue:
+    """Bounded hand-off between two pipeline stages.
+
+    Frames dropped by the policy are not lost from the timeline: their writer
+    slots are carried over to the next frame that gets through, which the
+    encoder then writes as duplicates. Each queue has a single producer.
+    """
+
+    def __init__(self, maxsize: int, policy: str = DROP_OLDEST) -> None:
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.policy = policy
+        self.dropped = 0
+        self._q: "queue.Queue[Optional[FramePacket]]" = queue.Queue(
+            maxsize=max(1, int(maxsize))
+        )
+        self._carry = 0
+
+    def put(self, packet: FramePacket, stop_event: threading.Event) -> bool:
+        """Enqueue a packet according to the drop policy.
+
+        Returns False if it was dropped.
+        """
+        packet.repeats += self._carry
+        self._carry = 0
+        if self.policy == DROP_BLOCK:
+            while not stop_event.is_set():
+                try:
+                    self._q.put(packet, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            packet.release()
+            return False
+        while True:
+            try:
+                self._q.put_nowait(packet)
+                return True
+            except queue.Full:
+                pass
+            if self.policy == DROP_NEWEST:
+                self._carry += packet.repeats
+                packet.release()
+                self.dropped += 1
+                return False
+            try:
+                old = self._q.get_nowait()
+            except queue.Empty:
+                continue  # consumer made room meanwhile
+            if old is not None:
+                packet.repeats += old.repeats
+                old.release()
+                self.dropped += 1
+
+    def get(self, timeout: float = 0.1) -> Optional[FramePacket]:
+        """Next packet, or None once the producer has closed the queue.
+        Raises queue.Empty on timeout.
+        """
+        return self._q.get(timeout=timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Signal end of stream; the consumer drains queued frames first.
+        If the consumer is stuck for longer than `timeout`, the oldest frame is evicted.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._q.put(None, timeout=0.1)
+                return
+            except queue.Full:
+                if time.monotonic() < deadline:
+                    continue
+            try:
+                old = self._q.get_nowait()
+                if old is not None:
+                    old.release()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+    def qsize(self) -> int:
+        return self._q.qsize()
+
+
+MAX_TARGET_FPS = 120.0
+
+
+class FrameScheduler:
+    """
+    Constant-frame-rate clock for the capture stage. Slot k is due at t0 + k / fps,
+    so the schedule never accumulates float drift. wait() sleeps on an Event until
+    shortly before the slot and spin-yields the remainder, which lands within tens
+    of microseconds where plain sleep() overshoots by up to a millisecond or more;
+    wake() (pause, resume, stop) interrupts any wait immediately.
+    The lateness of every grab against its slot is recorded to measure jitter.
+    """
+
+    SPIN_WINDOW = 0.0015  # final stretch before a slot that is spun instead of slept
+
+    def __init__(self, fps: float, history: int = 36000) -> None:
+        if not 0 < fps <= MAX_TARGET_FPS:
+            raise ValueError(
+                f"Frame rate must be in (0, {MAX_TARGET_FPS:g}], got {fps:g}"
+            )
+        self.interval = 1.0 / float(fps)
+        self.stride = 1  # grab every stride-th slot; the writer duplicates the others
+        self.lateness = deque(maxlen=history)  # seconds per grab, most recent last
+        self._wake = threading.Event()
+        self._t0 = time.monotonic()
+        self._k = 1
+        self._window_sum = 0.0
+        self._window_count = 0
+        self._window_max = 0.0
+
+    def start(self, now: float) -> None:
+        """First slot one interval after `now`."""
+        self._t0 = now
+        self._k = 1
+        self.lateness.clear()
+
+    @property
+    def next_due(self) -> float:
+        return self._t0 + (self._k + self.stride - 1) * self.interval
+
+    def shift(self, seconds: float) -> None:
+        """Move the whole schedule, e.g. by the paused duration on resume."""
+        self._t0 += seconds
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until wake() (or timeout). True if woken."""
+        woken = self._wake.wait(timeout)
+        self._wake.clear()
+        return woken
+
+    def wait(self) -> bool:
+        """Block until the next slot is due. False if interrupted by wake()."""
+        due = self.next_due
+        sleep = due - time.monotonic() - self.SPIN_WINDOW
+        if sleep > 0 and self._wake.wait(sleep):
+            self._wake.clear()
+            return False
+        while time.monotonic() < due:
+            time.sleep(0)  # yield the GIL while spinning
+        return True
+
+    def advance(self, t_grab: float, now: float) -> int:
+        """Consume every slot due by `now` and return how many (the writer slots
+        this frame covers). Records how late the grab started for its slot.
+        """
+        due = self.next_due
+        n = int((now + 1e-5 - self._t0) / self.interval) - self._k + 1
+        if n < self.stride:
+            return 0
+        self._k += n
+        late = max(0.0, t_grab - due)
+        self.lateness.append(late)
+        self._window_sum += late
+        self._window_count += 1
+        self._window_max = max(self._window_max, late)
+        return n
+
+    def take_window(self) -> Tuple[float, float]:
+        """(mean, max) lateness in ms since the previous call."""
+        mean = (
+            1000.0 * self._window_sum / self._window_count
+            if self._window_count
+            else 0.0
+        )
+        result = (mean, 1000.0 * self._window_max)
+        self._window_sum, self._window_count, self._window_max = 0.0, 0, 0.0
+        return result
+
+    def summary(self) -> dict:
+        """Lateness over the recorded history: frames, mean/p50/p99/max in ms."""
+        if not self.lateness:
+            return {
+                "frames": 0,
+                "mean_ms": 0.0,
+                "p50_ms": 0.0,
+                "p99_ms": 0.0,
+                "max_ms": 0.0,
+            }
+        late = np.fromiter(self.lateness, dtype=np.float64) * 1000.0
+        p50, p99 = np.percentile(late, [50, 99])
+        return {
+            "frames": int(late.size),
+            "mean_ms": float(late.mean()),
+            "p50_ms": float(p50),
+            "p99_ms": float(p99),
+            "max_ms": float(late.max()),
+        }
+
+
+# ----------------------- REGION HELPERS -----------------------
+def even(n: int) -> int:
+    """Round down to an even pixel count (most codecs need even dimensions)."""
+    return int(n) - (int(n) % 2)
+
+
+class DisplayTopology:
+    """
+    Process-wide cache of the monitor layout, so region math and overlays do not
+    open an mss connection per call. The layout is read once and re-read only
+    after invalidate()/refresh(); on X11 with python-xlib a RandR listener
+    invalidates it when screens are added, removed, moved or resized.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._monitors: Optional[list] = None
+        self._listeners: list = []
+        self._watch_thread: Optional[threading.Thread] = None
+        self.watching = False  # True while RandR change events are being received
+
+    def monitors(self) -> list:
+        """Displays as BBoxes: 0 = virtual desktop, 1..N = the monitors (mss order)."""
+        with self._lock:
+            if self._monitors is None:
+                with mss.mss() as sct:
+                    self._monitors = [
+                        BBox(m["left"], m["top"], m["width"], m["height"])
+                        for m in sct.monitors
+                    ]
+            monitors = self._monitors
+        self._ensure_watching()
+        return list(monitors)
+
+    def primary(self) -> BBox:
+        # In mss, monitors[1] is usually the primary monitor on most platforms
+        monitors = self.monitors()
+        return monitors[1] if len(monitors) > 1 else monitors[0]
+
+    def invalidate(self) -> None:
+        """Drop the cached layout and tell subscribers; the next query re-reads it."""
+        with self._lock:
+            self._monitors = None
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def refresh(self) -> list:
+        self.invalidate()
+        return self.monitors()
+
+    def subscribe(self, callback: Callable[[], None]) -> None:
+        """Call `callback` (from any thread) whenever the layout is invalidated."""
+        self._listeners.append(callback)
+
+    def _ensure_watching(self) -> None:
+        if (
+            self._watch_thread is not None
+            or not os.environ.get("DISPLAY")
+            or not _have_xlib()
+        ):
+            return
+        self._watch_thread = threading.Thread(
+            target=self._watch_randr, name="ScreenRecorderRandR", daemon=True
+        )
+        self._watch_thread.start()
+
+    def _watch_randr(self) -> None:
+        try:
+            disp = xdisplay.Display()
+        except Exception:
+            return
+        try:
+            if not disp.has_extension("RANDR"):
+                return
+            disp.screen().root.xrandr_select_input(
+                xrandr.RRScreenChangeNotifyMask
+                | xrandr.RRCrtcChangeNotifyMask
+                | xrandr.RROutputChangeNotifyMask
+            )
+            disp.flush()
+            self.watching = True
+            while True:
+                if not disp.pending_events():
+                    select.select([disp], [], [], 5.0)
+                changed = False
+                while disp.pending_events():
+                    disp.next_event()  # only RandR events are selected
+                    changed = True
+                if changed:
+                    self.invalidate()
+        except Exception:
+            pass
+        finally:
+            self.watching = False
+            disp.close()
+
+
+display_topology = DisplayTopology()
+
+
+def get_primary_monitor_rect() -> BBox:
+    """Primary monitor rectangle (cached, see DisplayTopology)."""
+    return display_topology.primary()
+
+
+def calc_centered_bbox(mon: BBox, ratio: Optional[Tuple[int, int]]) -> BBox:
+    """Largest even-sized `ratio` rectangle centered on `mon` (None = whole monitor)."""
+    if ratio is None:
+        # Full screen
+        return BBox(mon.left, mon.top, even(mon.width), even(mon.height))
+
+    rw, rh = ratio
+    W, H = mon.width, mon.height
+    # Compute the largest rectangle of aspect rw:rh that fits within W x H
+    # Try width-constrained
+    h_by_w = int(W * rh / rw)
+    if h_by_w <= H:
+        width = W
+        height = h_by_w
+    else:
+        width = int(H * rw / rh)
+        height = H
+    width = even(width)
+    height = even(height)
+    left = mon.left + (W - width) // 2
+    top = mon.top + (H - height) // 2
+    return BBox(left, top, width, height)
+
+
+def scaled_size(
+    width: int, height: int, scale: float = 1.0, max_width: Optional[int] = None
+) -> Tuple[int, int]:
+    """Output (w, h) for a capture area: times `scale`, then shrunk to at most
+    `max_width` keeping the aspect ratio. Dimensions are even (yuv420p).
+    """
+    w, h = width * scale, height * scale
+    if max_width and w > max_width:
+        w, h = max_width, h * max_width / w
+    return max(2, even(int(round(w)))), max(2, even(int(round(h))))
+
+
+def parse_region(text: str, mon: Optional[BBox] = None) -> BBox:
+    """Parse a region spec: 'full', an aspect ratio such as '16:9' (centered on the
+    primary monitor), or an explicit geometry 'WIDTHxHEIGHT+LEFT+TOP'.
+    """
+    spec = text.strip().lower()
+    if spec in ("full", "fullscreen", "full screen"):
+        return calc_centered_bbox(mon or get_primary_monitor_rect(), None)
+    if ":" in spec:
+        rw, rh = spec.split(":", 1)
+        return calc_centered_bbox(mon or get_primary_monitor_rect(), (int(rw), int(rh)))
+    m = re.fullmatch(r"(\d+)x(\d+)(?:([+-]\d+)([+-]\d+))?", spec)
+    if m is None:
+        raise ValueError(
+            f"Invalid region '{text}': expected full, W:H or WIDTHxHEIGHT+LEFT+TOP"
+        )
+    width, height, left, top = m.groups()
+    bbox = BBox(int(left or 0), int(top or 0), even(int(width)), even(int(height)))
+    if bbox.width < 4 or bbox.height < 4:
+        raise ValueError(f"Region '{text}' is too small")
+    return bbox
+
+
+def build_output_path(
+    out_dir: str, template: str, when: Optional[datetime.datetime] = None
+) -> str:
+    """Expand a strftime filename template inside `out_dir` (created if needed)."""
+    timestamp = when or datetime.datetime.now()
+    try:
+        base = timestamp.strftime(template)
+    except Exception:
+        base = timestamp.strftime("HRaJi_%Y-%m-%d_%H-%M-%S.mp4")
+    out_dir = out_dir or os.getcwd()
+    os.makedirs(out_dir, exist_ok=True)
+    return os.path.join(out_dir, base)
+
+
+class ChangeDetector:
+    """
+    Vectorized dirty-tile check between consecutive captured frames.
+
+    BGRA pixels are compared as single uint32 values (one compare per pixel); a
+    fully static frame exits after that compare. Otherwise mismatches are reduced
+    per `tile` x `tile` block for the change statistics. With `stride` > 1 only
+    every stride-th pixel is compared, which can miss thin changes, so a full
+    refresh is then forced every `refresh_every` frames.
+    """
+
+    def __init__(
+        self, tile: int = 64, stride: int = 1, refresh_every: int = 30
+    ) -> None:
+        self.stride = max(1, int(stride))
+        self.tile = max(self.stride, int(tile))
+        self.refresh_every = max(1, int(refresh_every))
+        self._prev: Optional[np.ndarray] = None
+        self._mask: Optional[np.ndarray] = None
+        self._since_refresh = 0
+
+    def reset(self) -> None:
+        self._prev = None
+
+    def check(self, frame: np.ndarray) -> Tuple[bool, float]:
+        """Return (changed, fraction of tiles that changed) for `frame` (BGRA or BGR).
+        `frame` is kept as the reference for the next call, so it must not be reused.
+        """
+        prev, self._prev = self._prev, frame
+        if prev is None or prev.shape != frame.shape:
+            self._since_refresh = 0
+            return True, 1.0
+        cur_s, prev_s = self._pixels(frame), self._pixels(prev)
+        if self._mask is None or self._mask.shape != cur_s.shape:
+            self._mask = np.empty(cur_s.shape, dtype=bool)
+        mask = self._mask
+        np.not_equal(cur_s, prev_s, out=mask)
+        forced = False
+        if self.stride > 1:
+            self._since_refresh += 1
+            if self._since_refresh >= self.refresh_every:
+                self._since_refresh = 0
+                forced = True
+        if not mask.view(np.uint8).any():
+            return forced, 0.0
+        if mask.ndim == 3:
+            mask = mask.any(axis=2)  # BGR: one flag per pixel
+        # Per-tile OR: first across rows, then across columns
+        ts = max(1, self.tile // self.stride)
+        rows = np.logical_or.reduceat(mask, np.arange(0, mask.shape[0], ts), axis=0)
+        tiles = np.logical_or.reduceat(rows, np.arange(0, mask.shape[1], ts), axis=1)
+        return True, float(np.count_nonzero(tiles)) / tiles.size
+
+    def _pixels(self, frame: np.ndarray) -> np.ndarray:
+        s = self.stride
+        if frame.shape[2] == 4 and frame.strides[2] == 1 and frame.strides[1] == 4:
+            # Reinterpret each BGRA pixel as one uint32
+            return frame.view(np.uint32)[..., 0][::s, ::s]
+        return frame[::s, ::s, :3]
+
+
+# ----------------------- FRAME SOURCES -----------------------
+class FrameSource:
+    """Where the capture stage gets its frames from.
+
+    open()/close() are called on the capture thread (mss handles are thread-bound).
+    grab(bbox) returns an HxWx4 BGRA or HxWx3 BGR uint8 array covering `bbox`; the
+    array must stay valid after later grabs because it is handed to another stage.
+    """
+
+    name = "base"
+
+    def bounds(self) -> BBox:
+        """Full area this source can deliver (used for 'full' and centered regions)."""
+        raise NotImplementedError
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def grab(self, bbox: BBox) -> np.ndarray:
+        raise NotImplementedError
+
+    def __enter__(self) -> "FrameSource":
+        self.open()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class MssFrameSource(FrameSource):
+    """Live screen capture via mss."""
+
+    name = "screen"
+
+    def __init__(self) -> None:
+        self._sct = None
+
+    def bounds(self) -> BBox:
+        return get_primary_monitor_rect()
+
+    def open(self) -> None:
+        self._sct = mss.mss()
+
+    def close(self) -> None:
+        if self._sct is not None:
+            try:
+                self._sct.close()
+            finally:
+                self._sct = None
+
+    def grab(self, bbox: BBox) -> np.ndarray:
+        img = self._sct.grab(bbox.as_mss())
+        # Zero-copy BGRA view over the mss buffer (mss allocates a new one per grab)
+        return np.frombuffer(img.raw, dtype=np.uint8).reshape(img.height, img.width, 4)
+
+
+class SyntheticFrameSource(FrameSource):
+    """Deterministic moving test pattern; needs no display.
+
+    Frame N depends only on N (animation advances 1/fps per grab), so runs are
+    reproducible regardless of machine speed.
+    """
+
+    name = "synthetic"
+
+    def __init__(
+        self, width: int = 1920, height: int = 1080, fps: float = 30.0
+    ) -> None:
+        self.width = even(width)
+        self.height = even(height)
+        self.fps = float(fps)
+        self._index = 0
+        self._background: Optional[np.ndarray] = None
+
+    def bounds(self) -> BBox:
+        return BBox(0, 0, self.width, self.height)
+
+    def open(self) -> None:
+        self._index = 0
+        if self._background is None:
+            # Static diagonal gradient with a grid, BGRA
+            ys, xs = np.mgrid[0 : self.height, 0 : self.width]
+            bg = np.empty((self.height, self.width, 4), dtype=np.uint8)
+            bg[..., 0] = (xs * 255 // max(1, self.width - 1)).astype(np.uint8)
+            bg[..., 1] = (ys * 255 // max(1, self.height - 1)).astype(np.uint8)
+            bg[..., 2] = 64
+            bg[..., 3] = 255
+            bg[::64, :, :3] = 200
+            bg[:, ::64, :3] = 200
+            self._background = bg
+
+    def grab(self, bbox: BBox) -> np.ndarray:
+        t = self._index / self.fps
+        self._index += 1
+        x0, y0 = max(0, bbox.left), max(0, bbox.top)
+        x1 = min(self.width, bbox.left + bbox.width)
+        y1 = min(self.height, bbox.top + bbox.height)
+        frame = np.zeros((bbox.height, bbox.width, 4), dtype=np.uint8)
+        if x1 <= x0 or y1 <= y0:
+            return frame
+        rows = slice(y0 - bbox.top, y1 - bbox.top)
+        cols = slice(x0 - bbox.left, x1 - bbox.left)
+        frame[rows, cols] = self._background[y0:y1, x0:x1]
+        # Vertical bar sweeping across in 4 s and a box bouncing vertically every 2 s
+        bar_w = max(8, self.width // 40)
+        bar_x = int((t % 4.0) / 4.0 * (self.width - bar_w))
+        self._fill(frame, bbox, bar_x, 0, bar_w, self.height, (255, 255, 255, 255))
+        box = max(16, self.height // 8)
+        phase = (t % 2.0) / 2.0
+        box_y = int((1.0 - abs(2.0 * phase - 1.0)) * (self.height - box))
+        self._fill(
+            frame, bbox, (self.width - box) // 2, box_y, box, box, (0, 0, 255, 255)
+        )
+        return frame
+
+    @staticmethod
+    def _fill(
+        frame: np.ndarray,
+        bbox: BBox,
+        x: int,
+        y: int,
+        w: int,
+        h: int,
+        color: Tuple[int, ...],
+    ) -> None:
+        # Fill a rectangle given in source coordinates, clipped to bbox
+        lx0 = max(0, x - bbox.left)
+        ly0 = max(0, y - bbox.top)
+        lx1 = min(bbox.width, x + w - bbox.left)
+        ly1 = min(bbox.height, y + h - bbox.top)
+        if lx1 > lx0 and ly1 > ly0:
+            frame[ly0:ly1, lx0:lx1] = color
+
+
+class ReplayFrameSource(FrameSource):
+    """Replays frames from a video file or a raw dump, looping at the end.
+
+    Raw dumps are headerless concatenated frames: '.bgra'/'.raw' files hold
+    4-channel frames and '.bgr' files 3-channel ones; `size` must be given.
+    """
+
+    name = "replay"
+
+    RAW_EXTENSIONS = {".raw": 4, ".bgra": 4, ".bgr": 3}
+
+    def __init__(
+        self, path: str, size: Optional[Tuple[int, int]] = None, loop: bool = True
+    ) -> None:
+        self.path = path
+        self.loop = loop
+        ext = os.path.splitext(path)[1].lower()
+        self._channels = self.RAW_EXTENSIONS.get(ext)
+        self._raw: Optional[np.ndarray] = None
+        self._cap = None
+        self._index = 0
+        if self._channels is not None:
+            if size is None:
+                raise ValueError(f"Frame size is required for raw dump '{path}'")
+            self.width, self.height = int(size[0]), int(size[1])
+        else:
+            cap = cv2.VideoCapture(path)
+            if not cap.isOpened():
+                raise ValueError(f"Cannot open video '{path}'")
+            self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            cap.release()
+
+    def bounds(self) -> BBox:
+        return BBox(0, 0, even(self.width), even(self.height))
+
+    def open(self) -> None:
+        self._index = 0
+        if self._channels is not None:
+            frame_bytes = self.width * self.height * self._channels
+            count = os.path.getsize(self.path) // frame_bytes
+            if count == 0:
+                raise ValueError(
+                    f"Raw dump '{self.path}' holds no complete "
+                    f"{self.width}x{self.height} frame"
+                )
+            self._raw = np.memmap(
+                self.path,
+                dtype=np.uint8,
+                mode="r",
+                shape=(count, self.height, self.width, self._channels),
+            )
+        else:
+            self._cap = cv2.VideoCapture(self.path)
+
+    def close(self) -> None:
+        self._raw = None
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def grab(self, bbox: BBox) -> np.ndarray:
+        if self._raw is not None:
+            if self._index >= len(self._raw) and not self.loop:
+                raise EOFError("End of replay")
+            # read-only view into the mapping
+            frame = self._raw[self._index % len(self._raw)]
+        else:
+            ok, frame = self._cap.read()
+            if not ok and self.loop:
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, frame = self._cap.read()
+            if not ok:
+                raise EOFError("End of replay")
+        self._index += 1
+        return frame[
+            bbox.top : bbox.top + bbox.height, bbox.left : bbox.left + bbox.width
+        ]
+
+
+# ----------------------- VIDEO WRITERS -----------------------
+ENCODER_AUTO = "auto"
+ENCODER_X264 = "ffmpeg-x264"
+ENCODER_MP4V = "opencv-mp4v"
+X264_PRESETS = (
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+)
+
+_ffmpeg_cache: dict = {}
+
+
+def ffmpeg_encoders() -> Tuple[Optional[str], frozenset]:
+    """(path of ffmpeg or None, names of its video encoders), probed once per run."""
+    if "path" not in _ffmpeg_cache:
+        path, names = shutil.which("ffmpeg"), frozenset()
+        if path is not None:
+            try:
+                out = subprocess.check_output(
+                    [path, "-hide_banner", "-encoders"],
+                    stderr=subprocess.DEVNULL,
+                    text=True,
+                    timeout=10,
+                )
+                names = frozenset(re.findall(r"^ V\S{5} ([^=\s]\S*)", out, re.M))
+            except Exception:
+                path = None
+        _ffmpeg_cache.update(path=path, encoders=names)
+    return _ffmpeg_cache["path"], _ffmpeg_cache["encoders"]
+
+
+def find_ffmpeg_x264() -> Optional[str]:
+    """Path of an ffmpeg binary with libx264, or None."""
+    path, encoders = ffmpeg_encoders()
+    return path if "libx264" in encoders else None
+
+
+class FfmpegPipeWriter:
+    """
+    cv2.VideoWriter-compatible writer that streams raw frames into a local ffmpeg
+    (libx264, yuv420p unless `codec_args` selects another encoder). Frames are
+    converted BGR -> I420 here into a reused buffer, which halves the bytes piped
+    per frame and spares ffmpeg its own conversion. ffmpeg's stderr goes to a
+    temporary file: nothing reads it while recording, and a full pipe would block
+    ffmpeg and with it write().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fps: float,
+        size: Tuple[int, int],
+        preset: str = "veryfast",
+        crf: int = 23,
+        ffmpeg: Optional[str] = None,
+        gop: Optional[int] = None,
+        threads: Optional[int] = None,
+        x264_params: Optional[str] = None,
+        codec_args: Optional[list] = None,
+    ) -> None:
+        w, h = int(size[0]), int(size[1])
+        self.path = path
+        self._i420 = np.empty((h * 3 // 2, w), dtype=np.uint8)
+        cmd = [ffmpeg or "ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+        cmd += ["-f", "rawvideo", "-pix_fmt", "yuv420p", "-s", f"{w}x{h}"]
+        cmd += ["-r", f"{fps:g}", "-i", "-", "-an"]
+        if codec_args is None:
+            codec_args = [
+                "-c:v",
+                "libx264",
+                "-preset",
+                preset,
+                "-crf",
+                str(int(crf)),
+                "-pix_fmt",
+                "yuv420p",
+            ]
+        cmd += codec_args
+        if gop is not None:
+            cmd += ["-g", str(int(gop))]
+        if threads is not None:
+            cmd += ["-threads", str(int(threads))]
+        if x264_params:
+            cmd += ["-x264-params", x264_params]
+        if os.path.splitext(path)[1].lower() in (".mp4", ".mov"):
+            cmd += ["-movflags", "+faststart"]
+        cmd.append(path)
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self._proc: Optional[subprocess.Popen] = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=self._stderr,
+            )
+        except OSError:
+            self._proc = None
+            self._stderr.close()
+
+    def isOpened(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def write(self, frame_bgr: np.ndarray) -> None:
+        if self._proc is None:
+            return
+        cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2YUV_I420, dst=self._i420)
+        self.write_i420(self._i420)
+
+    def write_i420(self, frame_i420: np.ndarray) -> None:
+        """Write a frame that is already planar I420 ((h * 3 / 2) x w)."""
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.write(frame_i420.data)
+        except (BrokenPipeError, OSError):
+            raise RuntimeError(f"ffmpeg exited: {self._stderr_tail()}")
+
+    def release(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=30.0)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        self._stderr.close()
+
+    def _stderr_tail(self) -> str:
+        """The end of what ffmpeg logged, once it has exited."""
+        try:
+            self._proc.wait(timeout=2.0)
+        except subprocess.TimeoutExpired:
+            return "unknown error (ffmpeg is not responding)"
+        try:
+            self._stderr.seek(0)
+            text = self._stderr.read().decode(errors="replace").strip()
+        except (OSError, ValueError):
+            text = ""
+        return text[-1000:] or "unknown error"
+
+
+class TimecodeWriter:
+    """Writes a Matroska "timecode format v2" sidecar: one timestamp (ms) per frame.
+    Lines are flushed as they are written, so a crash keeps the timestamps so far.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._fh = open(path, "w", encoding="ascii")
+        self._fh.write("# timecode format v2\n")
+        self._t0: Optional[float] = None
+        self.last: Optional[float] = None
+        self.count = 0
+
+    def add(self, t_seconds: float) -> None:
+        if self._t0 is None:
+            self._t0 = t_seconds
+        ms = (t_seconds - self._t0) * 1000.0
+        if self.last is not None and ms <= self.last:
+            ms = self.last + 0.001  # timestamps must be strictly increasing
+        self._fh.write(f"{ms:.3f}\n")
+        self._fh.flush()
+        self.last = ms
+        self.count += 1
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+def mux_timecodes_mkv(video_path: str, timecodes_path: str) -> Optional[str]:
+    """Remux `video_path` into a .mkv carrying the real frame timestamps, using
+    mkvmerge when it is on PATH. Returns the .mkv path, or None if not possible.
+    """
+    mkvmerge = shutil.which("mkvmerge")
+    if mkvmerge is None:
+        return None
+    out = os.path.splitext(video_path)[0] + ".mkv"
+    try:
+        subprocess.run(
+            [
+                mkvmerge,
+                "-q",
+                "-o",
+                out,
+                "--timestamps",
+                f"0:{timecodes_path}",
+                video_path,
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=600,
+        )
+    except Exception:
+        return None
+    return out
+
+
+def _encode_chunk(
+    shm_name: str,
+    count: int,
+    size: Tuple[int, int],
+    path: str,
+    fps: float,
+    encoder: str,
+    preset: str,
+    crf: int,
+    threads: int,
+) -> str:
+    """Process-pool worker: encode `count` I420 frames from shared memory to `path`."""
+    w, h = size
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        _encode_i420_frames(
+            np.ndarray((count, h * 3 // 2, w), dtype=np.uint8, buffer=shm.buf),
+            size,
+            path,
+            fps,
+            encoder,
+            preset,
+            crf,
+            threads,
+        )
+    finally:
+        shm.close()
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        raise RuntimeError(f"Encoding chunk {os.path.basename(path)} failed")
+    return path
+
+
+def _encode_i420_frames(
+    frames: np.ndarray,
+    size: Tuple[int, int],
+    path: str,
+    fps: float,
+    encoder: str,
+    preset: str,
+    crf: int,
+    threads: int,
+) -> None:
+    ffmpeg = find_ffmpeg_x264() if encoder != ENCODER_MP4V else None
+    if ffmpeg is not None:
+        # One chunk = one GOP, so every chunk starts on a keyframe and joins cleanly
+        writer = FfmpegPipeWriter(
+            path,
+            fps,
+            size,
+            preset=preset,
+            crf=crf,
+            ffmpeg=ffmpeg,
+            gop=len(frames),
+            threads=threads,
+        )
+        for frame in frames:
+            writer.write_i420(frame)
+    else:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+        bgr = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        for frame in frames:
+            cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420, dst=bgr)
+            writer.write(bgr)
+    writer.release()
+
+
+class ParallelSegmentWriter:
+    """
+    cv2.VideoWriter-compatible writer that cuts the stream into fixed-length chunks
+    (one GOP each) and encodes them concurrently in a process pool, so encode
+    throughput scales with cores. Frames are converted to I420 straight into shared
+    memory blocks; only the block name crosses the process boundary. At most
+    workers + 1 blocks exist; when all are busy write() waits for the oldest chunk.
+    release() joins the chunks losslessly with ffmpeg's concat demuxer (-c copy).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fps: float,
+        size: Tuple[int, int],
+        workers: int,
+        encoder: str = ENCODER_AUTO,
+        preset: str = "veryfast",
+        crf: int = 23,
+        chunk_seconds: float = 2.0,
+        ffmpeg: Optional[str] = None,
+    ) -> None:
+        w, h = int(size[0]), int(size[1])
+        self.path = path
+        self.fps = float(fps)
+        self.size = (w, h)
+        self.encoder = (
+            ENCODER_X264
+            if encoder != ENCODER_MP4V and find_ffmpeg_x264()
+            else ENCODER_MP4V
+        )
+        self._preset = preset
+        self._crf = crf
+        self._ffmpeg = ffmpeg or "ffmpeg"
+        self.chunk_frames = max(1, int(round(self.fps * chunk_seconds)))
+        self._frame_shape = (h * 3 // 2, w)
+        self._chunk_bytes = self.chunk_frames * self._frame_shape[0] * w
+        # x264 threads per chunk
+        self._threads = max(1, (os.cpu_count() or 1) // workers)
+        self._max_blocks = workers + 1
+        self._blocks: list = []
+        self._free: list = []
+        self._pending = deque()  # (future, block) in submission order
+        self._chunks: list = []
+        self._block: Optional[shared_memory.SharedMemory] = None
+        self._frames: Optional[np.ndarray] = None
+        self._count = 0
+        self._dir = tempfile.mkdtemp(
+            prefix=".chunks_", dir=os.path.dirname(os.path.abspath(path))
+        )
+        # spawn: never fork a process that runs Tk and capture threads
+        self._executor: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def isOpened(self) -> bool:
+        return self._executor is not None
+
+    def write(self, frame_bgr: np.ndarray) -> None:
+        if self._executor is None:
+            return
+        if self._frames is None:
+            self._block = self._acquire_block()
+            self._frames = np.ndarray(
+                (self.chunk_frames,) + self._frame_shape,
+                dtype=np.uint8,
+                buffer=self._block.buf,
+            )
+        cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2YUV_I420, dst=self._frames[self._count])
+        self._count += 1
+        if self._count == self.chunk_frames:
+            self._submit()
+
+    def _acquire_block(self) -> shared_memory.SharedMemory:
+        self._reap(wait=False)
+        if not self._free and len(self._blocks) >= self._max_blocks:
+            self._reap(wait=True)
+        if self._free:
+            return self._free.pop()
+        block = shared_memory.SharedMemory(create=True, size=self._chunk_bytes)
+        self._blocks.append(block)
+        return block
+
+    def _submit(self) -> None:
+        path = os.path.join(self._dir, f"chunk_{len(self._chunks):05d}.mp4")
+        self._frames = None  # drop the view before the block is handed out again
+        future = self._executor.submit(
+            _encode_chunk,
+            self._block.name,
+            self._count,
+            self.size,
+            path,
+            self.fps,
+            self.encoder,
+            self._preset,
+            self._crf,
+            self._threads,
+        )
+        self._pending.append((future, self._block))
+        self._chunks.append(path)
+        self._block = None
+        self._count = 0
+
+    def _reap(self, wait: bool) -> None:
+        # Recycle blocks of finished chunks (oldest first); wait=True blocks for one
+        while self._pending and (wait or self._pending[0][0].done()):
+            future, block = self._pending.popleft()
+            self._free.append(block)
+            wait = False
+            future.result()  # re-raises a worker failure in the encode thread
+
+    def release(self) -> None:
+        if self._executor is None:
+            return
+        try:
+            if self._count:
+                self._submit()
+            while self._pending:
+                self._reap(wait=True)
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._frames = None
+            for block in self._blocks:
+                block.close()
+                block.unlink()
+            self._blocks, self._free = [], []
+        join_videos(self._chunks, self.path, self._dir, self._ffmpeg)
+
+
+def join_videos(parts: list, path: str, work_dir: str, ffmpeg: str = "ffmpeg") -> None:
+    """Join same-format video files into `path` losslessly (concat demuxer, -c copy)
+    and remove `work_dir`. On failure the parts are kept there and RuntimeError is
+    raised.
+    """
+    if not parts:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return
+    list_path = os.path.join(work_dir, "parts.txt")
+    with open(list_path, "w", encoding="utf-8") as fh:
+        for part in parts:
+            fh.write("file '{}'\n".format(part.replace("'", "'\\''")))
+    cmd = [ffmpeg, "-hide_banner", "-loglevel", "error", "-y"]
+    cmd += ["-f", "concat", "-safe", "0", "-i", list_path]
+    cmd += ["-c", "copy", "-movflags", "+faststart", path]
+    try:
+        subprocess.run(
+            cmd,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=600,
+        )
+    except Exception as e:
+        # Keep the parts so nothing recorded is lost
+        raise RuntimeError(
+            f"Joining parts failed ({e}); encoded parts kept in {work_dir}"
+        )
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class PresetSwitchWriter:
+    """
+    x264 writer whose preset can change while recording. A running x264 cannot
+    switch presets, so set_preset() makes the next write() start a new part with
+    the new preset (the old part is flushed in the background); release() joins
+    the parts losslessly into `path`. The joined file keeps only the first part's
+    SPS/PPS, so every part pins the coding tools those headers describe
+    (SWITCH_PARAMS) and presets differ only in search effort.
+    """
+
+    # Reference frames, B-frames, entropy coder, 8x8 transform and weighted
+    # prediction are all signalled in the SPS/PPS
+    SWITCH_PARAMS = (
+        "ref=2:bframes=3:b-pyramid=normal:cabac=1:8x8dct=1:weightp=1:weightb=1"
+    )
+
+    def __init__(
+        self,
+        path: str,
+        fps: float,
+        size: Tuple[int, int],
+        preset: str = "veryfast",
+        crf: int = 23,
+        ffmpeg: str = "ffmpeg",
+    ) -> None:
+        self.path = path
+        self.fps = float(fps)
+        self.size = size
+        self.crf = crf
+        self.preset = preset
+        self._ffmpeg = ffmpeg
+        self._pending_preset: Optional[str] = None
+        self._parts: list = []
+        self._closing: list = []
+        self._dir = tempfile.mkdtemp(
+            prefix=".parts_", dir=os.path.dirname(os.path.abspath(path))
+        )
+        self._writer: Optional[FfmpegPipeWriter] = self._open_part(preset)
+
+    def _open_part(self, preset: str) -> FfmpegPipeWriter:
+        part = os.path.join(self._dir, f"part_{len(self._parts):03d}.mp4")
+        self._parts.append(part)
+        return FfmpegPipeWriter(
+            part,
+            self.fps,
+            self.size,
+            preset=preset,
+            crf=self.crf,
+            ffmpeg=self._ffmpeg,
+            x264_params=self.switch_params(preset),
+        )
+
+    @classmethod
+    def switch_params(cls, preset: str) -> str:
+        """x264 options that give `preset` the same SPS/PPS as every other preset."""
+        # x264 lowers the chroma QP offset (a PPS field) by 2 when psy-rd is active,
+        # which it is from "fast" (subme 6) up; match that on the faster presets
+        if X264_PRESETS.index(preset) < X264_PRESETS.index("fast"):
+            return cls.SWITCH_PARAMS + ":chroma-qp-offset=-2"
+        return cls.SWITCH_PARAMS
+
+    def isOpened(self) -> bool:
+        return self._writer is not None and self._writer.isOpened()
+
+    def set_preset(self, preset: str) -> None:
+        """Use `preset` from the next frame on (may be called from any thread)."""
+        self._pending_preset = preset
+
+    def write(self, frame_bgr: np.ndarray) -> None:
+        if self._writer is None:
+            return
+        preset, self._pending_preset = self._pending_preset, None
+        if preset is not None and preset != self.preset:
+            old = self._writer
+            self._writer = self._open_part(preset)
+            self.preset = preset
+            t = threading.Thread(
+                target=old.release, name="ScreenRecorderPartClose", daemon=True
+            )
+            t.start()
+            self._closing.append(t)
+        self._writer.write(frame_bgr)
+
+    def release(self) -> None:
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        writer.release()
+        for t in self._closing:
+            t.join()
+        if len(self._parts) == 1:
+            os.replace(self._parts[0], self.path)
+            shutil.rmtree(self._dir, ignore_errors=True)
+            return
+        join_videos(self._parts, self.path, self._dir, self._ffmpeg)
+
+
+def segment_path(
+    template: str, index: int, when: Optional[datetime.datetime] = None
+) -> str:
+    """Expand strftime codes and a '{seq}' / '{seq:03d}' placeholder in a segment path
+    template. Without a placeholder '_NNN' is appended before the extension.
+    """
+    path = (when or datetime.datetime.now()).strftime(template)
+    path, found = re.subn(
+        r"\{seq(?::([^}]*))?\}", lambda m: format(index, m.group(1) or "03d"), path
+    )
+    if found:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}_{index:03d}{ext}"
+
+
+class SegmentedWriter:
+    """
+    cv2.VideoWriter-compatible writer that rotates to a new file every `max_seconds`
+    of video and/or `max_bytes` on disk, so long sessions yield closed, playable
+    files and a crash loses at most the open segment.
+    Rotation never stalls the encode thread: the next segment's writer is opened on
+    a background thread shortly before it is due, and finished segments are
+    released (moov atom / ffmpeg flush) in the background.
+    """
+
+    _SIZE_CHECK_EVERY = 15  # frames between on-disk size checks
+
+    def __init__(
+        self,
+        template: str,
+        fps: float,
+        open_writer: Callable[[str], object],
+        max_seconds: float = 0.0,
+        max_bytes: int = 0,
+    ) -> None:
+        self.template = template
+        self.fps = float(fps)
+        self._open_writer = open_writer  # path -> writer or None
+        self._max_frames = int(round(max_seconds * self.fps)) if max_seconds > 0 else 0
+        self._max_bytes = int(max_bytes)
+        # Open the next segment this many frames before it is due (~2 s)
+        self._lead_frames = max(1, int(round(2 * self.fps)))
+        if self._max_frames:
+            self._lead_frames = min(self._lead_frames, max(1, self._max_frames // 2))
+        self.paths: list = []
+        self._index = 0
+        self._frames = 0
+        self._size = 0
+        # {"thread", "path", "writer"} of the pre-opened segment
+        self._next: Optional[dict] = None
+        self._closers: list = []
+        self._errors: list = []
+        path = segment_path(template, 0)
+        self._writer = open_writer(path)
+        if self._writer is not None:
+            self.paths.append(path)
+
+    def isOpened(self) -> bool:
+        return self._writer is not None
+
+    def write(self, frame_bgr: np.ndarray) -> None:
+        if self._writer is None:
+            return
+        if self._frames and self._due():
+            self._rotate()
+        self._writer.write(frame_bgr)
+        self._frames += 1
+        if self._max_bytes and self._frames % self._SIZE_CHECK_EVERY == 0:
+            try:
+                self._size = os.path.getsize(self.paths[-1])
+            except OSError:
+                pass
+        if self._next is None and self._almost_due():
+            self._prepare_next()
+
+    def _due(self) -> bool:
+        return bool(
+            (self._max_frames and self._frames >= self._max_frames)
+            or (self._max_bytes and self._size >= self._max_bytes)
+        )
+
+    def _almost_due(self) -> bool:
+        return bool(
+            (self._max_frames and self._frames >= self._max_frames - self._lead_frames)
+            or (self._max_bytes and self._size >= self._max_bytes * 0.9)
+        )
+
+    def _prepare_next(self) -> None:
+        # Name the segment after its expected start time, not the time it is opened
+        when = datetime.datetime.now()
+        if self._max_frames:
+            when += datetime.timedelta(
+                seconds=max(0, self._max_frames - self._frames) / self.fps
+            )
+        slot = {
+            "path": segment_path(self.template, self._index + 1, when),
+            "writer": None,
+        }
+
+        def _open() -> None:
+            try:
+                slot["writer"] = self._open_writer(slot["path"])
+            except Exception as e:
+                self._errors.append(e)
+
+        slot["thread"] = threading.Thread(
+            target=_open, name="ScreenRecorderSegmentOpen", daemon=True
+        )
+        slot["thread"].start()
+        self._next = slot
+
+    def _rotate(self) -> None:
+        if self._next is None:
+            self._prepare_next()
+        slot, self._next = self._next, None
+        slot["thread"].join()
+        if slot["writer"] is None:
+            raise RuntimeError(f"Failed to open segment {slot['path']}")
+        self._close_in_background(self._writer)
+        self._writer = slot["writer"]
+        self.paths.append(slot["path"])
+        self._index += 1
+        self._frames = 0
+        self._size = 0
+
+    def _close_in_background(self, writer) -> None:
+        def _close() -> None:
+            try:
+                writer.release()
+            except Exception as e:
+                self._errors.append(e)
+
+        t = threading.Thread(
+            target=_close, name="ScreenRecorderSegmentClose", daemon=True
+        )
+        t.start()
+        self._closers.append(t)
+
+    def release(self) -> None:
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.release()
+        for t in self._closers:
+            t.join()
+        self._closers = []
+        # A pre-opened segment that never got a frame is discarded
+        slot, self._next = self._next, None
+        if slot is not None:
+            slot["thread"].join()
+            if slot["writer"] is not None:
+                slot["writer"].release()
+            try:
+                os.remove(slot["path"])
+            except OSError:
+                pass
+        if self._errors:
+            raise RuntimeError(f"Segment writer failed: {self._errors[0]}")
+
+
+class ReplayRing:
+    """
+    Instant-replay buffer: the most recent distinct frames as JPEG, bounded by both
+    `seconds` of media time and `max_bytes`. Oldest frames are evicted first; the
+    newest frame older than the window is kept so a replay never starts blank.
+    The encoder thread adds frames; snapshot() may be called from any thread.
+    """
+
+    def __init__(self, seconds: float, max_bytes: int, quality: int = 80) -> None:
+        self.seconds = float(seconds)
+        self.max_bytes = int(max_bytes)
+        self._params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        self._frames = deque()  # (t_media, jpeg ndarray)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def add(self, t_media: float, frame_bgr: np.ndarray) -> None:
+        ok, jpeg = cv2.imencode(".jpg", frame_bgr, self._params)
+        if not ok:
+            return
+        with self._lock:
+            self._frames.append((t_media, jpeg))
+            self._bytes += jpeg.nbytes
+            horizon = t_media - self.seconds
+            while len(self._frames) > 1 and (
+                self._bytes > self.max_bytes or self._frames[1][0] <= horizon
+            ):
+                _, old = self._frames.popleft()
+                self._bytes -= old.nbytes
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return list(self._frames)
+
+
+def write_replay(
+    frames: list,
+    path: str,
+    fps: float,
+    size: Tuple[int, int],
+    t_end: float,
+    seconds: float,
+    encoder: str = ENCODER_AUTO,
+    preset: str = "veryfast",
+    crf: int = 23,
+) -> str:
+    """Encode a ReplayRing snapshot as a CFR video covering (t_end - seconds, t_end]."""
+    t_start = max(frames[0][0], t_end - seconds)
+    slots = max(1, int(round((t_end - t_start) * fps)))
+    writer, name = open_video_writer(
+        path, fps, size, encoder=encoder, preset=preset, crf=crf
+    )
+    if writer is None:
+        raise RuntimeError(f"Failed to create video writer ({name}) for {path}")
+    try:
+        index, decoded, frame = 0, -1, None
+        for k in range(slots):
+            t = t_start + k / fps
+            while index + 1 < len(frames) and frames[index + 1][0] <= t:
+                index += 1
+            if index != decoded:
+                frame = cv2.imdecode(frames[index][1], cv2.IMREAD_COLOR)
+                decoded = index
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+def open_video_writer(
+    path: str,
+    fps: float,
+    size: Tuple[int, int],
+    encoder: str = ENCODER_AUTO,
+    preset: str = "veryfast",
+    crf: int = 23,
+    workers: int = 0,
+    chunk_seconds: float = 2.0,
+    switchable_preset: bool = False,
+):
+    """Open a writer for `path`. Returns (writer, encoder_name); writer is None on
+    failure.
+    'auto' uses ffmpeg/x264 when available and falls back to OpenCV's mp4v; other
+    names are looked up in ENCODER_REGISTRY (see rank_encoders for benchmarked choice).
+    workers > 1 encodes x264/mp4v chunks in parallel processes (needs ffmpeg to join
+    them; without it a single writer is returned, which callers should report).
+    switchable_preset returns a PresetSwitchWriter for plain x264 output.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    backend = ENCODER_REGISTRY.get(encoder)
+    if encoder not in (ENCODER_AUTO, ENCODER_X264, ENCODER_MP4V):
+        if backend is None:
+            return None, encoder
+        return backend.open(path, fps, size, preset=preset, crf=crf), encoder
+    if (
+        workers > 1
+        and ffmpeg is not None
+        and not (encoder == ENCODER_X264 and find_ffmpeg_x264() is None)
+    ):
+        writer = ParallelSegmentWriter(
+            path,
+            fps,
+            size,
+            workers,
+            encoder=encoder,
+            preset=preset,
+            crf=crf,
+            chunk_seconds=chunk_seconds,
+            ffmpeg=ffmpeg,
+        )
+        return writer, f"{writer.encoder} x{workers}"
+    if encoder in (ENCODER_AUTO, ENCODER_X264):
+        ffmpeg = find_ffmpeg_x264()
+        if ffmpeg is not None:
+            if switchable_preset:
+                writer = PresetSwitchWriter(
+                    path, fps, size, preset=preset, crf=crf, ffmpeg=ffmpeg
+                )
+            else:
+                writer = FfmpegPipeWriter(
+                    path, fps, size, preset=preset, crf=crf, ffmpeg=ffmpeg
+                )
+            if writer.isOpened():
+                return writer, ENCODER_X264
+        if encoder == ENCODER_X264:
+            return None, ENCODER_X264
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")  # widely supported
+    writer = cv2.VideoWriter(path, fourcc, fps, (int(size[0]), int(size[1])))
+    if not writer or not writer.isOpened():
+        return None, ENCODER_MP4V
+    return writer, ENCODER_MP4V
+
+
+# ----------------------- FRAME INDEX -----------------------
+INDEX_MAGIC = b"SRINDEX1"
+INDEX_FRAME, INDEX_PAUSE, INDEX_RESUME = 0, 1, 2  # record kinds
+INDEX_KEYFRAME = 1  # record flag
+# kind, flags, frame number, presentation time (s), monotonic capture time (s),
+# byte offset in the file
+INDEX_RECORD = struct.Struct("<BBxxIddQ")
+# The same layout as a NumPy dtype description (np.dtype(INDEX_FIELDS))
+INDEX_FIELDS = [
+    ("kind", "u1"),
+    ("flags", "u1"),
+    ("pad", "V2"),
+    ("frame", "<u4"),
+    ("pts", "<f8"),
+    ("t_capture", "<f8"),
+    ("offset", "<u8"),
+]
+
+
+def index_path_for(video_path: str) -> str:
+    """Seek index written next to `video_path`."""
+    return video_path + ".idx"
+
+
+class IndexClock:
+    """
+    Shared by the engine and the IndexedWriters of one recording: the engine stamps
+    the capture/media time of the frame about to be written and queues pause/resume
+    marks; whichever writer is active records them.
+    """
+
+    def __init__(self) -> None:
+        self.wall_offset = time.time() - time.monotonic()  # monotonic -> wall clock
+        self.t_capture = 0.0
+        self.t_media = 0.0
+        self.marks = deque()  # (kind, monotonic time)
+
+    def stamp(self, t_capture: float, t_media: float) -> None:
+        self.t_capture, self.t_media = t_capture, t_media
+
+    def mark(self, kind: int, t: float) -> None:
+        self.marks.append((kind, t))
+
+
+class IndexedWriter:
+    """
+    cv2.VideoWriter-compatible wrapper that appends one INDEX_RECORD per written
+    frame to a sidecar (see FrameIndex), so a crash keeps the time mapping so far.
+    Keyframe flags and byte offsets are only known once the container is closed;
+    release() fills them in from the MP4 sample tables (or flags every frame for
+    intra-only codecs). Other attributes are those of the wrapped writer.
+    """
+
+    _FLUSH_EVERY = 64  # records
+
+    def __init__(
+        self,
+        writer,
+        video_path: str,
+        fps: float,
+        clock: IndexClock,
+        vfr: bool = False,
+        all_keyframes: bool = False,
+    ) -> None:
+        self.inner = writer
+        self.video_path = video_path
+        self.path = index_path_for(video_path)
+        self.fps = float(fps)
+        self.clock = clock
+        self.vfr = vfr
+        self.all_keyframes = all_keyframes
+        self.count = 0
+        self._t_media0: Optional[float] = None
+        self._header = {
+            "version": 1,
+            "video": os.path.basename(video_path),
+            "fps": self.fps,
+            "wall_offset": clock.wall_offset,
+            "vfr": vfr,
+            "keyframes": False,
+            "offsets": False,
+        }
+        self._fh = open(self.path, "wb")
+        _write_index_header(self._fh, self._header)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def isOpened(self) -> bool:
+        return self.inner.isOpened()
+
+    def write(self, frame_bgr: np.ndarray) -> None:
+        self.inner.write(frame_bgr)
+        clock = self.clock
+        if self.vfr:
+            if self._t_media0 is None:
+                self._t_media0 = clock.t_media
+            pts = clock.t_media - self._t_media0
+        else:
+            pts = self.count / self.fps
+        # Pauses that ended before this frame was captured sit right in front of it
+        while clock.marks and clock.marks[0][1] <= clock.t_capture:
+            kind, t = clock.marks.popleft()
+            self._fh.write(INDEX_RECORD.pack(kind, 0, self.count, pts, t, 0))
+        flags = INDEX_KEYFRAME if self.all_keyframes else 0
+        self._fh.write(
+            INDEX_RECORD.pack(INDEX_FRAME, flags, self.count, pts, clock.t_capture, 0)
+        )
+        self.count += 1
+        if self.count % self._FLUSH_EVERY == 0:
+            self._fh.flush()
+
+    def release(self) -> None:
+        try:
+            self.inner.release()
+        finally:
+            clock = self.clock
+            while clock.marks:
+                kind, t = clock.marks.popleft()
+                self._fh.write(
+                    INDEX_RECORD.pack(kind, 0, self.count, self.count / self.fps, t, 0)
+                )
+            self._fh.close()
+        if self.count == 0:
+            # e.g. a pre-opened segment that was never used
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            return
+        try:
+            finalize_frame_index(
+                self.path,
+                self.video_path,
+                all_keyframes=self.all_keyframes,
+                container_pts=not self.vfr,
+            )
+        except Exception:
+            pass  # the unfinalized index still maps frames to times
+
+
+def _write_index_header(fh, header: dict) -> None:
+    blob = json.dumps(header).encode("utf-8")
+    fh.write(INDEX_MAGIC + struct.pack("<I", len(blob)) + blob)
+
+
+def read_frame_index(path: str) -> Tuple[dict, np.ndarray]:
+    """(header, INDEX_FIELDS array of records); a truncated last record is ignored."""
+    with open(path, "rb") as fh:
+        data = fh.read()
+    if data[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+        raise ValueError(f"{path} is not a frame index")
+    start = len(INDEX_MAGIC) + 4
+    (size,) = struct.unpack_from("<I", data, len(INDEX_MAGIC))
+    header = json.loads(data[start : start + size].decode("utf-8"))
+    body = data[start + size :]
+    count = len(body) // INDEX_RECORD.size
+    return header, np.frombuffer(body, dtype=INDEX_FIELDS, count=count).copy()
+
+
+def write_frame_index(path: str, header: dict, records: np.ndarray) -> None:
+    """Replace the index at `path` atomically."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        _write_index_header(fh, header)
+        fh.write(np.ascontiguousarray(records, dtype=INDEX_FIELDS).tobytes())
+    os.replace(tmp, path)
+
+
+def finalize_frame_index(
+    index_path: str,
+    video_path: str,
+    all_keyframes: bool = False,
+    container_pts: bool = True,
+) -> bool:
+    """
+    Fill in keyframe flags and byte offsets of a closed video. MP4/MOV sample tables
+    give both (and the exact timestamps, unless `container_pts` is False); for
+    other containers only intra-only codecs get keyframes. Returns True if
+    keyframes are known afterwards.
+    """
+    header, records = read_frame_index(index_path)
+    frames = np.flatnonzero(records["kind"] == INDEX_FRAME)
+    table = (
+        mp4_sample_table(video_path)
+        if os.path.splitext(video_path)[1].lower() in (".mp4", ".mov")
+        else None
+    )
+    if table is not None:
+        n = min(len(frames), len(table["pts"]))
+        rows = frames[:n]
+        records["flags"][frames] = 0
+        records["flags"][rows] = np.where(table["keyframe"][:n], INDEX_KEYFRAME, 0)
+        records["offset"][rows] = table["offset"][:n]
+        if container_pts:
+            records["pts"][rows] = table["pts"][:n]
+        header.update(keyframes=True, offsets=True)
+    elif all_keyframes:
+        records["flags"][frames] = INDEX_KEYFRAME
+        header.update(keyframes=True)
+    write_frame_index(index_path, header, records)
+    return bool(header["keyframes"])
+
+
+def _mp4_boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """Yield (type, payload start, payload end) of the ISO-BMFF boxes in
+    data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        head = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", data, pos + 8)
+            head = 16
+        elif size == 0:
+            size = end - pos
+        if size < head:
+            return
+        yield kind.decode("latin-1"), pos + head, min(pos + size, end)
+        pos += size
+
+
+def mp4_sample_table(path: str) -> Optional[dict]:
+    """
+    Keyframe flags, byte offsets and presentation times (s) of the first video
+    track of an MP4/MOV, in presentation order: {"keyframe", "offset", "pts"} as
+    arrays. None if the file has no readable video track.
+    """
+    moov = None
+    with open(path, "rb") as fh:
+        # Walk the top-level boxes; only the moov box is read into memory
+        while True:
+            head = fh.read(16)
+            if len(head) < 8:
+                break
+            size, kind = struct.unpack_from(">I4s", head)
+            skip = 8
+            if size == 1 and len(head) == 16:
+                (size,) = struct.unpack_from(">Q", head, 8)
+                skip = 16
+            if kind == b"moov" and size > skip:
+                fh.seek(skip - len(head), os.SEEK_CUR)
+                moov = fh.read(size - skip)
+                break
+            if size < skip:
+                break  # size 0 (to end of file) or corrupt
+            fh.seek(size - len(head), os.SEEK_CUR)
+    if moov is None:
+        return None
+    for kind, a, b in _mp4_boxes(moov):
+        if kind != "trak":
+            continue
+        boxes = {}
+
+        def collect(start: int, end: int) -> None:
+            for k, s, e in _mp4_boxes(moov, start, end):
+                if k in ("mdia", "minf", "stbl"):
+                    collect(s, e)
+                else:
+                    boxes.setdefault(k, (s, e))
+
+        collect(a, b)
+        hdlr = boxes.get("hdlr")
+        if hdlr is None or moov[hdlr[0] + 8 : hdlr[0] + 12] != b"vide":
+            continue
+        return _sample_table(moov, boxes)
+    return None
+
+
+def _sample_table(moov: bytes, boxes: dict) -> Optional[dict]:
+    def table(
+        name: str, fields: int, skip: int = 0, dtype: str = ">u4"
+    ) -> Optional[np.ndarray]:
+        if name not in boxes:
+            return None
+        s, _ = boxes[name]
+        (count,) = struct.unpack_from(">I", moov, s + 4 + skip)
+        return np.frombuffer(
+            moov, dtype=dtype, count=count * fields, offset=s + 8 + skip
+        ).reshape(count, fields)
+
+    s, _ = boxes["mdhd"]
+    version = moov[s]
+    timescale = struct.unpack_from(">I", moov, s + (20 if version == 1 else 12))[0]
+    s, _ = boxes["stsz"]
+    uniform, count = struct.unpack_from(">II", moov, s + 4)
+    if uniform:
+        sizes = np.full(count, uniform, dtype=np.int64)
+    else:
+        sizes = np.frombuffer(moov, dtype=">u4", count=count, offset=s + 12)
+        sizes = sizes.astype(np.int64)
+    if count == 0 or not timescale:
+        return None
+    stts = table("stts", 2).astype(np.int64)
+    dts = np.concatenate(([0], np.cumsum(np.repeat(stts[:, 1], stts[:, 0]))))[:count]
+    ctts = table("ctts", 2)
+    if ctts is not None:
+        signed = moov[boxes["ctts"][0]] == 1
+        shift = np.repeat(
+            ctts[:, 1].astype(np.int32 if signed else np.int64),
+            ctts[:, 0].astype(np.int64),
+        )
+        dts = dts + shift[:count].astype(np.int64)
+    stss = table("stss", 1)
+    keyframe = np.ones(count, dtype=bool)
+    if stss is not None:
+        keyframe[:] = False
+        keyframe[stss[:, 0].astype(np.int64) - 1] = True
+    chunks = table("stco", 1)
+    if chunks is None:
+        chunks = table("co64", 1, dtype=">u8")
+    chunks = chunks[:, 0].astype(np.int64)
+    stsc = table("stsc", 3).astype(np.int64)
+    per_chunk = np.zeros(len(chunks), dtype=np.int64)
+    for i, (first, samples, _desc) in enumerate(stsc):
+        last = stsc[i + 1][0] - 1 if i + 1 < len(stsc) else len(chunks)
+        per_chunk[first - 1 : last] = samples
+    chunk_of = np.repeat(np.arange(len(chunks)), per_chunk)[:count]
+    before = np.cumsum(sizes) - sizes  # bytes of all earlier samples
+    chunk_first = (np.cumsum(per_chunk) - per_chunk)[chunk_of]
+    offset = chunks[chunk_of] + before - before[chunk_first]
+    order = np.argsort(dts, kind="stable")  # decode order -> presentation order
+    pts = (dts[order] - dts[order][0]) / float(timescale)
+    return {
+        "keyframe": keyframe[order],
+        "offset": offset[order].astype(np.uint64),
+        "pts": pts,
+    }
+
+
+@dataclass
+class SeekPoint:
+    frame: int
+    pts: float  # seconds into the file
+    wall: float  # epoch seconds the frame was captured
+    keyframe: Optional[int]  # nearest keyframe at or before `frame` (None if unknown)
+    keyframe_pts: Optional[float]
+    offset: Optional[int]  # byte offset of that keyframe (None if unknown)
+
+
+class FrameIndex:
+    """
+    Reader for the seek index of one recording: binary search from file time or
+    wall-clock time to frames and the keyframe to start decoding (or cutting) at.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.header, records = read_frame_index(path)
+        frames = records[records["kind"] == INDEX_FRAME]
+        self.marks = records[records["kind"] != INDEX_FRAME]
+        self.pts = frames["pts"]
+        self.t_capture = frames["t_capture"]
+        self.offsets = frames["offset"]
+        self.wall_offset = float(self.header.get("wall_offset", 0.0))
+        self.has_keyframes = bool(self.header.get("keyframes"))
+        self.has_offsets = bool(self.header.get("offsets"))
+        self.keyframes = np.flatnonzero(frames["flags"] & INDEX_KEYFRAME)
+
+    @classmethod
+    def for_video(cls, video_path: str) -> "FrameIndex":
+        return cls(index_path_for(video_path))
+
+    def __len__(self) -> int:
+        return len(self.pts)
+
+    @property
+    def duration(self) -> float:
+        return float(self.pts[-1] + 1.0 / self.header["fps"]) if len(self.pts) else 0.0
+
+    @property
+    def wall_start(self) -> float:
+        return float(self.t_capture[0] + self.wall_offset) if len(self.pts) else 0.0
+
+    def pauses(self) -> list:
+        """(frame, pause wall time, resume wall time or None) per pause."""
+        out = []
+        for rec in self.marks:
+            wall = float(rec["t_capture"] + self.wall_offset)
+            if rec["kind"] == INDEX_PAUSE:
+                out.append([int(rec["frame"]), wall, None])
+            elif out and out[-1][2] is None:
+                out[-1][2] = wall
+        return [tuple(p) for p in out]
+
+    def frame_at(self, pts: float) -> int:
+        """Frame shown `pts` seconds into the file."""
+        return max(0, int(np.searchsorted(self.pts, pts, side="right")) - 1)
+
+    def frame_at_wall(self, wall: float) -> int:
+        """Frame captured last at or before wall-clock time `wall` (epoch seconds)."""
+        t = wall - self.wall_offset
+        return max(0, int(np.searchsorted(self.t_capture, t, side="right")) - 1)
+
+    def keyframe_before(self, frame: int) -> Optional[int]:
+        """Nearest keyframe at or before `frame`, or None if keyframes are unknown."""
+        if not len(self.keyframes):
+            return None
+        i = int(np.searchsorted(self.keyframes, frame, side="right")) - 1
+        return int(self.keyframes[max(0, i)])
+
+    def seek(
+        self, pts: Optional[float] = None, wall: Optional[float] = None
+    ) -> SeekPoint:
+        """Seek by file time or by wall-clock time; O(log n)."""
+        if not len(self.pts):
+            raise ValueError(f"{self.path} has no frames")
+        frame = self.frame_at(pts) if wall is None else self.frame_at_wall(wall)
+        key = self.keyframe_before(frame)
+        return SeekPoint(
+            frame=frame,
+            pts=float(self.pts[frame]),
+            wall=float(self.t_capture[frame] + self.wall_offset),
+            keyframe=key,
+            keyframe_pts=None if key is None else float(self.pts[key]),
+            offset=(
+                int(self.offsets[key]) if key is not None and self.has_offsets else None
+            ),
+        )
+
+
+def trim_video(
+    video_path: str, start: float, end: float, output_path: Optional[str] = None
+) -> Tuple[str, float, float]:
+    """
+    Cut [start, end) seconds out of a recording without re-encoding (needs ffmpeg).
+    The start snaps back to the keyframe from the seek index, so the clip begins
+    with a decodable frame; the clip gets its own index. Returns (path, start, end)
+    as actually cut. Raises ValueError or RuntimeError.
+    """
+    index = FrameIndex.for_video(video_path)
+    if not len(index):
+        raise ValueError(f"{video_path} has no indexed frames")
+    end = min(end, index.duration)
+    if not 0 <= start < end:
+        raise ValueError(
+            f"Empty range {start:.3f}-{end:.3f} s (the video is {index.duration:.3f} s)"
+        )
+    first = index.frame_at(start)
+    key = index.keyframe_before(first)
+    # Without keyframe information ffmpeg itself falls back to the previous keyframe
+    cut = float(index.pts[key]) if key is not None else start
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("Trimming needs ffmpeg on PATH")
+    if output_path is None:
+        base, ext = os.path.splitext(video_path)
+        output_path = f"{base}_trim{ext}"
+    # A hair past the keyframe so rounding never makes ffmpeg pick the one before
+    cmd = [ffmpeg, "-hide_banner", "-loglevel", "error", "-y"]
+    cmd += ["-ss", f"{cut + 5e-4:.6f}", "-i", video_path, "-t", f"{end - cut:.6f}"]
+    cmd += ["-map", "0", "-c", "copy", "-avoid_negative_ts", "make_zero"]
+    if os.path.splitext(output_path)[1].lower() in (".mp4", ".mov"):
+        cmd += ["-movflags", "+faststart"]
+    try:
+        subprocess.run(
+            cmd + [output_path],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=600,
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(
+            f"ffmpeg failed: {e.stderr.decode(errors='replace').strip()}"
+        )
+    # The clip's index: the same capture times, file times from the cut. A stream copy
+    # ends on a packet boundary, so the container decides how many frames it holds.
+    first_row = key if key is not None else first
+    last_row = index.frame_at(end - 1e-6)
+    table = (
+        mp4_sample_table(output_path)
+        if os.path.splitext(output_path)[1].lower() in (".mp4", ".mov")
+        else None
+    )
+    if table is not None:
+        last_row = min(len(index) - 1, first_row + len(table["pts"]) - 1)
+    header, records = read_frame_index(index.path)
+    keep = (records["frame"] >= first_row) & (records["frame"] <= last_row)
+    keep &= (records["kind"] == INDEX_FRAME) | (records["frame"] > first_row)
+    clip = records[keep].copy()
+    clip["frame"] -= first_row
+    clip["pts"] -= cut
+    clip["offset"] = 0
+    header.update(video=os.path.basename(output_path), offsets=False)
+    clip_index = index_path_for(output_path)
+    write_frame_index(clip_index, header, clip)
+    try:
+        finalize_frame_index(
+            clip_index, output_path, container_pts=not header.get("vfr")
+        )
+    except Exception:
+        pass
+    if last_row + 1 < len(index):
+        end = float(index.pts[last_row + 1])
+    return output_path, cut, end
+
+
+# ----------------------- ENCODER REGISTRY -----------------------
+# Quality classes of encoder backends
+QUALITY_EFFICIENT = "efficient"  # modern inter-frame codecs (H.264): smallest files
+QUALITY_STANDARD = "standard"  # older inter-frame codecs (MPEG-4 Part 2)
+QUALITY_INTRA = "intra"  # every frame a still image (MJPEG): cheap, large files
+QUALITY_LOSSLESS = "lossless"
+
+# Profiles: the quality classes auto-selection picks the fastest backend from
+ENCODER_PROFILES = {
+    "small": (QUALITY_EFFICIENT,),
+    "balanced": (QUALITY_EFFICIENT, QUALITY_STANDARD),
+    "fastest": (QUALITY_EFFICIENT, QUALITY_STANDARD, QUALITY_INTRA),
+    "lossless": (QUALITY_LOSSLESS,),
+}
+PROFILE_DEFAULT = "small"
+
+
+@dataclass(frozen=True)
+class EncoderBackend:
+    """
+    One way of writing video: an OpenCV VideoWriter fourcc ('opencv') or an ffmpeg
+    encoder fed raw frames through FfmpegPipeWriter ('ffmpeg'). `args` are the
+    ffmpeg output options; {preset}, {crf} and {kbps} are filled in when opening.
+    `containers` lists the file extensions the codec can be stored in, preferred first.
+    """
+
+    name: str
+    kind: str
+    codec: str
+    quality: str
+    containers: Tuple[str, ...] = (".mp4", ".mkv", ".mov")
+    args: Tuple[str, ...] = ()
+    hardware: bool = False  # only auto-selected once a benchmark has shown it works
+
+    def available(self) -> bool:
+        """Cheap check; only a benchmark tells whether it really opens (e.g. GPU)."""
+        return self.kind != "ffmpeg" or self.codec in ffmpeg_encoders()[1]
+
+    def open(
+        self,
+        path: str,
+        fps: float,
+        size: Tuple[int, int],
+        preset: str = "veryfast",
+        crf: int = 23,
+    ):
+        """Writer for `path`, or None if the backend cannot open it."""
+        w, h = int(size[0]), int(size[1])
+        if self.kind == "ffmpeg":
+            ffmpeg, encoders = ffmpeg_encoders()
+            if ffmpeg is None or self.codec not in encoders:
+                return None
+            # ~0.1 bit per pixel for bitrate-only encoders
+            kbps = max(500, int(w * h * fps * 0.1 / 1000))
+            args = [a.format(preset=preset, crf=int(crf), kbps=kbps) for a in self.args]
+            writer = FfmpegPipeWriter(path, fps, (w, h), ffmpeg=ffmpeg, codec_args=args)
+        else:
+            writer = cv2.VideoWriter(
+                path, cv2.VideoWriter_fourcc(*self.codec), fps, (w, h)
+            )
+        return writer if writer.isOpened() else None
+
+
+ENCODER_REGISTRY: dict = {}  # name -> EncoderBackend, in the built-in preference order
+
+
+def register_encoder(backend: EncoderBackend) -> None:
+    """Add or replace a backend; it is then selectable by name and benchmarked."""
+    ENCODER_REGISTRY[backend.name] = backend
+
+
+for _backend in (
+    EncoderBackend(
+        ENCODER_X264,
+        "ffmpeg",
+        "libx264",
+        QUALITY_EFFICIENT,
+        args=(
+            "-c:v",
+            "libx264",
+            "-preset",
+            "{preset}",
+            "-crf",
+            "{crf}",
+            "-pix_fmt",
+            "yuv420p",
+        ),
+    ),
+    EncoderBackend(
+        "ffmpeg-nvenc",
+        "ffmpeg",
+        "h264_nvenc",
+        QUALITY_EFFICIENT,
+        hardware=True,
+        args=(
+            "-c:v",
+            "h264_nvenc",
+            "-preset",
+            "p4",
+            "-rc",
+            "vbr",
+            "-cq",
+            "{crf}",
+            "-pix_fmt",
+            "yuv420p",
+        ),
+    ),
+    EncoderBackend(
+        "ffmpeg-qsv",
+        "ffmpeg",
+        "h264_qsv",
+        QUALITY_EFFICIENT,
+        hardware=True,
+        args=("-c:v", "h264_qsv", "-global_quality", "{crf}", "-pix_fmt", "nv12"),
+    ),
+    EncoderBackend(
+        "ffmpeg-videotoolbox",
+        "ffmpeg",
+        "h264_videotoolbox",
+        QUALITY_EFFICIENT,
+        hardware=True,
+        args=("-c:v", "h264_videotoolbox", "-b:v", "{kbps}k", "-pix_fmt", "yuv420p"),
+    ),
+    EncoderBackend(
+        ENCODER_MP4V,
+        "opencv",
+        "mp4v",
+        QUALITY_STANDARD,
+        (".mp4", ".avi", ".mkv", ".mov"),
+    ),
+    EncoderBackend("opencv-xvid", "opencv", "XVID", QUALITY_STANDARD, (".avi", ".mkv")),
+    EncoderBackend("opencv-mjpg", "opencv", "MJPG", QUALITY_INTRA, (".avi", ".mkv")),
+    EncoderBackend(
+        "ffmpeg-ffv1",
+        "ffmpeg",
+        "ffv1",
+        QUALITY_LOSSLESS,
+        (".mkv", ".avi"),
+        args=("-c:v", "ffv1", "-level", "3", "-slices", "4", "-pix_fmt", "yuv420p"),
+    ),
+    EncoderBackend("opencv-ffv1", "opencv", "FFV1", QUALITY_LOSSLESS, (".mkv", ".avi")),
+):
+    register_encoder(_backend)
+ENCODERS = (ENCODER_AUTO,) + tuple(ENCODER_REGISTRY)
+
+
+def encoder_output_path(path: str, encoder: str) -> str:
+    """`path` with its extension replaced when `encoder` cannot write that container."""
+    backend = ENCODER_REGISTRY.get(encoder)
+    base, ext = os.path.splitext(path)
+    if backend is None or ext.lower() in backend.containers:
+        return path
+    return base + backend.containers[0]
+
+
+def encoder_cache_path() -> str:
+    """Where encoder benchmark results are cached (per user)."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "hraji-screen-recorder", "encoder_benchmarks.json")
+
+
+def _encoder_fingerprint() -> dict:
+    # Results are dropped when anything that changes encoder speed or support changes
+    ffmpeg = ffmpeg_encoders()[0]
+    st = os.stat(ffmpeg) if ffmpeg else None
+    return {
+        "version": 1,
+        "opencv": cv2.__version__,
+        "cpus": os.cpu_count(),
+        "ffmpeg": [ffmpeg, st.st_size, int(st.st_mtime)] if st else None,
+        "backends": sorted(ENCODER_REGISTRY),
+    }
+
+
+def _benchmark_key(size: Tuple[int, int], preset: str) -> str:
+    return f"{int(size[0])}x{int(size[1])}/{preset}"
+
+
+def _read_encoder_cache() -> dict:
+    try:
+        with open(encoder_cache_path(), encoding="utf-8") as fh:
+            cache = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return (
+        cache.get("results", {})
+        if cache.get("fingerprint") == _encoder_fingerprint()
+        else {}
+    )
+
+
+def load_encoder_benchmarks(
+    size: Tuple[int, int], preset: str = "veryfast"
+) -> Optional[dict]:
+    """Cached benchmark of every backend at `size`, or None.
+
+    The result maps each backend name to {"ok", "fps", "bytes_per_frame"}.
+    """
+    return _read_encoder_cache().get(_benchmark_key(size, preset))
+
+
+def benchmark_encoders(
+    size: Tuple[int, int],
+    fps: float = 30.0,
+    preset: str = "veryfast",
+    crf: int = 23,
+    frames: int = 30,
+    budget: float = 1.5,
+    cancel: Optional[threading.Event] = None,
+    on_result: Optional[Callable[[str, dict], None]] = None,
+) -> Optional[dict]:
+    """
+    Encode a moving synthetic pattern at `size` with every available backend and
+    cache the results on disk. Each backend gets `frames` frames or `budget`
+    seconds, whichever ends first; throughput counts the writes and the final
+    flush, not frame generation. Returns {name: result}, or None if cancelled.
+    """
+    w, h = even(size[0]), even(size[1])
+    source = SyntheticFrameSource(w, h, fps=fps)
+    source.open()
+    bbox = source.bounds()
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="hraji_encbench_")
+    try:
+        for name, backend in ENCODER_REGISTRY.items():
+            if cancel is not None and cancel.is_set():
+                return None
+            result = {"ok": False, "fps": 0.0, "bytes_per_frame": 0}
+            if backend.available():
+                path = os.path.join(work_dir, "bench" + backend.containers[0])
+                try:
+                    result = _benchmark_backend(
+                        backend,
+                        path,
+                        source,
+                        bbox,
+                        fps,
+                        preset,
+                        crf,
+                        frames,
+                        budget,
+                        cancel,
+                    )
+                except Exception as e:
+                    result["error"] = str(e)[:200]
+            else:
+                result["error"] = "not available"
+            results[name] = result
+            if on_result is not None:
+                on_result(name, result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if cancel is not None and cancel.is_set():
+        return None
+    cache = _read_encoder_cache()
+    cache[_benchmark_key((w, h), preset)] = results
+    path = encoder_cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(
+                {"fingerprint": _encoder_fingerprint(), "results": cache}, fh, indent=1
+            )
+        os.replace(tmp, path)
+    except OSError:
+        pass  # results still apply to this run
+    return results
+
+
+def _benchmark_backend(
+    backend: EncoderBackend,
+    path: str,
+    source: FrameSource,
+    bbox: BBox,
+    fps: float,
+    preset: str,
+    crf: int,
+    frames: int,
+    budget: float,
+    cancel: Optional[threading.Event],
+) -> dict:
+    writer = backend.open(path, fps, (bbox.width, bbox.height), preset=preset, crf=crf)
+    if writer is None:
+        return {
+            "ok": False,
+            "fps": 0.0,
+            "bytes_per_frame": 0,
+            "error": "failed to open",
+        }
+    bgr = np.empty((bbox.height, bbox.width, 3), dtype=np.uint8)
+    spent, count = 0.0, 0
+    try:
+        while count < frames and (spent < budget or count < 5):
+            if cancel is not None and cancel.is_set():
+                break
+            cv2.cvtColor(source.grab(bbox), cv2.COLOR_BGRA2BGR, dst=bgr)
+            t0 = time.perf_counter()
+            writer.write(bgr)
+            spent += time.perf_counter() - t0
+            count += 1
+    finally:
+        t0 = time.perf_counter()
+        writer.release()
+        spent += time.perf_counter() - t0
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return {"ok": False, "fps": 0.0, "bytes_per_frame": 0, "error": "no output"}
+    return {
+        "ok": True,
+        "fps": round(count / spent, 2) if spent > 0 else 0.0,
+        "bytes_per_frame": os.path.getsize(path) // max(1, count),
+    }
+
+
+def rank_encoders(
+    size: Tuple[int, int], profile: str = PROFILE_DEFAULT, preset: str = "veryfast"
+) -> list:
+    """
+    Backend names for auto-selection, best first. With cached benchmark results:
+    working backends of the profile's classes by measured speed, then the other
+    lossy classes as fallbacks. Without: the built-in order (x264, else mp4v).
+    """
+    classes = ENCODER_PROFILES.get(profile, ENCODER_PROFILES[PROFILE_DEFAULT])
+    fallback = [
+        c
+        for c in (QUALITY_EFFICIENT, QUALITY_STANDARD, QUALITY_INTRA)
+        if c not in classes
+    ]
+    results = load_encoder_benchmarks(size, preset)
+    ranked = []
+    for group in (classes, fallback):
+        members = [b for b in ENCODER_REGISTRY.values() if b.quality in group]
+        if results is not None:
+            members = [b for b in members if results.get(b.name, {}).get("ok")]
+            members.sort(key=lambda b: -results[b.name]["fps"])
+        else:
+            members = [b for b in members if not b.hardware and b.available()]
+        ranked += [b.name for b in members]
+    return ranked or [ENCODER_MP4V]
+
+
+# ----------------------- RAW SPOOL -----------------------
+SPOOL_AUTO = "auto"  # lz4 when installed, else zlib
+SPOOL_CODECS = (SPOOL_AUTO, "raw", "lz4", "zlib")
+
+
+def spool_path_for(output_path: str) -> str:
+    """Spool file used while `output_path` is recorded in encode-later mode."""
+    return os.path.splitext(output_path)[0] + ".spool"
+
+
+def find_spools(directory: str) -> list:
+    """Spool files left in `directory` by interrupted or cancelled encodes, oldest
+    first."""
+    found = []
+    try:
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".spool") and os.path.isfile(path):
+                found.append((os.path.getmtime(path), path))
+    except OSError:
+        return []
+    return [path for _, path in sorted(found)]
+
+
+def _lower_thread_priority(increment: int = 10) -> bool:
+    """Deprioritize the calling thread. On Linux niceness is per thread and inherited by
+    processes it starts (e.g. ffmpeg); on Windows only the thread itself is lowered.
+    """
+    try:
+        if sys.platform.startswith("linux"):
+            tid = threading.get_native_id()
+            os.setpriority(
+                os.PRIO_PROCESS,
+                tid,
+                min(19, os.getpriority(os.PRIO_PROCESS, tid) + increment),
+            )
+            return True
+        if sys.platform == "win32":
+            import ctypes
+
+            kernel32 = ctypes.windll.kernel32
+            below_normal = -1
+            thread = kernel32.GetCurrentThread()
+            return bool(kernel32.SetThreadPriority(thread, below_normal))
+    except Exception:
+        pass
+    return False
+
+
+class FrameSpool:
+    """
+    Append-only spool of I420 frames in a memory-mapped file, for capture-now,
+    encode-later recording: storing a frame costs a color conversion plus a copy
+    (or a fast LZ4/zlib pass) instead of a video encode. Unchanged frames only bump
+    the repeat count of the previous record.
+
+    Layout: MAGIC, uint32 header length, JSON header, then RECORD (tag, media time,
+    repeats, payload length) + payload per distinct frame. A record's tag is
+    written after its payload, so a spool cut short by a crash reads up to the last
+    complete frame. Space is preallocated in GROW_BYTES steps, so a full disk
+    fails the write instead of faulting on a mapped page.
+    """
+
+    MAGIC = b"SRSPOOL1"
+    RECORD = struct.Struct("<4sdII")
+    TAG = b"FRM1"
+    GROW_BYTES = 256 * 1024 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        size: Tuple[int, int],
+        fps: float,
+        codec: str = SPOOL_AUTO,
+        meta: Optional[dict] = None,
+    ) -> None:
+        w, h = int(size[0]), int(size[1])
+        if codec == SPOOL_AUTO:
+            codec = "lz4" if _have_lz4() else "zlib"
+        elif codec == "lz4" and not _have_lz4():
+            raise RuntimeError(
+                "The lz4 spool codec needs the 'lz4' package (pip install lz4)"
+            )
+        elif codec not in SPOOL_CODECS:
+            raise ValueError(f"Unknown spool codec '{codec}'")
+        self.path = path
+        self.size = (w, h)
+        self.codec = codec
+        self.frames = 0  # including repeats
+        self._shape = (h * 3 // 2, w)
+        self._i420 = None if codec == "raw" else np.empty(self._shape, dtype=np.uint8)
+        header = json.dumps(
+            dict(
+                meta or {},
+                version=1,
+                width=w,
+                height=h,
+                fps=float(fps),
+                codec=codec,
+                pix_fmt="yuv420p",
+            )
+        ).encode()
+        self._fd: Optional[int] = os.open(
+            path,
+            os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+            0o644,
+        )
+        self._map: Optional[mmap.mmap] = None
+        self._capacity = 0
+        self._last: Optional[int] = None  # offset of the newest record
+        self._end = len(self.MAGIC) + 4 + len(header)
+        self._reserve(self.RECORD.size + self._shape[0] * w)
+        self._map[: self._end] = self.MAGIC + struct.pack("<I", len(header)) + header
+
+    @property
+    def nbytes(self) -> int:
+        return self._end
+
+    def isOpened(self) -> bool:
+        return self._map is not None
+
+    def add(
+        self,
+        frame_bgr: np.ndarray,
+        t_media: float,
+        repeats: int = 1,
+        reused: bool = False,
+    ) -> None:
+        """Append a frame shown for `repeats` writer slots; `reused` marks it
+        identical to the previous one."""
+        if self._map is None:
+            return
+        self.frames += repeats
+        if reused and self._last is not None:
+            tag, t, count, length = self.RECORD.unpack_from(self._map, self._last)
+            self.RECORD.pack_into(
+                self._map, self._last, tag, t, count + repeats, length
+            )
+            return
+        start = self._end + self.RECORD.size
+        if self._i420 is None:
+            length = self._shape[0] * self._shape[1]
+            self._reserve(self.RECORD.size + length)
+            dst = np.ndarray(
+                self._shape, dtype=np.uint8, buffer=self._map, offset=start
+            )
+            cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2YUV_I420, dst=dst)
+            del dst  # a live view would keep the map from being resized
+        else:
+            cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2YUV_I420, dst=self._i420)
+            if self.codec == "lz4":
+                payload = lz4_block.compress(self._i420, store_size=False)
+            else:
+                payload = zlib.compress(self._i420, 1)
+            length = len(payload)
+            self._reserve(self.RECORD.size + length)
+            self._map[start : start + length] = payload
+        self.RECORD.pack_into(self._map, self._end, self.TAG, t_media, repeats, length)
+        self._last = self._end
+        self._end = start + length
+
+    def _reserve(self, nbytes: int) -> None:
+        if self._end + nbytes <= self._capacity:
+            return
+        step = mmap.ALLOCATIONGRANULARITY
+        wanted = max(self._end + nbytes, self._capacity + self.GROW_BYTES)
+        capacity = -(-wanted // step) * step
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(self._fd, self._capacity, capacity - self._capacity)
+        else:
+            os.ftruncate(self._fd, capacity)
+        self._map = mmap.mmap(self._fd, capacity)
+        self._capacity = capacity
+
+    def close(self) -> None:
+        """Unmap and trim the preallocated tail. The OS writes back dirty pages."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._fd is not None:
+            try:
+                os.ftruncate(self._fd, self._end)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+
+    release = close
+
+
+class SpoolReader:
+    """Reads a FrameSpool file, including one cut short by a crash."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as fh:
+            try:
+                self._map: Optional[mmap.mmap] = mmap.mmap(
+                    fh.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            except ValueError:
+                raise ValueError(f"'{path}' is empty")
+        magic = FrameSpool.MAGIC
+        if self._map[: len(magic)] != magic:
+            self._map.close()
+            raise ValueError(f"'{path}' is not a screen recorder spool")
+        (n,) = struct.unpack_from("<I", self._map, len(magic))
+        offset = len(magic) + 4
+        self.header = json.loads(self._map[offset : offset + n])
+        self.size = (int(self.header["width"]), int(self.header["height"]))
+        self.fps = float(self.header["fps"])
+        self.codec = self.header["codec"]
+        self._shape = (self.size[1] * 3 // 2, self.size[0])
+        self.records: list = []  # (payload offset, payload length, repeats, media time)
+        self._scan(offset + n)
+        self.frames = sum(r[2] for r in self.records)
+
+    def _scan(self, offset: int) -> None:
+        rec = FrameSpool.RECORD
+        end = len(self._map)
+        while offset + rec.size <= end:
+            tag, t_media, repeats, length = rec.unpack_from(self._map, offset)
+            if (
+                tag != FrameSpool.TAG
+                or repeats == 0
+                or offset + rec.size + length > end
+            ):
+                break  # preallocated zeros or a record the writer never finished
+            self.records.append((offset + rec.size, length, repeats, t_media))
+            offset += rec.size + length
+
+    def frame_i420(self, index: int) -> np.ndarray:
+        """Planar I420 frame of record `index` ((h * 3 / 2) x w); raw spools return a
+        view into the map."""
+        offset, length, _, _ = self.records[index]
+        if self.codec == "raw":
+            return np.frombuffer(
+                self._map, dtype=np.uint8, count=length, offset=offset
+            ).reshape(self._shape)
+        data = self._map[offset : offset + length]
+        if self.codec == "lz4":
+            if not _have_lz4():
+                raise RuntimeError(
+                    "This spool is LZ4-compressed; install the 'lz4' package to "
+                    "encode it"
+                )
+            data = lz4_block.decompress(
+                data, uncompressed_size=self._shape[0] * self._shape[1]
+            )
+        else:
+            data = zlib.decompress(data)
+        return np.frombuffer(data, dtype=np.uint8).reshape(self._shape)
+
+    def close(self) -> None:
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # a frame view is still alive; the map goes with it
+            self._map = None
+
+    def __enter__(self) -> "SpoolReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class SpoolTranscoder:
+    """
+    Encodes a spool into its video file on a low-priority background thread.
+    The video is written in parts of about PART_SECONDS that are kept next to the
+    spool ('<spool>.parts/') as they complete, so a cancelled or killed encode
+    resumes at the first missing part; parts are joined losslessly at the end and
+    the spool is deleted once the video exists. Callbacks run on the worker thread:
+    on_progress(done_frames, total_frames) and on_done(transcoder).
+    """
+
+    PART_SECONDS = 10.0
+    PROGRESS_INTERVAL = 0.25  # seconds between on_progress calls
+
+    def __init__(
+        self,
+        spool_path: str,
+        output_path: Optional[str] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        on_done: Optional[Callable[["SpoolTranscoder"], None]] = None,
+        keep_spool: bool = False,
+    ) -> None:
+        self.spool_path = spool_path
+        # default: next to the spool, extension from its header
+        self.output_path = output_path
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.keep_spool = keep_spool
+        self.done_frames = 0
+        self.total_frames = 0
+        self.error: Optional[str] = None
+        self.cancelled = False
+        self._cancel = threading.Event()
+        # Completion is tracked with an Event: a Thread.join() interrupted by Ctrl+C
+        # can leave is_alive() reporting False while the thread still runs
+        self._finished = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_progress = 0.0
+        self._reported = -1
+
+    @property
+    def progress(self) -> float:
+        return self.done_frames / self.total_frames if self.total_frames else 0.0
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run_in_background, name="ScreenRecorderTranscode", daemon=True
+        )
+        self._thread.start()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and not self._finished.is_set()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._finished.wait(timeout)
+
+    def cancel(self) -> None:
+        """Stop after the current frame; finished parts are kept for the next run."""
+        self._cancel.set()
+
+    def _run_in_background(self) -> None:
+        _lower_thread_priority()
+        try:
+            self.run()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self._finished.set()
+            if self.on_done is not None:
+                self.on_done(self)
+
+    def run(self) -> Optional[str]:
+        """Encode on the calling thread. Returns the video path, None if cancelled."""
+        with SpoolReader(self.spool_path) as reader:
+            if not reader.records:
+                raise RuntimeError(f"Spool '{self.spool_path}' holds no frames")
+            header = reader.header
+            if self.output_path is None:
+                ext = header.get("ext", ".mp4")
+                self.output_path = os.path.splitext(self.spool_path)[0] + ext
+            self.total_frames = reader.frames
+            ffmpeg = shutil.which("ffmpeg")
+            # Joining parts needs ffmpeg; without it the whole spool is one part
+            part_frames = (
+                max(1, int(round(reader.fps * self.PART_SECONDS))) if ffmpeg else 0
+            )
+            work_dir = self.spool_path + ".parts"
+            os.makedirs(work_dir, exist_ok=True)
+            parts = []
+            for first, last, frames in self._plan(reader.records, part_frames):
+                part = os.path.join(work_dir, f"part_{first:07d}.mp4")
+                parts.append(part)
+                if os.path.exists(part):
+                    self._advance(frames, force=True)  # encoded by an earlier run
+                    continue
+                tmp = os.path.join(work_dir, f"part_{first:07d}.tmp.mp4")
+                if not self._encode_part(reader, first, last, tmp, header):
+                    self.cancelled = True
+                    with contextlib.suppress(OSError):
+                        os.remove(tmp)
+                    return None
+                os.replace(tmp, part)
+        if len(parts) == 1:
+            os.replace(parts[0], self.output_path)
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            join_videos(parts, self.output_path, work_dir, ffmpeg)
+        if not self.keep_spool:
+            os.remove(self.spool_path)
+        self._advance(0, force=True)
+        return self.output_path
+
+    @staticmethod
+    def _plan(records: list, part_frames: int) -> list:
+        """(first record, end record, frames) per part; parts end between records."""
+        plan, first, frames = [], 0, 0
+        for i, record in enumerate(records):
+            frames += record[2]
+            if part_frames and frames >= part_frames:
+                plan.append((first, i + 1, frames))
+                first, frames = i + 1, 0
+        if first < len(records):
+            plan.append((first, len(records), frames))
+        return plan
+
+    def _encode_part(
+        self, reader: SpoolReader, first: int, last: int, path: str, header: dict
+    ) -> bool:
+        writer, name = open_video_writer(
+            path,
+            reader.fps,
+            reader.size,
+            encoder=header.get("encoder", ENCODER_AUTO),
+            preset=header.get("preset", "veryfast"),
+            crf=int(header.get("crf", 23)),
+        )
+        if writer is None:
+            raise RuntimeError(f"Failed to create video writer ({name}) for {path}")
+        bgr = None
+        try:
+            for index in range(first, last):
+                frame = reader.frame_i420(index)
+                if not isinstance(writer, FfmpegPipeWriter):
+                    bgr = cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420, dst=bgr)
+                for _ in range(reader.records[index][2]):
+                    if self._cancel.is_set():
+                        return False
+                    if bgr is None:
+                        writer.write_i420(frame)
+                    else:
+                        writer.write(bgr)
+                    self._advance(1)
+                del frame
+        finally:
+            writer.release()
+        return True
+
+    def _advance(self, frames: int, force: bool = False) -> None:
+        self.done_frames += frames
+        now = time.monotonic()
+        if self.on_progress is None or self.done_frames == self._reported:
+            return
+        if force or now - self._last_progress >= self.PROGRESS_INTERVAL:
+            self._last_progress = now
+            self._reported = self.done_frames
+            self.on_progress(self.done_frames, self.total_frames)
+
+
+# ----------------------- ACTIVE WINDOW (X11) -----------------------
+def _parse_xwininfo(text: str) -> Optional[Tuple[int, int, int, int]]:
+    """(x, y, w, h) from `xwininfo -id` output, or None."""
+    # Lines of interest:
+    #   Absolute upper-left X:  0
+    #   Absolute upper-left Y:  0
+    #   Width: 1920
+    #   Height: 1080
+    fields = {
+        "Absolute upper-left X:": None,
+        "Absolute upper-left Y:": None,
+        "Width:": None,
+        "Height:": None,
+    }
+    for line in text.splitlines():
+        line = line.strip()
+        for key in fields:
+            if line.startswith(key):
+                fields[key] = int(line.split(":")[1])
+    values = tuple(fields.values())
+    return None if None in values else values
+
+
+class ActiveWindowTracker:
+    """
+    Follows the focused window on X11 and exposes its geometry while it is full
+    screen (fullscreen_bbox, else None). Keeps one long-lived X connection
+    (python-xlib) and reacts to focus, _NET_WM_STATE and configure events; without
+    python-xlib it falls back to persistent `xprop -spy` children and runs
+    xwininfo when something changed. Moves and resizes change no property, so the
+    fallback also re-reads the followed window's geometry every GEOMETRY_POLL
+    seconds. The size heuristic uses the cached display topology.
+    """
+
+    GEOMETRY_POLL = 1.0  # seconds; xprop fallback only
+
+    def __init__(self) -> None:
+        self.fullscreen_bbox: Optional[BBox] = None
+        self.backend: Optional[str] = None  # "xlib" or "xprop" once started
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._procs: list = []
+        self.trace = None  # optional TraceRecorder for lookups and spawned helpers
+
+    def _span(self, name: str):
+        return (
+            self.trace.span(name, "follow")
+            if self.trace is not None
+            else contextlib.nullcontext()
+        )
+
+    def start(self) -> bool:
+        """Start tracking; False when neither python-xlib nor xprop/xwininfo works."""
+        if self._thread is not None:
+            return True
+        if not os.environ.get("DISPLAY"):
+            return False
+        if _have_xlib():
+            self.backend, target = "xlib", self._run_xlib
+        elif shutil.which("xprop") and shutil.which("xwininfo"):
+            self.backend, target = "xprop", self._run_xprop
+        else:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=target, name="ScreenRecorderWindowTracker", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+        for proc in self._procs:
+            try:
+                proc.terminate()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _publish(
+        self, geometry: Optional[Tuple[int, int, int, int]], is_fullscreen: bool
+    ) -> None:
+        bbox = None
+        if geometry is not None:
+            x, y, w, h = geometry
+            # Not marked fullscreen: heuristically accept a window covering the monitor
+            try:
+                mon = get_primary_monitor_rect()
+            except Exception:
+                mon = None
+            if (
+                not is_fullscreen
+                and mon is not None
+                and abs(w - mon.width) <= 2
+                and abs(h - mon.height) <= 2
+            ):
+                is_fullscreen = True
+            if is_fullscreen:
+                bbox = BBox(left=x, top=y, width=even(w), height=even(h))
+        self.fullscreen_bbox = bbox
+
+    # ---- python-xlib backend: one connection, event driven ----
+    def _run_xlib(self) -> None:
+        try:
+            disp = xdisplay.Display()
+        except Exception:
+            return
+        try:
+            disp.set_error_handler(lambda *_: None)  # windows may vanish between events
+            root = disp.screen().root
+            net_active = disp.intern_atom("_NET_ACTIVE_WINDOW")
+            net_state = disp.intern_atom("_NET_WM_STATE")
+            net_fullscreen = disp.intern_atom("_NET_WM_STATE_FULLSCREEN")
+            watched_atoms = (net_active, net_state)
+            root.change_attributes(event_mask=X.PropertyChangeMask)
+            watched = None
+
+            def refresh():
+                nonlocal watched
+                prop = root.get_full_property(net_active, X.AnyPropertyType)
+                wid = int(prop.value[0]) if prop is not None and len(prop.value) else 0
+                if watched is None or watched.id != wid:
+                    watched = (
+                        disp.create_resource_object("window", wid) if wid else None
+                    )
+                    if watched is not None:
+                        watched.change_attributes(
+                            event_mask=X.PropertyChangeMask | X.StructureNotifyMask
+                        )
+                if watched is None:
+                    self._publish(None, False)
+                    return
+                state = watched.get_full_property(net_state, X.AnyPropertyType)
+                geom = watched.get_geometry()
+                pos = root.translate_coords(watched, 0, 0)
+                self._publish(
+                    (pos.x, pos.y, geom.width, geom.height),
+                    state is not None and net_fullscreen in state.value,
+                )
+
+            dirty = True
+            while not self._stop.is_set():
+                if dirty:
+                    try:
+                        with self._span("window_refresh"):
+                            refresh()
+                    except Exception:
+                        watched = None
+                        self._publish(None, False)
+                    dirty = False
+                if not disp.pending_events():
+                    select.select([disp], [], [], 0.25)
+                while disp.pending_events():
+                    ev = disp.next_event()
+                    if ev.type == X.PropertyNotify and ev.atom in watched_atoms:
+                        dirty = True
+                    elif ev.type in (X.ConfigureNotify, X.DestroyNotify):
+                        dirty = True
+        finally:
+            disp.close()
+
+    # ---- fallback: persistent `xprop -spy` children ----
+    def _run_xprop(self) -> None:
+        events: queue.Queue = queue.Queue()
+        root_spy = self._spawn_spy(
+            ["xprop", "-root", "-spy", "_NET_ACTIVE_WINDOW"], "active", events
+        )
+        if root_spy is None:
+            return
+        state_spy = None
+        wid = None
+        fullscreen = False
+        next_poll = float("inf")
+        while not self._stop.is_set():
+            try:
+                kind, line = events.get(timeout=0.25)
+            except queue.Empty:
+                if time.monotonic() < next_poll:
+                    continue
+                kind, line = "poll", ""  # a move or resize of the followed window
+            if kind == "active":
+                # e.g. _NET_ACTIVE_WINDOW(WINDOW): window id # 0x06000007
+                new_wid = line.strip().split()[-1] if line.strip() else "0x0"
+                if new_wid != wid:
+                    wid = new_wid
+                    fullscreen = False
+                    if state_spy is not None:
+                        state_spy.terminate()
+                        self._procs.remove(state_spy)
+                        state_spy = None
+                    if wid != "0x0":
+                        # Fullscreen toggles of the focused window show up here
+                        state_spy = self._spawn_spy(
+                            ["xprop", "-id", wid, "-spy", "_NET_WM_STATE"],
+                            "state",
+                            events,
+                        )
+                    if state_spy is not None:
+                        continue  # its first line triggers the lookup
+            elif kind == "state":
+                fullscreen = "_NET_WM_STATE_FULLSCREEN" in line
+            if wid is None or wid == "0x0":
+                next_poll = float("inf")
+                self._publish(None, False)
+                continue
+            next_poll = time.monotonic() + self.GEOMETRY_POLL
+            try:
+                with self._span("xwininfo"):
+                    winfo = subprocess.check_output(
+                        ["xwininfo", "-id", wid],
+                        stderr=subprocess.DEVNULL,
+                        text=True,
+                        timeout=2.0,
+                    )
+            except Exception:
+                self._publish(None, False)
+                continue
+            self._publish(_parse_xwininfo(winfo), fullscreen)
+
+    def _spawn_spy(
+        self, cmd: list, kind: str, events: queue.Queue
+    ) -> Optional[subprocess.Popen]:
+        try:
+            with self._span("xprop_spawn"):
+                proc = subprocess.Popen(
+                    cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+                )
+        except OSError:
+            return None
+        self._procs.append(proc)
+
+        def pump():
+            for line in proc.stdout:
+                events.put((kind, line))
+
+        threading.Thread(
+            target=pump, name="ScreenRecorderXpropSpy", daemon=True
+        ).start()
+        return proc
+
+
+# ----------------------- OVERLAY SPRITES -----------------------
+class ClickRing:
+    """
+    Fixed-size, lock-free record of recent clicks. The mouse listener is the only
+    writer: each slot holds an immutable (t, x, y, is_left) tuple that is replaced
+    in one assignment, and readers take a shallow copy and skip expired slots.
+    New clicks overwrite the oldest, so drawing cost is bounded by the ring size
+    no matter how many clicks arrive.
+    """
+
+    def __init__(self, size: int = 8, lifetime: float = 0.6) -> None:
+        self.lifetime = lifetime
+        self._slots: list = [None] * size
+        self._next = 0
+
+    def add(self, t: float, x: int, y: int, is_left: bool) -> None:
+        i = self._next
+        self._slots[i % len(self._slots)] = (t, x, y, is_left)
+        self._next = i + 1
+
+    def active(self, now: float) -> list:
+        return [
+            c
+            for c in list(self._slots)
+            if c is not None and now - c[0] <= self.lifetime
+        ]
+
+
+class OverlaySprites:
+    """
+    Cursor and click-ripple images prerendered once with real (anti-aliased) alpha:
+    one cursor sprite and FADE_STEPS ripple frames per button. Drawing is a
+    vectorized alpha blend of the sprite into the small frame slice it covers,
+    so per-frame cost does not depend on frame size.
+    Sprites are (premultiplied BGR, alpha, radius) with the center at (radius, radius).
+    """
+
+    FADE_STEPS = 24
+    _SUPERSAMPLE = 5  # odd, so pixel centers land on integer coordinates
+    _shared: Optional["OverlaySprites"] = None
+
+    def __init__(self, ripple_lifetime: float = 0.6) -> None:
+        self.ripple_lifetime = ripple_lifetime
+        self.cursor = self._render([(6, (0, 255, 255), -1), (10, (0, 200, 200), 2)])
+        self.ripples = {}
+        for is_left, color in ((True, (0, 0, 255)), (False, (255, 0, 0))):
+            self.ripples[is_left] = [
+                self._render(
+                    [(int(10 + 60 * (i / self.FADE_STEPS)), color, 2)],
+                    opacity=1.0 - i / self.FADE_STEPS,
+                )
+                for i in range(self.FADE_STEPS)
+            ]
+
+    @classmethod
+    def shared(cls) -> "OverlaySprites":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @classmethod
+    def _render(cls, circles: list, opacity: float = 1.0) -> tuple:
+        ss = cls._SUPERSAMPLE
+        radius = max(r + max(th, 0) for r, _, th in circles) + 1
+        size = 2 * radius + 1
+        color = np.zeros((size * ss, size * ss, 3), dtype=np.uint8)
+        alpha = np.zeros((size * ss, size * ss), dtype=np.uint8)
+        center = (radius * ss + ss // 2, radius * ss + ss // 2)
+        for r, col, th in circles:
+            thickness = th * ss if th > 0 else -1
+            cv2.circle(color, center, r * ss, col, thickness, cv2.LINE_AA)
+            cv2.circle(alpha, center, r * ss, 255, thickness, cv2.LINE_AA)
+        # Area downsampling turns coverage into alpha; color drawn on black is already
+        # premultiplied
+        color = cv2.resize(color, (size, size), interpolation=cv2.INTER_AREA)
+        alpha = cv2.resize(alpha, (size, size), interpolation=cv2.INTER_AREA)
+        color = color.astype(np.float32) * opacity
+        alpha = alpha.astype(np.float32) * opacity
+        alpha = alpha.astype(np.uint8)[:, :, None]
+        premul = np.minimum(color.astype(np.uint8), alpha)  # keeps blend results <= 255
+        return premul, alpha, radius
+
+    def ripple(self, age: float, is_left: bool) -> tuple:
+        step = min(
+            self.FADE_STEPS - 1, int(age / self.ripple_lifetime * self.FADE_STEPS)
+        )
+        return self.ripples[is_left][step]
+
+    @staticmethod
+    def blend(frame_bgr: np.ndarray, sprite: tuple, cx: int, cy: int) -> None:
+        """Alpha-blend `sprite` centered at (cx, cy), clipped to the frame, in place."""
+        premul, alpha, radius = sprite
+        h, w = frame_bgr.shape[:2]
+        x0, y0 = int(cx) - radius, int(cy) - radius
+        fx0, fy0 = max(x0, 0), max(y0, 0)
+        fx1, fy1 = min(x0 + premul.shape[1], w), min(y0 + premul.shape[0], h)
+        if fx0 >= fx1 or fy0 >= fy1:
+            return
+        roi = frame_bgr[fy0:fy1, fx0:fx1]
+        src = (slice(fy0 - y0, fy1 - y0), slice(fx0 - x0, fx1 - x0))
+        a = alpha[src].astype(np.uint16)
+        roi[:] = (roi * (255 - a) + 127) // 255 + premul[src]
+
+
+# ----------------------- METRICS -----------------------
+# total: grab start -> written
+PIPELINE_STAGES = ("grab", "convert", "overlay", "resize", "write", "total")
+
+
+class LatencyHistogram:
+    """
+    Fixed log-spaced buckets (10 us .. ~20 s, 25% apart) so observing a sample is
+    one bisect and an increment, and percentiles need no stored samples. Each
+    histogram has a single writer thread; readers may see a sample or two late.
+    """
+
+    BOUNDS = tuple(1e-5 * 1.25**i for i in range(66))
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(self.BOUNDS) + 1)  # last bucket: beyond BOUNDS[-1]
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def snapshot(self) -> Tuple[list, int, float]:
+        return list(self.counts), self.count, self.sum
+
+    def quantiles(self, qs: Tuple[float, ...], since: Optional[tuple] = None) -> list:
+        """Estimated quantiles in seconds (linear within a bucket), optionally only for
+        samples observed after the `since` snapshot. Zeros when there are none.
+        """
+        counts = self.counts
+        if since is not None:
+            counts = [c - c0 for c, c0 in zip(counts, since[0])]
+        total = sum(counts)
+        if total == 0:
+            return [0.0] * len(qs)
+        out = []
+        for q in qs:
+            rank = q * total
+            seen = 0
+            for i, c in enumerate(counts):
+                if c and seen + c >= rank:
+                    lo = self.BOUNDS[i - 1] if i > 0 else 0.0
+                    hi = self.BOUNDS[i] if i < len(self.BOUNDS) else lo
+                    out.append(lo + (hi - lo) * max(0.0, rank - seen) / c)
+                    break
+                seen += c
+        return out
+
+
+class PipelineMetrics:
+    """Latency histograms for every pipeline stage of one recording."""
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self) -> None:
+        self.stages = {name: LatencyHistogram() for name in PIPELINE_STAGES}
+        self._window = {name: h.snapshot() for name, h in self.stages.items()}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.stages[stage].observe(seconds)
+
+    def take_window(self) -> dict:
+        """{stage: {count, mean_ms, p50_ms, p95_ms, p99_ms}} since the previous call."""
+        result = {}
+        for name, hist in self.stages.items():
+            prev = self._window[name]
+            snap = hist.snapshot()
+            n = snap[1] - prev[1]
+            p50, p95, p99 = hist.quantiles(self.QUANTILES, since=prev)
+            result[name] = {
+                "count": n,
+                "mean_ms": 1000.0 * (snap[2] - prev[2]) / n if n else 0.0,
+                "p50_ms": 1000.0 * p50,
+                "p95_ms": 1000.0 * p95,
+                "p99_ms": 1000.0 * p99,
+            }
+            self._window[name] = snap
+        return result
+
+
+def format_prometheus(
+    record: dict, metrics: PipelineMetrics, prefix: str = "screen_recorder"
+) -> str:
+    """Prometheus text exposition of one stats record. Stage quantiles cover the last
+    stats interval; _sum/_count and the frame counters are cumulative.
+    """
+    lines = [
+        f"# HELP {prefix}_stage_seconds Time spent per frame in each pipeline stage.",
+        f"# TYPE {prefix}_stage_seconds summary",
+    ]
+    for name, hist in metrics.stages.items():
+        window = record["stages"].get(name, {})
+        for q in metrics.QUANTILES:
+            value = window.get(f"p{int(round(q * 100))}_ms", 0.0) / 1000.0
+            lines.append(
+                f'{prefix}_stage_seconds{{stage="{name}",quantile="{q:g}"}} {value:.6g}'
+            )
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {hist.sum:.6g}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {hist.count}')
+    lines += [
+        f"# HELP {prefix}_queue_depth Frames waiting in front of a pipeline stage.",
+        f"# TYPE {prefix}_queue_depth gauge",
+    ]
+    lines += [
+        f'{prefix}_queue_depth{{queue="{k}"}} {v}'
+        for k, v in record["queue_depth"].items()
+    ]
+    lines += [
+        f"# HELP {prefix}_dropped_frames_total Frames dropped by a full queue.",
+        f"# TYPE {prefix}_dropped_frames_total counter",
+    ]
+    lines += [
+        f'{prefix}_dropped_frames_total{{queue="{k}"}} {v}'
+        for k, v in record["dropped_total"].items()
+    ]
+    gauges = (
+        ("capture_fps", "Frames grabbed per second.", record.get("capture_fps", 0.0)),
+        ("write_fps", "Frames written per second.", record.get("write_fps", 0.0)),
+        (
+            "schedule_lateness_max_seconds",
+            "Worst scheduling lateness of a grab in the last interval.",
+            record.get("late_ms_max", 0.0) / 1000.0,
+        ),
+    )
+    for name, help_text, value in gauges:
+        lines += [
+            f"# HELP {prefix}_{name} {help_text}",
+            f"# TYPE {prefix}_{name} gauge",
+            f"{prefix}_{name} {value:.6g}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Writes stats records during a recording: appended as JSON lines, or - for a
+    path ending in .prom - as a Prometheus text file (node_exporter textfile
+    collector) replaced atomically on every update. File I/O happens on its own
+    thread so a slow disk never stalls the pipeline; records are skipped if it
+    falls behind.
+    """
+
+    def __init__(self, path: str, metrics: PipelineMetrics) -> None:
+        self.path = path
+        self.metrics = metrics
+        self.prometheus = path.lower().endswith(".prom")
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=8)
+        self._file = None
+        self._thread = threading.Thread(
+            target=self._run, name="ScreenRecorderMetrics", daemon=True
+        )
+
+    def start(self) -> None:
+        out_dir = os.path.dirname(self.path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        if not self.prometheus:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._thread.start()
+
+    def submit(self, record: dict) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def close(self, timeout: float = 2.0) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                return
+            try:
+                if self.prometheus:
+                    tmp = self.path + ".tmp"
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        f.write(format_prometheus(record, self.metrics))
+                    os.replace(tmp, self.path)
+                else:
+                    self._file.write(json.dumps(record) + "\n")
+                    self._file.flush()
+            except Exception:
+                pass  # metrics are best-effort; never disturb the recording
+
+
+class TraceSpan:
+    """Context manager recording one complete event; see TraceRecorder.span()."""
+
+    __slots__ = ("trace", "name", "cat", "t0")
+
+    def __init__(self, trace: "TraceRecorder", name: str, cat: str) -> None:
+        self.trace, self.name, self.cat = trace, name, cat
+
+    def __enter__(self) -> "TraceSpan":
+        self.t0 = time.monotonic()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.trace.complete(self.name, self.t0, time.monotonic(), self.cat)
+
+
+class TraceRecorder:
+    """
+    Opt-in timeline of what every thread was doing, kept in a bounded ring (the
+    oldest events are overwritten) and written at stop as Chrome trace-event JSON
+    for Perfetto / chrome://tracing. Recording an event is a deque append of a
+    tuple, safe from any thread without a lock.
+    """
+
+    def __init__(self, capacity: int = 200000) -> None:
+        self.events: deque = deque(maxlen=max(1, int(capacity)))
+        self._threads: dict = {}  # ident -> name, for the track labels
+        self._t0 = time.monotonic()
+
+    def _tid(self) -> int:
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        return tid
+
+    def complete(self, name: str, t0: float, t1: float, cat: str = "pipeline") -> None:
+        """A span from monotonic t0 to t1 on the calling thread."""
+        self.events.append(("X", name, cat, t0, t1 - t0, self._tid()))
+
+    def span(self, name: str, cat: str = "pipeline") -> TraceSpan:
+        return TraceSpan(self, name, cat)
+
+    def instant(self, name: str, cat: str = "control") -> None:
+        self.events.append(("i", name, cat, time.monotonic(), None, self._tid()))
+
+    def counter(self, name: str, values: dict) -> None:
+        self.events.append(
+            ("C", name, "stats", time.monotonic(), dict(values), self._tid())
+        )
+
+    def to_json(self) -> dict:
+        pid = os.getpid()
+        out = [
+            {
+                "ph": "M",
+                "name": "process_name",
+                "pid": pid,
+                "tid": 0,
+                "args": {"name": "screen_recorder"},
+            }
+        ]
+        out += [
+            {
+                "ph": "M",
+                "name": "thread_name",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in list(self._threads.items())
+        ]
+        for ph, name, cat, ts, extra, tid in list(self.events):
+            event = {
+                "ph": ph,
+                "name": name,
+                "cat": cat,
+                "pid": pid,
+                "tid": tid,
+                "ts": round((ts - self._t0) * 1e6, 3),
+            }
+            if ph == "X":
+                event["dur"] = round(extra * 1e6, 3)
+            elif ph == "C":
+                event["args"] = extra
+            else:
+                event["s"] = "t"
+            out.append(event)
+        return {"traceEvents": out, "displayTimeUnit": "ms"}
+
+    def dump(self, path: str) -> None:
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f, separators=(",", ":"))
+
+
+# ----------------------- ADAPTIVE QUALITY -----------------------
+@dataclass
+class QualityLevel:
+    """One rung of the degradation ladder."""
+
+    stride: int  # grab every stride-th frame slot; the rest are duplicates
+    preset: Optional[str] = None  # x264 preset, None when the writer cannot switch
+
+    def describe(self, fps: float) -> str:
+        text = f"{fps / self.stride:g} fps"
+        return f"{text}, {self.preset}" if self.preset else text
+
+
+def quality_ladder(preset: Optional[str] = None) -> list:
+    """Levels from best to cheapest: half the frame rate first, then faster x264
+    presets (only when `preset` is given, i.e. the writer can switch).
+    """
+    levels = [QualityLevel(1, preset), QualityLevel(2, preset)]
+    if preset in X264_PRESETS:
+        faster = X264_PRESETS[: X264_PRESETS.index(preset)]
+        levels += [QualityLevel(2, p) for p in reversed(faster)]
+    return levels
+
+
+class QualityController:
+    """
+    Closed loop over a quality ladder, fed one stats record per second. The load is
+    the utilization of the busiest pipeline thread (grab, process or write time per
+    second of wall time; the stages run concurrently). Steps down after
+    OVERLOAD_TICKS overloaded seconds (load above HIGH_LOAD, frames dropped or
+    capture falling behind); steps back up after HEADROOM_TICKS seconds in which
+    the next better level is predicted to stay under TARGET_LOAD. No change
+    happens within COOLDOWN seconds of the previous one.
+    """
+
+    OVERLOAD_TICKS = 2
+    HEADROOM_TICKS = 5
+    COOLDOWN = 3.0
+    HIGH_LOAD = 0.85
+    TARGET_LOAD = 0.6
+    WARMUP_TICKS = 2  # the first seconds include encoder start-up
+
+    def __init__(self, ladder: list, fps: float) -> None:
+        self.ladder = ladder
+        self.fps = float(fps)
+        self.level = 0
+        self._over = 0
+        self._under = 0
+        self._ticks = 0
+        self._last_update: Optional[float] = None
+        self._last_change = float("-inf")
+
+    @property
+    def current(self) -> QualityLevel:
+        return self.ladder[self.level]
+
+    def _growth(self, better: QualityLevel, current: QualityLevel) -> float:
+        """Rough factor by which the load grows going from `current` to `better`."""
+        factor = current.stride / better.stride
+        return factor * (2.0 if better.preset != current.preset else 1.0)
+
+    def update(self, stats: dict, now: float) -> Optional[str]:
+        """Feed one stats record; returns the reason when the level changed."""
+        self._ticks += 1
+        elapsed = now - self._last_update if self._last_update is not None else 0.0
+        self._last_update = now
+        stages = stats.get("stages")
+        if self._ticks <= self.WARMUP_TICKS or not stages or elapsed <= 0:
+            return None
+
+        def busy(*names):
+            ms = sum(stages[n]["count"] * stages[n]["mean_ms"] for n in names)
+            return ms / 1000.0 / elapsed
+
+        level = self.current
+        load = max(busy("grab"), busy("convert", "overlay", "resize"), busy("write"))
+        expected_fps = self.fps / level.stride
+        behind = stats["capture_fps"] < 0.85 * expected_fps
+        dropped = stats["dropped_per_s"]
+        if dropped or behind or load > self.HIGH_LOAD:
+            self._over += 1
+            self._under = 0
+        elif (
+            self.level > 0
+            and load * self._growth(self.ladder[self.level - 1], level)
+            < self.TARGET_LOAD
+        ):
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = self._under = 0
+        if now - self._last_change < self.COOLDOWN:
+            return None
+        capture = f"{stats['capture_fps']:.1f}/{expected_fps:g} fps"
+        detail = f"load {load:.0%}, capture {capture}, dropped {dropped}/s"
+        if self._over >= self.OVERLOAD_TICKS and self.level < len(self.ladder) - 1:
+            self.level += 1
+            reason = f"overloaded ({detail})"
+        elif self._under >= self.HEADROOM_TICKS and self.level > 0:
+            self.level -= 1
+            reason = f"headroom ({detail})"
+        else:
+            return None
+        self._over = self._under = 0
+        self._last_change = now
+        return reason
+
+
+# ----------------------- RECORDING ENGINE -----------------------
+@dataclass
+class RecorderConfig:
+    """Settings for one recording session.
+    show_cursor, show_clicks and follow_fullscreen may be changed while recording.
+    """
+
+    output_path: str
+    bbox: BBox
+    # (w, h); defaults to the bbox size after output scaling
+    writer_size: Optional[Tuple[int, int]] = None
+    output_scale: float = 1.0  # e.g. 0.5 records a 4K area as 1080p
+    output_max_width: Optional[int] = None  # additionally fit the output to this width
+    target_fps: float = 30.0
+    queue_depth: int = 4
+    drop_policy: str = DROP_OLDEST
+    show_cursor: bool = True
+    show_clicks: bool = True
+    follow_fullscreen: bool = False
+    source: Optional[FrameSource] = None  # defaults to live screen capture (mss)
+    encoder: str = ENCODER_AUTO  # see ENCODERS
+    # what 'auto' picks the fastest backend from (ENCODER_PROFILES)
+    encoder_profile: str = PROFILE_DEFAULT
+    x264_preset: str = "veryfast"
+    crf: int = 23  # x264 quality (lower = better, bigger)
+    skip_unchanged: bool = True  # reuse the previous frame when nothing changed
+    # write each distinct frame once + a timecode sidecar instead of CFR duplicates
+    vfr: bool = False
+    frame_index: bool = True  # '<output>.idx' seek index per file (see FrameIndex)
+    change_tile: int = 64
+    change_stride: int = 1  # >1 samples pixels (cheaper, may miss thin changes)
+    encode_workers: int = 0  # >1 encodes GOP-sized chunks in that many processes
+    chunk_seconds: float = 2.0
+    # Rolling segments: start a new file every N seconds and/or N MB (0 = off)
+    segment_seconds: float = 0.0
+    segment_mb: float = 0.0
+    segment_template: Optional[str] = None  # strftime/{seq} template (output_path)
+    # Instant replay: keep the last N seconds in memory (no file) until save_replay()
+    # (0 = off)
+    replay_seconds: float = 0.0
+    replay_mb: float = 512.0
+    replay_quality: int = 80  # JPEG quality of buffered frames
+    # per-second stage latencies as JSON lines, or Prometheus text for *.prom
+    metrics_path: Optional[str] = None
+    # Chrome trace-event JSON of the last trace_events spans, written at stop
+    trace_path: Optional[str] = None
+    # trade frame rate and x264 preset for smooth output under load
+    adaptive_quality: bool = False
+    # Capture now, encode later: frames go to a memory-mapped spool that
+    # SpoolTranscoder encodes after stop
+    spool: bool = False
+    spool_codec: str = SPOOL_AUTO  # see SPOOL_CODECS
+    trace_events: int = 200000
+
+
+class RecorderEngine:
+    """
+    Headless capture/encode state machine: start() -> pause()/resume() -> stop().
+    Needs no Tk; GUI and CLI are thin clients. Callbacks are invoked from worker
+    threads: on_status(text), on_stats(dict), on_bbox_changed(BBox), on_finished().
+    """
+
+    def __init__(
+        self,
+        config: RecorderConfig,
+        on_status: Optional[Callable[[str], None]] = None,
+        on_stats: Optional[Callable[[dict], None]] = None,
+        on_bbox_changed: Optional[Callable[[BBox], None]] = None,
+        on_finished: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.config = config
+        self.on_status = on_status
+        self.on_stats = on_stats
+        self.on_bbox_changed = on_bbox_changed
+        self.on_finished = on_finished
+
+        # State flags
+        self.is_recording = False
+        self.is_paused = False
+        self.stop_event = threading.Event()
+        self.record_thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+        # Capture region and writer
+        self.capture_bbox: Optional[BBox] = config.bbox
+        self.writer = None  # cv2.VideoWriter or FfmpegPipeWriter
+        self._single_writer_noted = False  # encode_workers fell back to one writer
+        self.output_path = config.output_path  # final file (.mkv after a VFR mux)
+        self.segment_paths: list = []  # every file written when segmenting
+        self.replay: Optional[ReplayRing] = None  # set in instant-replay mode
+        self.replay_paths: list = []
+        self._replay_threads: list = []
+        self.spool: Optional[FrameSpool] = None  # set in encode-later mode
+        self.spool_path: Optional[str] = None  # kept after stop for the transcoder
+        self.timecodes_path: Optional[str] = None
+        self._timecodes: Optional[TimecodeWriter] = None
+        self._index_clock: Optional[IndexClock] = None
+        self._vfr_last: Optional[FramePacket] = None
+        self.encoder_name: Optional[str] = None
+        # backends to try, best first (ranked by benchmark for 'auto')
+        self._encoders: list = []
+        self.writer_size: Tuple[int, int] = config.writer_size or scaled_size(
+            config.bbox.width,
+            config.bbox.height,
+            config.output_scale,
+            config.output_max_width,
+        )
+        self.target_fps = float(config.target_fps)
+        self.source: FrameSource = config.source or MssFrameSource()
+
+        # Pipeline: capture -> process (convert/overlay/resize) -> encode, joined by
+        # bounded queues
+        self.queue_depth = config.queue_depth
+        self.drop_policy = config.drop_policy
+        self._process_queue: Optional[FrameQueue] = None
+        self._encode_queue: Optional[FrameQueue] = None
+        self._stage_threads: list = []
+        # Reused frame storage: full-size BGR (capture bbox) and writer-sized BGR
+        self._capture_pool = FrameBufferPool()
+        self._sized_pool = FrameBufferPool()
+        self._scaled_pool = FrameBufferPool()  # grabs downscaled before conversion
+        self._interp_cache: dict = {}  # ((w0, h0), (w, h)) -> cv2 interpolation flag
+        self._last_frame_buf: Optional[FrameBuffer] = None
+        # latest_frame() readers vs. the process stage
+        self._last_frame_lock = threading.Lock()
+        self._last_frame_seq = 0  # bumped per new processed frame (not for reused ones)
+        # Static-frame short-circuit: previous writer-sized output and its overlay state
+        self._change_detector = ChangeDetector(
+            config.change_tile,
+            config.change_stride,
+            refresh_every=int(round(self.target_fps)),
+        )
+        self._last_sized_buf: Optional[FrameBuffer] = None
+        self._last_overlay_key: Optional[tuple] = None
+
+        # Frame scheduling to keep CFR duration matching timer
+        self._scheduler = FrameScheduler(self.target_fps)
+        self._paused_at: Optional[float] = None
+        self._last_frame_bgr: Optional[np.ndarray] = None
+        # Media clock (wall time minus pauses) for VFR timestamps
+        self._t_start = 0.0
+        self._paused_total = 0.0
+        self._t_media_end: Optional[float] = None
+
+        # Stats counters
+        self._capture_count_current = 0
+        self._write_count_current = 0
+        self._dup_count_current = 0
+        self._unchanged_count_current = 0
+        self._processed_count_current = 0
+        self._tiles_changed_sum = 0.0
+        self._dropped_reported = 0
+        self._last_stats_time = time.monotonic()
+        # Per-stage latency histograms and their optional file export
+        self.metrics = PipelineMetrics()
+        self._metrics_exporter: Optional[MetricsExporter] = None
+        # Opt-in timeline (config.trace_path); clients may add their own spans to it
+        self.trace: Optional[TraceRecorder] = None
+
+        # Mouse tracking state (written by the listener thread; tuple/slot swaps need
+        # no lock)
+        self._mouse_pos_abs: Tuple[int, int] = (0, 0)
+        self._clicks = ClickRing()
+        self._sprites = OverlaySprites.shared()
+        self._mouse_listener = None
+
+        # Follow-fullscreen tracker (started on first use)
+        self._window_tracker: Optional[ActiveWindowTracker] = None
+
+        # Adaptive quality controller
+        self._quality: Optional[QualityController] = None
+        self.quality_log: list = []  # {"time", "level", "setting", "reason"} per change
+
+    # ----------------------- CONTROL -----------------------
+    def start(self) -> None:
+        """Open the writer and start the pipeline threads.
+        Raises RuntimeError if the video writer cannot be created.
+        """
+        if self.is_recording:
+            return
+        out_dir = os.path.dirname(self.config.output_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        segmenting = self.config.segment_seconds > 0 or self.config.segment_mb > 0
+        if segmenting and self.config.vfr:
+            raise RuntimeError(
+                "Segmented output cannot be combined with variable frame rate."
+            )
+        if self.config.spool and (
+            segmenting or self.config.vfr or self.config.replay_seconds > 0
+        ):
+            raise RuntimeError(
+                "Encode-later spooling cannot be combined with segments, variable "
+                "frame rate or instant replay."
+            )
+        if self.config.encoder == ENCODER_AUTO:
+            self._encoders = rank_encoders(
+                self.writer_size, self.config.encoder_profile, self.config.x264_preset
+            )
+        else:
+            self._encoders = [self.config.encoder]
+        # Codecs such as MJPEG or FFV1 cannot go into .mp4; switch to one they fit
+        self.output_path = encoder_output_path(
+            self.config.output_path, self._encoders[0]
+        )
+        self.replay = None
+        self.spool = None
+        self.spool_path = None
+        indexed = (
+            self.config.frame_index
+            and self.config.replay_seconds <= 0
+            and not self.config.spool
+        )
+        self._index_clock = IndexClock() if indexed else None
+        if self.config.replay_seconds > 0:
+            # Nothing is written until save_replay(); frames live in a bounded ring
+            self.writer = None
+            self.replay = ReplayRing(
+                self.config.replay_seconds,
+                int(self.config.replay_mb * 1024 * 1024),
+                quality=self.config.replay_quality,
+            )
+        elif self.config.spool:
+            self.writer = None
+            self.spool_path = spool_path_for(self.output_path)
+            meta = {
+                "ext": os.path.splitext(self.output_path)[1] or ".mp4",
+                "encoder": self._encoders[0],
+                "preset": self.config.x264_preset,
+                "crf": self.config.crf,
+            }
+            try:
+                self.spool = FrameSpool(
+                    self.spool_path,
+                    self.writer_size,
+                    self.target_fps,
+                    self.config.spool_codec,
+                    meta=meta,
+                )
+            except OSError as e:
+                raise RuntimeError(f"Failed to create spool {self.spool_path}: {e}")
+            self.encoder_name = f"spool ({self.spool.codec})"
+        elif segmenting:
+            self.writer = SegmentedWriter(
+                encoder_output_path(
+                    self.config.segment_template or self.config.output_path,
+                    self._encoders[0],
+                ),
+                self.target_fps,
+                self._open_writer,
+                max_seconds=self.config.segment_seconds,
+                max_bytes=int(self.config.segment_mb * 1024 * 1024),
+            )
+            if not self.writer.isOpened():
+                self.writer = None
+            else:
+                self.segment_paths = self.writer.paths
+                self.output_path = self.segment_paths[0]
+        else:
+            self.writer = self._open_writer(
+                self.output_path, switchable_preset=self.config.adaptive_quality
+            )
+        if self.writer is None and self.replay is None and self.spool is None:
+            raise RuntimeError(
+                f"Failed to create video writer ({self.encoder_name}). "
+                "Check codec and permissions."
+            )
+        if self.config.vfr and self.replay is None:
+            self.timecodes_path = (
+                os.path.splitext(self.output_path)[0] + ".timecodes.txt"
+            )
+            self._timecodes = TimecodeWriter(self.timecodes_path)
+
+        self.is_recording = True
+        self.is_paused = False
+        self.last_error = None
+        self.stop_event.clear()
+        self._dropped_reported = 0
+        self._last_stats_time = time.monotonic()
+        self.metrics = PipelineMetrics()
+        if self.config.metrics_path:
+            self._metrics_exporter = MetricsExporter(
+                self.config.metrics_path, self.metrics
+            )
+            self._metrics_exporter.start()
+        self.trace = (
+            TraceRecorder(self.config.trace_events) if self.config.trace_path else None
+        )
+        self.quality_log = []
+        self._quality = None
+        self._apply_quality(QualityLevel(1))
+        if self.config.adaptive_quality:
+            base = getattr(self.writer, "inner", self.writer)  # under an IndexedWriter
+            preset = base.preset if isinstance(base, PresetSwitchWriter) else None
+            self._quality = QualityController(quality_ladder(preset), self.target_fps)
+
+        # Initialize frame schedule
+        self._t_start = time.monotonic()
+        self._paused_total = 0.0
+        self._t_media_end = None
+        self._scheduler.start(self._t_start)
+        self._paused_at = None
+
+        self._start_mouse_listener()
+        self.record_thread = threading.Thread(
+            target=self._record_loop, name="ScreenRecorderThread", daemon=True
+        )
+        self.record_thread.start()
+        startup_profile.mark("recording started")
+
+    def _open_writer(self, path: str, switchable_preset: bool = False):
+        """Open one output file with the first resolved encoder that works, or None."""
+        ext = os.path.splitext(path)[1].lower()
+        failed = []
+        for name in self._encoders:
+            backend = ENCODER_REGISTRY.get(name)
+            if failed and backend is not None and ext not in backend.containers:
+                continue  # a fallback must fit the file name already chosen
+            writer, self.encoder_name = open_video_writer(
+                path,
+                self.target_fps,
+                self.writer_size,
+                encoder=name,
+                preset=self.config.x264_preset,
+                crf=self.config.crf,
+                workers=self.config.encode_workers,
+                chunk_seconds=self.config.chunk_seconds,
+                switchable_preset=switchable_preset,
+            )
+            if writer is not None:
+                if failed:
+                    self._status(
+                        f"Encoder {', '.join(failed)} could not be opened; "
+                        f"using {self.encoder_name}"
+                    )
+                    # later segments skip the encoders that failed
+                    self._encoders = self._encoders[self._encoders.index(name) :]
+                if (
+                    self.config.encode_workers > 1
+                    and not self._single_writer_noted
+                    and not isinstance(writer, ParallelSegmentWriter)
+                ):
+                    self._single_writer_noted = True
+                    reason = (
+                        "needs ffmpeg"
+                        if shutil.which("ffmpeg") is None
+                        else f"is not available for {self.encoder_name}"
+                    )
+                    self._status(f"Parallel encoding {reason}; using a single writer")
+                if self._index_clock is not None:
+                    backend = ENCODER_REGISTRY.get(name)
+                    intra_only = (QUALITY_INTRA, QUALITY_LOSSLESS)
+                    intra = backend is not None and backend.quality in intra_only
+                    try:
+                        writer = IndexedWriter(
+                            writer,
+                            path,
+                            self.target_fps,
+                            self._index_clock,
+                            vfr=self.config.vfr,
+                            all_keyframes=intra,
+                        )
+                    except OSError as e:
+                        self._status(f"Recording without a seek index: {e}")
+                return writer
+            failed.append(name)
+        self.encoder_name = ", ".join(failed)
+        return None
+
+    def pause(self) -> None:
+        if not self.is_recording or self.is_paused:
+            return
+        self.is_paused = True
+        # Note pause moment to shift schedule on resume
+        self._paused_at = time.monotonic()
+        if self._index_clock is not None:
+            self._index_clock.mark(INDEX_PAUSE, self._paused_at)
+        self._scheduler.wake()
+        if self.trace is not None:
+            self.trace.instant("pause")
+
+    def resume(self) -> None:
+        if not self.is_recording or not self.is_paused:
+            return
+        now = time.monotonic()
+        if self._index_clock is not None:
+            self._index_clock.mark(INDEX_RESUME, now)
+        # Shift the schedule by the paused duration to keep timeline contiguous
+        if self._paused_at is not None:
+            paused_dur = max(0.0, now - self._paused_at)
+            self._paused_total += paused_dur
+            self._scheduler.shift(paused_dur)
+        self._paused_at = None
+        self.is_paused = False
+        self._last_stats_time = time.monotonic()  # paused time is not a capture stall
+        self._scheduler.wake()
+        if self.trace is not None:
+            self.trace.instant("resume")
+
+    def save_replay(self, path: Optional[str] = None) -> Optional[str]:
+        """Write the instant-replay buffer to `path` (default:
+        '<output>_replay_<time>.mp4') on a background thread; recording continues.
+        Returns the path, or None if not in replay mode or nothing is buffered yet.
+        """
+        ring = self.replay
+        if ring is None:
+            return None
+        t_end = self._media_time(time.monotonic())
+        frames = ring.snapshot()
+        if not frames:
+            self._status("Replay buffer is empty")
+            return None
+        encoder = self._encoders[0] if self._encoders else self.config.encoder
+        if path is None:
+            base, ext = os.path.splitext(self.output_path)
+            stamp = datetime.datetime.now().strftime("_replay_%Y-%m-%d_%H-%M-%S")
+            path = base + stamp + (ext or ".mp4")
+
+        def _save() -> None:
+            try:
+                write_replay(
+                    frames,
+                    path,
+                    self.target_fps,
+                    self.writer_size,
+                    t_end,
+                    ring.seconds,
+                    encoder=encoder,
+                    preset=self.config.x264_preset,
+                    crf=self.config.crf,
+                )
+            except Exception as e:
+                self._status(f"Saving replay failed: {e}")
+                return
+            self.replay_paths.append(path)
+            self._status(f"Replay saved: {path}")
+
+        self._status("Saving replay...")
+        t = threading.Thread(target=_save, name="ScreenRecorderReplaySave", daemon=True)
+        t.start()
+        self._replay_threads = [x for x in self._replay_threads if x.is_alive()] + [t]
+        return path
+
+    def wait_for_replays(self, timeout: Optional[float] = None) -> None:
+        """Block until replays being saved in the background are written."""
+        for t in list(self._replay_threads):
+            t.join(timeout)
+
+    def pacing_summary(self) -> dict:
+        """How late frames were grabbed against their schedule slots (see
+        FrameScheduler.summary)."""
+        return self._scheduler.summary()
+
+    def _media_time(self, now: float) -> float:
+        """Recording time at monotonic `now`, excluding pauses."""
+        paused = self._paused_total
+        if self._paused_at is not None:
+            paused += max(0.0, now - self._paused_at)
+        return now - self._t_start - paused
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop capturing, drain the pipeline and finalize the output file."""
+        if self.record_thread is None and not self.is_recording:
+            return
+        self.stop_event.set()
+        self._scheduler.wake()
+        if self.trace is not None:
+            self.trace.instant("stop")
+        try:
+            if self.record_thread and self.record_thread.is_alive():
+                self.record_thread.join(timeout=timeout)
+        except Exception:
+            pass
+        finally:
+            self.record_thread = None
+            self.is_recording = False
+            self.is_paused = False
+
+        # Release writer
+        try:
+            if self.writer is not None:
+                self.writer.release()
+                self._finalize_output()
+            self._close_spool()
+        finally:
+            self.writer = None
+        self._stop_mouse_listener()
+        self._stop_window_tracker()
+
+    def _finalize_output(self) -> None:
+        """After the writer is released: mux the VFR timestamps in when possible."""
+        if self._timecodes is None:
+            return
+        self._timecodes.close()
+        self._timecodes = None
+        mkv = mux_timecodes_mkv(self.output_path, self.timecodes_path)
+        if mkv is not None:
+            # The nominal-rate file plays at the wrong speed alone; keep only the mux
+            try:
+                os.remove(self.output_path)
+            except OSError:
+                pass
+            self._move_index(self.output_path, mkv)
+            self.output_path = mkv
+
+    @staticmethod
+    def _move_index(old_video: str, new_video: str) -> None:
+        # Same stream in a new container: frames and keyframes hold, byte offsets do not
+        old = index_path_for(old_video)
+        if not os.path.exists(old):
+            return
+        try:
+            header, records = read_frame_index(old)
+            records["offset"] = 0
+            header.update(video=os.path.basename(new_video), offsets=False)
+            write_frame_index(index_path_for(new_video), header, records)
+            os.remove(old)
+        except (OSError, ValueError):
+            pass
+
+    def _close_spool(self) -> None:
+        spool, self.spool = self.spool, None
+        if spool is not None:
+            spool.close()
+
+    def _status(self, text: str) -> None:
+        if self.on_status is not None:
+            self.on_status(text)
+
+    def _fail(self, exc: Exception) -> None:
+        # Surface the error and make every stage wind down
+        self.last_error = str(exc)
+        self._status(f"Error: {exc}")
+        self.stop_event.set()
+        self._scheduler.wake()
+
+    # ----------------------- RECORDING LOOP -----------------------
+    def _record_loop(self) -> None:
+        """
+        Runs in a background thread and drives the capture stage of the pipeline:
+          capture (this thread) -> process worker -> encoder thread
+        Stages are joined by bounded FrameQueues so a slow VideoWriter.write never
+        delays the next grab; when a queue is full its drop policy applies and the
+        lost writer slots are folded into the next frame as duplicates.
+        - Caps FPS to ~target_fps.
+        - Honors pause without tearing down the writer.
+        - If "Follow Full Screen" is enabled, periodically updates the capture bbox
+          (writer frame size stays constant; frames are resized to writer_size if
+          needed).
+        """
+        self._process_queue = FrameQueue(self.queue_depth, self.drop_policy)
+        self._encode_queue = FrameQueue(self.queue_depth, self.drop_policy)
+        self._stage_threads = [
+            threading.Thread(
+                target=self._process_loop, name="ScreenRecorderProcess", daemon=True
+            ),
+            threading.Thread(
+                target=self._encode_loop, name="ScreenRecorderEncoder", daemon=True
+            ),
+        ]
+        for t in self._stage_threads:
+            t.start()
+
+        try:
+            self._capture_loop()
+        except Exception as e:
+            # Ensure UI reflects failure and we attempt a clean stop
+            self._fail(e)
+        finally:
+            # Let downstream stages drain what was already captured
+            self._process_queue.close()
+            for t in self._stage_threads:
+                t.join(timeout=5.0)
+            self._stage_threads = []
+            # Safe release in case of exceptions
+            try:
+                if self.writer is not None:
+                    self.writer.release()
+                    self._finalize_output()
+                self._close_spool()
+            except Exception as e:
+                self._fail(e)
+            finally:
+                self.writer = None
+                self.is_recording = False
+                self.is_paused = False
+                self.stop_event.set()
+                self._close_metrics()
+                self._dump_trace()
+                self._stop_mouse_listener()
+                self._stop_window_tracker()
+                if self.on_finished is not None:
+                    self.on_finished()
+
+    def _capture_loop(self) -> None:
+        """Capture stage: grabs on the CFR schedule, hands frames to processing.
+        Each packet carries how many writer slots elapsed since the previous one, so
+        the encoder can keep the video duration matching the timer on its own.
+        """
+        scheduler = self._scheduler
+        trace = self.trace
+        seq = 0
+
+        with self.source as source:
+            while not self.stop_event.is_set():
+                if self.is_paused:
+                    # Don't capture or write frames; sleep until resume/stop wakes us
+                    scheduler.idle(0.5 if self.config.follow_fullscreen else None)
+                    # Optionally still respond to follow fullscreen
+                    if self.config.follow_fullscreen:
+                        self._maybe_update_bbox_follow()
+                    continue
+
+                # Follow full-screen window if enabled (cheap: reads the tracker's
+                # cached state)
+                if self.config.follow_fullscreen:
+                    self._maybe_update_bbox_follow()
+
+                bbox = self.capture_bbox
+                if bbox is None:
+                    scheduler.idle(0.05)
+                    continue
+
+                # Sleep (then spin briefly) until the next frame is due
+                t_wait = time.monotonic()
+                on_time = scheduler.wait()
+                if trace is not None:
+                    trace.complete("wait", t_wait, time.monotonic())
+                if not on_time:
+                    continue  # woken by pause/resume/stop
+
+                # Capture frame
+                t_grab = time.monotonic()
+                try:
+                    frame = source.grab(bbox)
+                except EOFError:
+                    break  # finite replay source ran out
+                now = time.monotonic()
+
+                # Count the writer slots that are due to keep CFR duration
+                repeats = scheduler.advance(t_grab, now)
+                if repeats == 0:
+                    continue  # schedule moved (resume) while grabbing
+                self.metrics.observe("grab", now - t_grab)
+                if trace is not None:
+                    trace.complete("grab", t_grab, now)
+
+                seq += 1
+                if seq == 1:
+                    startup_profile.mark("first frame captured")
+                packet = FramePacket(
+                    seq, now, repeats, bbox, frame, t_media=self._media_time(now)
+                )
+                self._process_queue.put(packet, self.stop_event)
+                # Update capture count and maybe refresh stats overlay
+                self._capture_count_current += 1
+                self._maybe_update_stats()
+        self._t_media_end = self._media_time(time.monotonic())
+
+    def _process_loop(self) -> None:
+        """Process stage: BGRA->BGR, cursor/click overlay and resize to writer_size.
+        When the output is smaller than the capture, the grab is downscaled first so
+        conversion and overlay run on the small frame; upscaling happens last.
+        """
+        try:
+            while True:
+                try:
+                    packet = self._process_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if packet is None:
+                    break
+                w, h = int(self.writer_size[0]), int(self.writer_size[1])
+                trace = self.trace
+                self._processed_count_current += 1
+                if self.config.skip_unchanged:
+                    t_check = time.monotonic()
+                    changed, tiles = self._change_detector.check(packet.frame)
+                    if trace is not None:
+                        trace.complete("change_detect", t_check, time.monotonic())
+                    self._tiles_changed_sum += tiles
+                    overlay_key = self._overlay_key(packet.bbox)
+                    last = self._last_sized_buf
+                    if (
+                        not changed
+                        and overlay_key is not None
+                        and overlay_key == self._last_overlay_key
+                        and last is not None
+                        and last.array.shape == (h, w, 3)
+                    ):
+                        # Static screen: reuse the previous processed frame as is
+                        packet.buffer = last.retain()
+                        packet.frame = last.array
+                        packet.reused = True
+                        self._unchanged_count_current += 1
+                        self._encode_queue.put(packet, self.stop_event)
+                        continue
+                    self._last_overlay_key = overlay_key
+
+                metrics = self.metrics
+                src = packet.frame
+                h0, w0 = src.shape[:2]
+                scaled = None
+                t0 = time.monotonic()
+                if w * h < w0 * h0:
+                    # Downscale right after the grab; everything below works on the
+                    # small frame
+                    scaled = self._scaled_pool.acquire((h, w, src.shape[2]))
+                    cv2.resize(
+                        src,
+                        (w, h),
+                        dst=scaled.array,
+                        interpolation=self._interpolation(w0, h0, w, h),
+                    )
+                    src = scaled.array
+                    h0, w0 = h, w
+                t1 = time.monotonic()
+                pool = self._sized_pool if scaled is not None else self._capture_pool
+                full = pool.acquire((h0, w0, 3))
+                if src.shape[2] == 4:
+                    cv2.cvtColor(src, cv2.COLOR_BGRA2BGR, dst=full.array)  # BGRA -> BGR
+                else:
+                    np.copyto(full.array, src)  # already BGR (replay sources)
+                if scaled is not None:
+                    scaled.release()
+                t2 = time.monotonic()
+                metrics.observe("convert", t2 - t1)
+                # Overlay cursor and clicks if enabled
+                self._draw_cursor_and_clicks(full.array, packet.bbox)
+                self._set_last_frame(full)
+                t3 = time.monotonic()
+                metrics.observe("overlay", t3 - t2)
+
+                # Prepare sized frame once; duplicates reuse it
+                if (w0 != w) or (h0 != h):
+                    sized = self._sized_pool.acquire((h, w, 3))
+                    cv2.resize(
+                        full.array,
+                        (w, h),
+                        dst=sized.array,
+                        interpolation=self._interpolation(w0, h0, w, h),
+                    )
+                    full.release()
+                    packet.buffer = sized
+                else:
+                    packet.buffer = full
+                t4 = time.monotonic()
+                metrics.observe("resize", (t1 - t0) + (t4 - t3))
+                if trace is not None:
+                    if scaled is not None:
+                        trace.complete("downscale", t0, t1)
+                    trace.complete("convert", t1, t2)
+                    trace.complete("overlay", t2, t3)
+                    if packet.buffer is not full:
+                        trace.complete("resize", t3, t4)
+                packet.frame = packet.buffer.array
+                if self.config.skip_unchanged:
+                    self._set_last_sized(packet.buffer)
+                self._encode_queue.put(packet, self.stop_event)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._encode_queue.close()
+            self._set_last_frame(None)
+            self._set_last_sized(None)
+            self._change_detector.reset()
+
+    def _interpolation(self, w0: int, h0: int, w: int, h: int) -> int:
+        key = ((w0, h0), (w, h))
+        interp = self._interp_cache.get(key)
+        if interp is None:
+            interp = cv2.INTER_AREA if (w0 > w or h0 > h) else cv2.INTER_LINEAR
+            self._interp_cache[key] = interp
+        return interp
+
+    def _set_last_sized(self, buf: Optional[FrameBuffer]) -> None:
+        """Keep the last writer-sized output for reuse on unchanged frames."""
+        if buf is not None:
+            buf.retain()
+        prev = self._last_sized_buf
+        self._last_sized_buf = buf
+        if prev is not None:
+            prev.release()
+
+    def _overlay_key(self, bbox: BBox) -> Optional[tuple]:
+        """What the cursor/click overlay depends on, or None while ripples animate."""
+        pos = self._mouse_pos_abs
+        animating = self.config.show_clicks and bool(
+            self._clicks.active(time.monotonic())
+        )
+        if animating:
+            return None
+        return (
+            bbox.left,
+            bbox.top,
+            bbox.width,
+            bbox.height,
+            self.config.show_cursor and pos,
+        )
+
+    def _set_last_frame(self, buf: Optional[FrameBuffer]) -> None:
+        """Keep a reference to the most recent processed full-size frame."""
+        if buf is not None:
+            buf.retain()
+        with self._last_frame_lock:
+            prev = self._last_frame_buf
+            self._last_frame_buf = buf
+            self._last_frame_seq += 1
+            self._last_frame_bgr = buf.array if buf is not None else None
+        if prev is not None:
+            prev.release()
+
+    def latest_frame(self) -> Optional[FrameBuffer]:
+        """The most recent processed full-size BGR frame, or None. The buffer is
+        retained for the caller, who must release() it; until then the pool cannot
+        hand it to the next frame.
+        """
+        with self._last_frame_lock:
+            buf = self._last_frame_buf
+            return buf.retain() if buf is not None else None
+
+    def latest_frame_seq(self) -> int:
+        """A number that changes whenever latest_frame() has something new; frames
+        the process stage reused for a static screen do not count.
+        """
+        return self._last_frame_seq
+
+    def _encode_loop(self) -> None:
+        """Encoder stage: writes each frame once per writer slot it covers (CFR),
+        or in VFR mode once per distinct frame together with its timestamp.
+        """
+        try:
+            while True:
+                try:
+                    packet = self._encode_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if packet is None:
+                    break
+                writer = self.writer
+                t0 = time.monotonic()
+                if self._index_clock is not None:
+                    self._index_clock.stamp(packet.t_capture, packet.t_media)
+                if self.replay is not None:
+                    self._add_replay(packet)
+                elif self.spool is not None:
+                    self.spool.add(
+                        packet.frame, packet.t_media, packet.repeats, packet.reused
+                    )
+                    self._write_count_current += packet.repeats
+                    self._dup_count_current += packet.repeats - 1
+                elif writer is not None and self._timecodes is not None:
+                    self._write_vfr(writer, packet)
+                elif writer is not None:
+                    for i in range(packet.repeats):
+                        writer.write(packet.frame)
+                        self._write_count_current += 1
+                        if i > 0:
+                            self._dup_count_current += 1
+                now = time.monotonic()
+                # Includes back-pressure from the encoder process and the disk behind it
+                self.metrics.observe("write", now - t0)
+                self.metrics.observe("total", now - packet.t_capture)
+                if self.trace is not None:
+                    self.trace.complete("write", t0, now)
+                if packet.seq == 1:
+                    startup_profile.mark("first frame written")
+                packet.release()
+            self._finish_vfr()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if self._vfr_last is not None:
+                self._vfr_last.release()
+                self._vfr_last = None
+
+    def _add_replay(self, packet: FramePacket) -> None:
+        # Only distinct frames are compressed; a static screen costs nothing
+        if packet.reused and len(self.replay):
+            return
+        self.replay.add(packet.t_media, packet.frame)
+        self._write_count_current += 1
+
+    def _write_vfr(self, writer, packet: FramePacket) -> None:
+        if packet.reused and self._vfr_last is not None:
+            return  # unchanged: the previous frame simply lasts longer
+        writer.write(packet.frame)
+        self._timecodes.add(packet.t_media)
+        self._write_count_current += 1
+        # Keep the last distinct frame to close the timeline at stop
+        if self._vfr_last is not None:
+            self._vfr_last.release()
+        self._vfr_last = FramePacket(
+            packet.seq,
+            packet.t_capture,
+            1,
+            packet.bbox,
+            packet.frame,
+            buffer=packet.buffer.retain() if packet.buffer else None,
+            t_media=packet.t_media,
+        )
+
+    def _finish_vfr(self) -> None:
+        # Repeat the last frame at the stop time so it is shown until the end
+        last, end = self._vfr_last, self._t_media_end
+        if (
+            self._timecodes is None
+            or last is None
+            or end is None
+            or self.writer is None
+        ):
+            return
+        if end > last.t_media + 1e-3:
+            if self._index_clock is not None:
+                self._index_clock.stamp(last.t_capture + end - last.t_media, end)
+            self.writer.write(last.frame)
+            self._timecodes.add(end)
+
+    # -------------------- FOLLOW FULL SCREEN (X11) --------------------
+    def _maybe_update_bbox_follow(self) -> None:
+        """Follow the active full-screen window (X11, best-effort).
+        The tracker is started on first use and keeps its own X connection; here we
+        only read its cached result and update capture_bbox when it changed.
+        """
+        tracker = self._window_tracker
+        if tracker is None:
+            tracker = self._window_tracker = ActiveWindowTracker()
+            tracker.trace = self.trace
+            tracker.start()
+        bbox = tracker.fullscreen_bbox
+        if bbox is None or bbox == self.capture_bbox:
+            return
+        if self.trace is not None:
+            self.trace.instant("follow_bbox_changed", "follow")
+        # Keep writer_size unchanged; frames are resized as needed
+        self.capture_bbox = bbox
+        # Let the client move its border overlay
+        if self.on_bbox_changed is not None:
+            self.on_bbox_changed(bbox)
 
-# GUI
-import tkinter as tk
-from tkinter import PhotoImage, ttk, messagebox, filedialog
+    def _stop_window_tracker(self) -> None:
+        if self._window_tracker is not None:
+            self._window_tracker.stop()
+            self._window_tracker = None
 
-# Capture and video
-import mss
-import cv2
-import numpy as np
-from collections import deque
+    # -------------------- MOUSE CURSOR & CLICKS --------------------
+    def _start_mouse_listener(self) -> None:
+        if self._mouse_listener is not None or not _have_pynput():
+            return
+        try:
 
-# Optional: global hotkeys and mouse events (may not be available in all envs)
-try:
-    from pynput import keyboard, mouse as pynput_mouse
-    _HAVE_PYNPUT = True
-except Exception:
-    _HAVE_PYNPUT = False
+            def on_move(x, y):
+                self._mouse_pos_abs = (x, y)
 
+            def on_click(x, y, button, pressed):
+                if pressed and self.config.show_clicks:
+                    self._clicks.add(time.monotonic(), x, y, "left" in str(button))
+                if pressed and self.trace is not None:
+                    self.trace.instant("mouse_click", "input")
 
-@dataclass
-class BBox:
-    left: int
-    top: int
-    width: int
-    height: int
+            self._mouse_listener = pynput_mouse.Listener(
+                on_move=on_move, on_click=on_click
+            )
+            self._mouse_listener.start()
+        except Exception:
+            self._mouse_listener = None
 
-    def as_mss(self):
+    def _stop_mouse_listener(self) -> None:
+        if self._mouse_listener is not None:
+            try:
+                self._mouse_listener.stop()
+            except Exception:
+                pass
+            self._mouse_listener = None
+
+    def _draw_cursor_and_clicks(self, frame_bgr: np.ndarray, bbox: BBox) -> np.ndarray:
+        h, w = frame_bgr.shape[:2]
+        sprites = self._sprites
+        # Frame may be downscaled relative to the capture area
+        sx = w / bbox.width if bbox.width else 1.0
+        sy = h / bbox.height if bbox.height else 1.0
+        # Cursor overlay: translate absolute to local bbox, draw if in bounds
+        mx, my = self._mouse_pos_abs
+        cx = int((mx - bbox.left) * sx)
+        cy = int((my - bbox.top) * sy)
+        if self.config.show_cursor and 0 <= cx < w and 0 <= cy < h:
+            sprites.blend(frame_bgr, sprites.cursor, cx, cy)
+        # Click ripples: expand and fade out over the ring's lifetime
+        if self.config.show_clicks:
+            now = time.monotonic()
+            for t0, rx, ry, is_left in self._clicks.active(now):
+                lx = int((rx - bbox.left) * sx)
+                ly = int((ry - bbox.top) * sy)
+                if 0 <= lx < w and 0 <= ly < h:
+                    sprites.blend(frame_bgr, sprites.ripple(now - t0, is_left), lx, ly)
+        return frame_bgr
+
+    # -------------------------- STATS --------------------------
+    def _maybe_update_stats(self, force: bool = False) -> None:
+        if (
+            self.on_stats is None
+            and self._metrics_exporter is None
+            and self.trace is None
+            and self._quality is None
+        ):
+            return
+        now = time.monotonic()
+        if now - self._last_stats_time < 1.0 and not force:
+            return
+        # Compute rates and reset counters
+        dt = now - self._last_stats_time
+        cap_fps = self._capture_count_current / dt if dt > 0 else 0.0
+        write_fps = self._write_count_current / dt if dt > 0 else 0.0
+        dup = self._dup_count_current
+        processed = self._processed_count_current
+        unchanged_pct = (
+            100.0 * self._unchanged_count_current / processed if processed else 0.0
+        )
+        tiles_pct = 100.0 * self._tiles_changed_sum / processed if processed else 0.0
+        dropped_total = sum(
+            q.dropped
+            for q in (self._process_queue, self._encode_queue)
+            if q is not None
+        )
+        dropped = dropped_total - self._dropped_reported
+        self._dropped_reported = dropped_total
+        self._capture_count_current = 0
+        self._write_count_current = 0
+        self._dup_count_current = 0
+        self._processed_count_current = 0
+        self._unchanged_count_current = 0
+        self._tiles_changed_sum = 0.0
+        self._last_stats_time = now
+        late_avg, late_max = self._scheduler.take_window()
+        stats = {
+            "capture_fps": cap_fps,
+            "write_fps": write_fps,
+            "dup_per_s": dup,
+            "dropped_per_s": dropped,
+            "unchanged_pct": unchanged_pct,
+            "tiles_changed_pct": tiles_pct,
+            "late_ms_avg": late_avg,
+            "late_ms_max": late_max,
+            "stages": self.metrics.take_window(),
+            "queue_depth": self._queue_stats("qsize"),
+            "dropped_total": self._queue_stats("dropped"),
+        }
+        spool = self.spool
+        if spool is not None:
+            stats["spool_mb"] = spool.nbytes / (1024 * 1024)
+        if self._quality is not None:
+            reason = self._quality.update(stats, now)
+            if reason is not None:
+                self._change_quality(self._quality.level, reason)
+            stats["quality"] = self._quality.current.describe(self.target_fps)
+        if self.trace is not None:
+            self.trace.complete("stats", now, time.monotonic())
+            self.trace.counter("queue_depth", stats["queue_depth"])
+            self.trace.counter("dropped_total", stats["dropped_total"])
+        if self._metrics_exporter is not None:
+            self._metrics_exporter.submit(
+                dict(stats, time=time.time(), media_time=self._media_time(now))
+            )
+        if self.on_stats is not None:
+            self.on_stats(stats)
+
+    def _apply_quality(self, level: QualityLevel) -> None:
+        self._scheduler.stride = level.stride
+        if level.preset is not None and isinstance(
+            getattr(self.writer, "inner", self.writer), PresetSwitchWriter
+        ):
+            self.writer.set_preset(level.preset)
+
+    def _change_quality(self, index: int, reason: str) -> None:
+        level = self._quality.ladder[index]
+        self._apply_quality(level)
+        setting = level.describe(self.target_fps)
+        self.quality_log.append(
+            {
+                "time": self._media_time(time.monotonic()),
+                "level": index,
+                "setting": setting,
+                "reason": reason,
+            }
+        )
+        self._status(f"Quality set to {setting}: {reason}")
+        if self.trace is not None:
+            self.trace.instant(f"quality {index}: {setting}", "quality")
+
+    def _queue_stats(self, attr: str) -> dict:
+        """Per-queue qsize() or dropped count, keyed by the stage the queue feeds."""
+        result = {}
+        for name, q in (
+            ("process", self._process_queue),
+            ("encode", self._encode_queue),
+        ):
+            if q is not None:
+                value = getattr(q, attr)
+                result[name] = value() if callable(value) else value
+        return result
+
+    def _dump_trace(self) -> None:
+        trace, path = self.trace, self.config.trace_path
+        if trace is None or not path:
+            return
+        try:
+            trace.dump(path)
+            self._status(f"Trace written to {path}")
+        except Exception as e:
+            self._status(f"Could not write trace: {e}")
+
+    def _close_metrics(self) -> None:
+        if self._metrics_exporter is None:
+            return
+        self._maybe_update_stats(force=True)  # last partial interval
+        exporter, self._metrics_exporter = self._metrics_exporter, None
+        exporter.close()
+
+
+# ----------------------- MULTI-MONITOR -----------------------
+MONITOR_PRIMARY = "primary"
+MONITOR_ALL = "all"  # whole virtual desktop into one file
+MONITOR_EACH = "each"  # every monitor into its own file, recorded in parallel
+
+
+def list_monitors() -> list:
+    """Displays as BBoxes: 0 is the virtual desktop, 1..N the monitors (mss order)."""
+    return display_topology.monitors()
+
+
+def monitor_rect(selection: str) -> BBox:
+    """Rectangle for 'primary', 'all' (virtual desktop) or a 1-based monitor number."""
+    monitors = list_monitors()
+    if selection == MONITOR_ALL:
+        return monitors[0]
+    if selection == MONITOR_PRIMARY:
+        return monitors[1] if len(monitors) > 1 else monitors[0]
+    index = int(selection)
+    if not 1 <= index < len(monitors):
+        raise ValueError(f"No monitor {index} (found {len(monitors) - 1})")
+    return monitors[index]
+
+
+def per_monitor_path(path: str, index: int) -> str:
+    base, ext = os.path.splitext(path)
+    return f"{base}_mon{index}{ext}"
+
+
+def _monitor_worker(
+    index: int, config: RecorderConfig, stop_evt, pause_evt, replay_requests, events
+) -> None:
+    """Child-process entry point: records one monitor until stop_evt is set."""
+    engine = RecorderEngine(
+        config,
+        on_status=lambda text: events.put(("status", index, text)),
+        on_stats=lambda stats: events.put(("stats", index, stats)),
+    )
+    try:
+        engine.start()
+    except RuntimeError as e:
+        events.put(("error", index, str(e)))
+        return
+    replays_seen = replay_requests.value
+    try:
+        while engine.is_recording and not stop_evt.wait(0.05):
+            if pause_evt.is_set():
+                engine.pause()
+            else:
+                engine.resume()
+            if replay_requests.value != replays_seen:
+                replays_seen = replay_requests.value
+                engine.save_replay()
+    finally:
+        if replay_requests.value != replays_seen:
+            engine.save_replay()
+        engine.stop()
+        engine.wait_for_replays()
+        if engine.replay:
+            paths = engine.replay_paths
+        else:
+            paths = engine.segment_paths or [engine.output_path]
+        events.put(("finished", index, paths))
+
+
+class MultiMonitorRecorder:
+    """
+    Records several monitors at once with one RecorderEngine per display, each with
+    its own capture/process/encode threads. With use_processes=True every engine
+    runs in its own process, so the aggregate pixel rate scales across cores
+    instead of sharing one interpreter's GIL.
+    Offers the same start/pause/resume/stop surface as RecorderEngine.
+    """
+
+    STATS_INTERVAL = 1.0  # seconds; each engine reports about this often
+
+    def __init__(
+        self,
+        configs: list,
+        use_processes: bool = False,
+        on_status: Optional[Callable[[str], None]] = None,
+        on_stats: Optional[Callable[[dict], None]] = None,
+        on_finished: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.configs = list(configs)
+        self.use_processes = use_processes
+        self.on_status = on_status
+        self.on_stats = on_stats
+        self.on_finished = on_finished
+        self.engines: list = []
+        # all files, once stopped
+        self.output_paths = [c.output_path for c in self.configs]
+        self.last_error: Optional[str] = None
+        self.is_paused = False
+        self._latest_stats: dict = {}  # monitor index -> (time received, stats)
+        self._stats_lock = threading.Lock()
+        self._stats_published = float("-inf")
+        self._paths_by_monitor: dict = {}
+        self._procs: list = []
+        self._stop_evt = None
+        self._pause_evt = None
+        self._replay_requests = None
+        self._relay: Optional[threading.Thread] = None
+        self._finished_lock = threading.Lock()
+        self._running = 0
+
+    @property
+    def is_recording(self) -> bool:
+        if self.use_processes:
+            return any(p.is_alive() for p in self._procs)
+        return any(e.is_recording for e in self.engines)
+
+    def start(self) -> None:
+        """Start all monitors. Raises RuntimeError if any writer cannot be created."""
+        if self.use_processes:
+            self._start_processes()
+            return
+        self.engines = []
+        self._running = len(self.configs)
+        try:
+            for i, config in enumerate(self.configs):
+                engine = RecorderEngine(
+                    config,
+                    on_status=self.on_status,
+                    on_stats=lambda stats, i=i: self._on_child_stats(i, stats),
+                    on_finished=self._on_child_finished,
+                )
+                engine.start()
+                self.engines.append(engine)
+        except RuntimeError:
+            for engine in self.engines:
+                engine.stop()
+            raise
+
+    def _start_processes(self) -> None:
+        # never fork a process that runs Tk/threads
+        ctx = multiprocessing.get_context("spawn")
+        self._stop_evt = ctx.Event()
+        self._pause_evt = ctx.Event()
+        self._replay_requests = ctx.Value("i", 0)
+        events = ctx.Queue()
+        self._procs = [
+            ctx.Process(
+                target=_monitor_worker,
+                name=f"ScreenRecorderMonitor{i + 1}",
+                args=(
+                    i,
+                    config,
+                    self._stop_evt,
+                    self._pause_evt,
+                    self._replay_requests,
+                    events,
+                ),
+                daemon=True,
+            )
+            for i, config in enumerate(self.configs)
+        ]
+        for proc in self._procs:
+            proc.start()
+        self._relay = threading.Thread(
+            target=self._relay_events,
+            args=(events,),
+            name="ScreenRecorderMonitorRelay",
+            daemon=True,
+        )
+        self._relay.start()
+
+    def _relay_events(self, events) -> None:
+        # Forward child-process events to the callbacks until every child is done
+        pending = len(self._procs)
+        while pending > 0:
+            try:
+                kind, index, payload = events.get(timeout=0.5)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self._procs):
+                    break
+                continue
+            if kind == "stats":
+                self._on_child_stats(index, payload)
+            elif kind == "status" and self.on_status is not None:
+                self.on_status(payload)
+            elif kind == "error":
+                self.last_error = payload
+                if self.on_status is not None:
+                    self.on_status(f"Error: {payload}")
+                self._stop_evt.set()
+                pending -= 1
+            elif kind == "finished":
+                self._paths_by_monitor[index] = payload
+                pending -= 1
+        if self.on_finished is not None:
+            self.on_finished()
+
+    def pause(self) -> None:
+        self.is_paused = True
+        if self.use_processes:
+            self._pause_evt.set()
+        for engine in self.engines:
+            engine.pause()
+
+    def resume(self) -> None:
+        self.is_paused = False
+        if self.use_processes:
+            self._pause_evt.clear()
+        for engine in self.engines:
+            engine.resume()
+
+    def latest_frame(self) -> Optional[FrameBuffer]:
+        """Latest frame of the first monitor (see RecorderEngine.latest_frame); None
+        with use_processes, whose frames never reach this process.
+        """
+        for engine in self.engines:
+            buf = engine.latest_frame()
+            if buf is not None:
+                return buf
+        return None
+
+    def latest_frame_seq(self) -> int:
+        return sum(engine.latest_frame_seq() for engine in self.engines)
+
+    def save_replay(self) -> None:
+        """Dump each monitor's replay buffer (see RecorderEngine.save_replay)."""
+        if self.use_processes:
+            if self._replay_requests is not None:
+                with self._replay_requests.get_lock():
+                    self._replay_requests.value += 1
+            return
+        for engine in self.engines:
+            engine.save_replay()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self.use_processes:
+            if self._stop_evt is not None:
+                self._stop_evt.set()
+            for proc in self._procs:
+                proc.join(timeout=timeout + 5.0)
+                if proc.is_alive():
+                    proc.terminate()
+            if self._relay is not None:
+                self._relay.join(timeout=2.0)
+            self.output_paths = [
+                p
+                for i in sorted(self._paths_by_monitor)
+                for p in self._paths_by_monitor[i]
+            ]
+            return
+        for engine in self.engines:
+            engine.stop(timeout=timeout)
+        self.output_paths = [
+            p
+            for e in self.engines
+            for p in (
+                e.replay_paths if e.replay else e.segment_paths or [e.output_path]
+            )
+        ]
+        self.last_error = next(
+            (e.last_error for e in self.engines if e.last_error), None
+        )
+
+    def _on_child_finished(self) -> None:
+        with self._finished_lock:
+            self._running -= 1
+            done = self._running == 0
+        if done:
+            # Callers read last_error as soon as they hear about the finish
+            self.last_error = next(
+                (e.last_error for e in self.engines if e.last_error), None
+            )
+            if self.on_finished is not None:
+                self.on_finished()
+
+    def _on_child_stats(self, index: int, stats: dict) -> None:
+        # Sum rates across monitors, at most once per interval whichever one reports;
+        # a monitor that fell silent (stalled or finished) drops out after two
+        now = time.monotonic()
+        with self._stats_lock:
+            self._latest_stats[index] = (now, stats)
+            if self.on_stats is None:
+                return
+            if now - self._stats_published < self.STATS_INTERVAL:
+                return
+            self._stats_published = now
+            rows = [
+                row
+                for t, row in self._latest_stats.values()
+                if now - t <= 2 * self.STATS_INTERVAL
+            ]
+        merged = {
+            key: sum(r.get(key, 0) for r in rows)
+            for key in ("capture_fps", "write_fps", "dup_per_s", "dropped_per_s")
+        }
+        for key in ("unchanged_pct", "tiles_changed_pct", "late_ms_avg"):
+            merged[key] = sum(r.get(key, 0.0) for r in rows) / len(rows)
+        merged["late_ms_max"] = max(r.get("late_ms_max", 0.0) for r in rows)
+        self.on_stats(merged)
+
+
+# ----------------------- LIVE PREVIEW -----------------------
+PREVIEW_FPS = 5.0
+PREVIEW_SIZE = (320, 180)  # the preview fits in this box, keeping the aspect ratio
+
+
+class PreviewSampler:
+    """
+    Samples a recorder's latest processed frame (`source`, e.g.
+    RecorderEngine.latest_frame) at most `fps` times a second on its own
+    low-priority thread, downscales it into reused buffers and hands it to
+    `on_frame(ppm, (w, h))` as binary PPM, which Tk's PhotoImage reads natively.
+    It only reads frames the process stage has finished with, so the encoder
+    path never waits on it; `cost()` reports what it spends. With `frame_seq`
+    (e.g. RecorderEngine.latest_frame_seq) a tick whose frame is unchanged is
+    skipped: nothing is rendered, copied or posted.
+    """
+
+    def __init__(
+        self,
+        source: Callable[[], Optional[FrameBuffer]],
+        on_frame: Callable[[bytes, Tuple[int, int]], None],
+        fps: float = PREVIEW_FPS,
+        max_size: Tuple[int, int] = PREVIEW_SIZE,
+        frame_seq: Optional[Callable[[], int]] = None,
+    ) -> None:
+        self.source = source
+        self.on_frame = on_frame
+        self.frame_seq = frame_seq
+        self.interval = 1.0 / max(0.1, fps)
+        self.max_size = max_size
+        self.trace: Optional[TraceRecorder] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._small: Optional[np.ndarray] = None
+        self._ppm: Optional[bytearray] = None
+        self._rgb: Optional[np.ndarray] = None  # pixel part of _ppm
+        self._seq: Optional[int] = None  # frame_seq() of the last preview
+        self._frames = 0
+        self._busy = 0.0
+        self._t_start = 0.0
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._t_start = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._run, name="ScreenRecorderPreview", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def cost(self) -> dict:
+        """{"fps": previews per second, "ms": mean time per preview,
+        "cpu_pct": share of one core}."""
+        elapsed = max(1e-6, time.monotonic() - self._t_start)
         return {
-            "left": int(self.left),
-            "top": int(self.top),
-            "width": int(self.width),
-            "height": int(self.height),
+            "fps": self._frames / elapsed,
+            "ms": 1000.0 * self._busy / self._frames if self._frames else 0.0,
+            "cpu_pct": 100.0 * self._busy / elapsed,
         }
 
+    def _run(self) -> None:
+        _lower_thread_priority()
+        next_t = time.monotonic()
+        while not self._stop.wait(max(0.0, next_t - time.monotonic())):
+            next_t += self.interval
+            # Read before the frame: a change in between only costs an extra render
+            seq = self.frame_seq() if self.frame_seq is not None else None
+            if seq is not None and seq == self._seq:
+                continue  # static screen: the preview on display is still current
+            buf = self.source()
+            if buf is None:
+                continue
+            self._seq = seq
+            t0 = time.monotonic()
+            try:
+                ppm, size = self._render(buf.array)
+            finally:
+                buf.release()
+            t1 = time.monotonic()
+            self._frames += 1
+            self._busy += t1 - t0
+            if self.trace is not None:
+                self.trace.complete("preview", t0, t1, cat="ui")
+            self.on_frame(ppm, size)
+            next_t = max(next_t, time.monotonic())  # never catch up on missed samples
+
+    def _render(self, frame_bgr: np.ndarray) -> Tuple[bytes, Tuple[int, int]]:
+        h, w = frame_bgr.shape[:2]
+        scale = min(self.max_size[0] / w, self.max_size[1] / h, 1.0)
+        pw, ph = max(1, int(w * scale)), max(1, int(h * scale))
+        if self._small is None or self._small.shape[:2] != (ph, pw):
+            # (Re)allocated only when the capture size changes
+            header = f"P6 {pw} {ph} 255\n".encode("ascii")
+            self._small = np.empty((ph, pw, 3), dtype=np.uint8)
+            self._ppm = bytearray(header) + bytearray(pw * ph * 3)
+            self._rgb = np.frombuffer(
+                self._ppm, dtype=np.uint8, offset=len(header)
+            ).reshape(ph, pw, 3)
+        cv2.resize(frame_bgr, (pw, ph), dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        # PhotoImage data must be bytes (tkinter passes a bytearray or memoryview
+        # as its repr), so this is the one copy per preview; the buffers stay ours
+        return bytes(self._ppm), (pw, ph)
+
+
+# ----------------------------- GUI -----------------------------
+class UiBridge:
+    """
+    The only way worker threads reach Tk. post(kind, value) may be called from any
+    thread and just stores the value in a mailbox that keeps the latest value per
+    kind; one `after` tick on the Tk thread drains it at a fixed rate and runs the
+    handler of each kind once. Bursts coalesce, so GUI work per tick is bounded
+    by the number of kinds, however fast the pipeline produces updates.
+    Messages (QUEUED_KINDS) are not snapshots and must not be lost, so they go
+    through a FIFO of up to QUEUE_LIMIT posts instead and are all delivered in
+    order, before the coalesced kinds.
+    """
+
+    QUEUED_KINDS = frozenset({"status", "error"})
+    QUEUE_LIMIT = 32  # beyond this the oldest queued messages are dropped
+
+    def __init__(self, master: tk.Misc, interval_ms: int = 100) -> None:
+        self.master = master
+        self.interval_ms = interval_ms
+        self._handlers: dict = {}
+        self._pending: dict = {}
+        self._queued: deque = deque(maxlen=self.QUEUE_LIMIT)
+        self._lock = threading.Lock()
+        self._after_id = None
+
+    def on(self, kind: str, handler: Callable) -> None:
+        """Run handler(value) on the Tk thread for posts of `kind`."""
+        self._handlers[kind] = handler
+
+    def post(self, kind: str, value=None) -> None:
+        with self._lock:
+            if kind in self.QUEUED_KINDS:
+                self._queued.append((kind, value))
+            else:
+                self._pending[kind] = value
+
+    def start(self) -> None:
+        if self._after_id is None:
+            self._after_id = self.master.after(self.interval_ms, self._tick)
+
+    def stop(self) -> None:
+        if self._after_id is not None:
+            try:
+                self.master.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _tick(self) -> None:
+        with self._lock:
+            updates = list(self._queued)
+            self._queued.clear()
+            pending, self._pending = self._pending, {}
+        updates += pending.items()
+        for kind, value in updates:
+            handler = self._handlers.get(kind)
+            if handler is None:
+                continue
+            try:
+                handler(value)
+            except Exception:
+                pass  # one failing update must not stop the bridge
+        self._after_id = self.master.after(self.interval_ms, self._tick)
+
 
 class ScreenRecorderApp:
     """
-    Main application class encapsulating GUI, state, and recording logic.
+    Main application class encapsulating the GUI; recording is delegated to
+    RecorderEngine.
     """
 
     def __init__(self, master: tk.Tk) -> None:
         self.master = master
         self.master.title("HRaJi Screen Recorder")
-        self.master.iconphoto(True, PhotoImage(file="sc_icon.png"))
+        self.master.iconphoto(True, tk.PhotoImage(file="sc_icon.png"))
         self.master.protocol("WM_DELETE_WINDOW", self.on_close)
 
-        # State flags
-        self.is_recording = False
-        self.is_paused = False
-        self.stop_event = threading.Event()
-        self.record_thread: Optional[threading.Thread] = None
+        # Recording engine of the current/last session
+        self.engine: Optional[RecorderEngine] = None
+        self._finish_pending = False  # started recording not reset by "finished" yet
+        self._stop_thread: Optional[threading.Thread] = None
+        self._closing = False
 
-        # Capture region and writer
+        # Capture region and recording settings
         self.capture_bbox: Optional[BBox] = None
-        self.writer: Optional[cv2.VideoWriter] = None
         self.writer_size: Optional[Tuple[int, int]] = None  # (w, h)
-        self.target_fps = 30.0
+        self.queue_depth = 4
+        self.drop_policy = DROP_OLDEST
 
         # UI variables
         self.status_var = tk.StringVar(value="Ready")
         self.ratio_var = tk.StringVar(value="Full Screen")
+        self.monitor_var = tk.StringVar(value="Primary")
+        self.monitor_processes_var = tk.BooleanVar(value=False)
         self.follow_var = tk.BooleanVar(value=False)
-        self.size_var = tk.StringVar(value="Area: -")
+        self.size_var = tk.StringVar(value="Area: measured when recording starts")
         self.elapsed_var = tk.StringVar(value="00:00:00")
         self.show_border_var = tk.BooleanVar(value=True)
         # Output settings
         self.output_dir_var = tk.StringVar(value=os.getcwd())
         self.filename_tpl_var = tk.StringVar(value="HRaJi.mp4")
 
+        # Encoder settings (auto = fastest benchmarked backend of the profile)
+        self.encoder_var = tk.StringVar(value=ENCODER_AUTO)
+        self.encoder_profile_var = tk.StringVar(value=PROFILE_DEFAULT)
+        self._benchmark_cancel = threading.Event()
+        self._benchmarked: set = set()  # (size, preset) looked up or measured this run
+        self._record_after_benchmark = False  # Start waits for the first benchmark
+        self._benchmark_thread: Optional[threading.Thread] = None
+        self.x264_preset_var = tk.StringVar(value="veryfast")
+        self.crf_var = tk.IntVar(value=23)
+        self.encode_workers_var = tk.IntVar(value=0)  # 0/1 = single writer
+        # Rolling segments (0 = one file for the whole session)
+        self.segment_minutes_var = tk.IntVar(value=0)
+        self.segment_mb_var = tk.IntVar(value=0)
+        # Instant replay: keep the last N seconds in memory, save with a hotkey
+        self.replay_var = tk.BooleanVar(value=False)
+        self.replay_secs_var = tk.IntVar(value=60)
+        # Output size relative to the capture area (downscaled right after the grab)
+        self.output_scale_var = tk.StringVar(value="Original")
+        self.adaptive_var = tk.BooleanVar(value=False)
+        # Capture now, encode later: spool raw frames and encode them after stop
+        self.spool_var = tk.BooleanVar(value=False)
+        # '<output>.idx' seek index next to every file (for 'seek' and 'trim')
+        self.index_var = tk.BooleanVar(value=True)
+        # Live preview of what is being recorded (sampled from the engine, never
+        # re-captured)
+        self.preview_var = tk.BooleanVar(value=False)
+        self.preview: Optional[PreviewSampler] = None
+        self._preview_photo = None  # one PhotoImage, reloaded for every preview frame
+        self._pending_spools: list = []  # spools of the running recording
+        self._spool_queue = deque()  # spools waiting for the transcoder
+        self.transcoder: Optional[SpoolTranscoder] = None
+        # Target frame rate (the capture scheduler handles up to MAX_TARGET_FPS)
+        self.fps_var = tk.StringVar(value="30")
+
         # Countdown seconds before recording
         self.countdown_secs_var = tk.IntVar(value=3)
 
         # Cursor and clicks visualization
         self.show_cursor_var = tk.BooleanVar(value=True)
         self.show_clicks_var = tk.BooleanVar(value=True)
+        # Reuse the previous frame when the screen did not change
+        self.skip_unchanged_var = tk.BooleanVar(value=True)
+        # Variable frame rate: distinct frames only, real timestamps in a sidecar
+        self.vfr_var = tk.BooleanVar(value=False)
 
         # Timer bookkeeping (uses monotonic time to avoid clock jumps)
         self._elapsed_accum: float = 0.0
@@ -97,11 +5472,6 @@ class ScreenRecorderApp:
         self._drag_start_x: int = 0
         self._drag_start_y: int = 0
 
-        # Frame scheduling to keep CFR duration matching timer
-        self._next_frame_time: Optional[float] = None
-        self._paused_at: Optional[float] = None
-        self._last_frame_bgr: Optional[np.ndarray] = None
-
         # Border overlay windows
         self._border_windows: Optional[dict] = None  # keys: top,bottom,left,right
         self._border_thickness = 3
@@ -114,32 +5484,45 @@ class ScreenRecorderApp:
         self.stats_width_var = tk.IntVar(value=140)
         self.stats_height_var = tk.IntVar(value=40)
         self.stats_position_var = tk.StringVar(value="Bottem-Right")  # TL,TR,BL,BR
+        # Timeline trace: <output>.trace.json (Chrome trace-event format), saved at stop
+        self.trace_var = tk.BooleanVar(value=False)
         self._stats_win: Optional[tk.Toplevel] = None
         self._stats_lbl: Optional[tk.Label] = None
         self._stats_after_id: Optional[str] = None
-        self._capture_count_current = 0
-        self._write_count_current = 0
-        self._dup_count_current = 0
-        self._last_stats_time = time.monotonic()
 
-        # Mouse tracking state
-        self._mouse_lock = threading.Lock()
-        self._mouse_pos_abs: Tuple[int, int] = (0, 0)
-        self._click_ripples = deque()  # list of (time_start, (x,y), button)
-        self._mouse_listener = None
+        # Global hotkeys
         self._hotkey_listener = None
 
-        # Build UI and initialize region
+        # Overlay/follow toggles also apply to a running recording
+        for var in (
+            self.follow_var,
+            self.show_cursor_var,
+            self.show_clicks_var,
+            self.skip_unchanged_var,
+        ):
+            var.trace_add("write", lambda *_: self._sync_engine_options())
+
+        # Build UI. The capture region needs the monitor layout (mss), so it is only
+        # computed when first needed: recording, area selection or a region setting
         self._build_ui()
-        self._refresh_region()
-        # Start global hotkeys listener (runs regardless of recording state)
-        self._start_hotkeys()
+        self._monitors_listed = False
+        # Worker and listener threads post here; Tk is only touched from its own thread
+        self.ui = UiBridge(master)
+        self._register_ui_handlers()
+        self.ui.start()
+        # Re-place the region when monitors are added, removed or resized
+        display_topology.subscribe(lambda: self.ui.post("topology"))
+        # Start global hotkeys listener (runs regardless of recording state) once the
+        # window is up; importing pynput opens its own X connection
+        self.master.after_idle(self._start_hotkeys)
+        # Offer to finish encodes that a previous session left behind
+        self.master.after_idle(self._offer_leftover_spools)
 
     # ------------------------- UI SETUP -------------------------
     def _build_ui(self) -> None:
         root = self.master
-        root.geometry("800x550")
-        root.minsize(800, 550)
+        root.geometry("800x600")
+        root.minsize(800, 600)
 
         padding = {"padx": 10, "pady": 10}
 
@@ -150,15 +5533,45 @@ class ScreenRecorderApp:
         # Aspect ratio selection
         ttk.Label(controls, text="Aspect Ratio:").pack(side=tk.LEFT)
         ratios = ["Full Screen", "16:9", "9:16", "4:3"]
-        self.ratio_menu = ttk.OptionMenu(controls, self.ratio_var, self.ratio_var.get(), *ratios, command=lambda _=None: self._refresh_region())
+        self.ratio_menu = ttk.OptionMenu(
+            controls,
+            self.ratio_var,
+            self.ratio_var.get(),
+            *ratios,
+            command=lambda _=None: self._refresh_region(),
+        )
         self.ratio_menu.pack(side=tk.LEFT, padx=8)
 
+        # Monitor selection
+        ttk.Label(controls, text="Monitor:").pack(side=tk.LEFT)
+        self.monitor_menu = ttk.OptionMenu(
+            controls,
+            self.monitor_var,
+            self.monitor_var.get(),
+            *self.MONITOR_CHOICES,
+            command=lambda _=None: self._refresh_region(),
+        )
+        # Individual monitors are listed the first time the menu is opened
+        self.monitor_menu["menu"].configure(postcommand=self._list_monitors_in_menu)
+        self.monitor_menu.pack(side=tk.LEFT, padx=8)
+        self.monitor_proc_chk = ttk.Checkbutton(
+            controls, text="Separate processes", variable=self.monitor_processes_var
+        )
+        self.monitor_proc_chk.pack(side=tk.LEFT, padx=8)
+
         # Follow full screen
-        self.follow_chk = ttk.Checkbutton(controls, text="Follow Full Screen", variable=self.follow_var)
+        self.follow_chk = ttk.Checkbutton(
+            controls, text="Follow Full Screen", variable=self.follow_var
+        )
         self.follow_chk.pack(side=tk.LEFT, padx=8)
 
         # Show border toggle
-        self.border_chk = ttk.Checkbutton(controls, text="Show Capture Border", variable=self.show_border_var, command=self._update_border)
+        self.border_chk = ttk.Checkbutton(
+            controls,
+            text="Show Capture Border",
+            variable=self.show_border_var,
+            command=self._toggle_border,
+        )
         self.border_chk.pack(side=tk.LEFT, padx=8)
 
         # Area size label
@@ -169,49 +5582,240 @@ class ScreenRecorderApp:
         out = ttk.Labelframe(root, text="Output & Options")
         out.pack(side=tk.TOP, fill=tk.X, **padding)
         # Save dir
-        ttk.Label(out, text="Save to:").grid(row=0, column=0, sticky=tk.W, padx=(8, 4), pady=4)
+        ttk.Label(out, text="Save to:").grid(
+            row=0, column=0, sticky=tk.W, padx=(8, 4), pady=4
+        )
         self.out_dir_entry = ttk.Entry(out, textvariable=self.output_dir_var, width=36)
         self.out_dir_entry.grid(row=0, column=1, sticky=tk.W)
-        ttk.Button(out, text="Browse...", command=self._choose_output_dir).grid(row=0, column=2, padx=6)
+        ttk.Button(out, text="Browse...", command=self._choose_output_dir).grid(
+            row=0, column=2, padx=6
+        )
         # Filename template
-        ttk.Label(out, text="Filename:").grid(row=1, column=0, sticky=tk.W, padx=(8, 4), pady=4)
+        ttk.Label(out, text="Filename:").grid(
+            row=1, column=0, sticky=tk.W, padx=(8, 4), pady=4
+        )
         self.tpl_entry = ttk.Entry(out, textvariable=self.filename_tpl_var, width=36)
         self.tpl_entry.grid(row=1, column=1, sticky=tk.W)
-        ttk.Label(out, text="(strftime) e.g., HRaJi.mp4").grid(row=1, column=2, sticky=tk.W)
+        ttk.Label(out, text="(strftime) e.g., HRaJi.mp4").grid(
+            row=1, column=2, sticky=tk.W
+        )
         # Countdown
-        ttk.Label(out, text="Countdown (s):").grid(row=2, column=0, sticky=tk.W, padx=(8,4), pady=4)
-        self.countdown_spin = ttk.Spinbox(out, from_=0, to=10, textvariable=self.countdown_secs_var, width=5)
+        ttk.Label(out, text="Countdown (s):").grid(
+            row=2, column=0, sticky=tk.W, padx=(8, 4), pady=4
+        )
+        self.countdown_spin = ttk.Spinbox(
+            out, from_=0, to=10, textvariable=self.countdown_secs_var, width=5
+        )
         self.countdown_spin.grid(row=2, column=1, sticky=tk.W)
+        fps_row = ttk.Frame(out)
+        fps_row.grid(row=2, column=2, sticky=tk.W)
+        ttk.Label(fps_row, text="FPS").pack(side=tk.LEFT, padx=(0, 4))
+        self.fps_menu = ttk.OptionMenu(
+            fps_row, self.fps_var, self.fps_var.get(), *self.FPS_CHOICES
+        )
+        self.fps_menu.pack(side=tk.LEFT)
         # Cursor/clicks checkboxes
-        self.cursor_chk = ttk.Checkbutton(out, text="Show cursor", variable=self.show_cursor_var)
-        self.cursor_chk.grid(row=3, column=0, sticky=tk.W, padx=(8,4), pady=2)
-        self.clicks_chk = ttk.Checkbutton(out, text="Show clicks", variable=self.show_clicks_var)
-        self.clicks_chk.grid(row=3, column=1, sticky=tk.W, padx=(8,4), pady=2)
+        self.cursor_chk = ttk.Checkbutton(
+            out, text="Show cursor", variable=self.show_cursor_var
+        )
+        self.cursor_chk.grid(row=3, column=0, sticky=tk.W, padx=(8, 4), pady=2)
+        self.clicks_chk = ttk.Checkbutton(
+            out, text="Show clicks", variable=self.show_clicks_var
+        )
+        self.clicks_chk.grid(row=3, column=1, sticky=tk.W, padx=(8, 4), pady=2)
+        self.skip_unchanged_chk = ttk.Checkbutton(
+            out, text="Skip unchanged frames", variable=self.skip_unchanged_var
+        )
+        self.skip_unchanged_chk.grid(row=3, column=2, sticky=tk.W, padx=(8, 4), pady=2)
+        self.vfr_chk = ttk.Checkbutton(
+            out, text="Variable frame rate", variable=self.vfr_var
+        )
+        self.vfr_chk.grid(row=3, column=3, sticky=tk.W, padx=(8, 4), pady=2)
+        # Encoder
+        ttk.Label(out, text="Encoder:").grid(
+            row=4, column=0, sticky=tk.W, padx=(8, 4), pady=4
+        )
+        enc = ttk.Frame(out)
+        enc.grid(row=4, column=1, columnspan=2, sticky=tk.W)
+        self.encoder_menu = ttk.OptionMenu(
+            enc, self.encoder_var, self.encoder_var.get(), *ENCODERS
+        )
+        self.encoder_menu.pack(side=tk.LEFT)
+        ttk.Label(enc, text="Profile").pack(side=tk.LEFT, padx=(8, 4))
+        self.encoder_profile_menu = ttk.OptionMenu(
+            enc,
+            self.encoder_profile_var,
+            self.encoder_profile_var.get(),
+            *ENCODER_PROFILES,
+        )
+        self.encoder_profile_menu.pack(side=tk.LEFT)
+        ttk.Label(enc, text="x264 preset").pack(side=tk.LEFT, padx=(8, 4))
+        self.preset_menu = ttk.OptionMenu(
+            enc, self.x264_preset_var, self.x264_preset_var.get(), *X264_PRESETS
+        )
+        self.preset_menu.pack(side=tk.LEFT)
+        ttk.Label(enc, text="CRF").pack(side=tk.LEFT, padx=(8, 4))
+        self.crf_spin = ttk.Spinbox(
+            enc, from_=0, to=51, textvariable=self.crf_var, width=5
+        )
+        self.crf_spin.pack(side=tk.LEFT)
+        ttk.Label(enc, text="Parallel workers").pack(side=tk.LEFT, padx=(8, 4))
+        self.workers_spin = ttk.Spinbox(
+            enc,
+            from_=0,
+            to=os.cpu_count() or 1,
+            textvariable=self.encode_workers_var,
+            width=4,
+        )
+        self.workers_spin.pack(side=tk.LEFT)
+        self.benchmark_btn = ttk.Button(
+            enc, text="Benchmark", command=self.benchmark_encoders_now
+        )
+        self.benchmark_btn.pack(side=tk.LEFT, padx=(8, 0))
+        # Rolling segments
+        ttk.Label(out, text="New file every:").grid(
+            row=5, column=0, sticky=tk.W, padx=(8, 4), pady=4
+        )
+        seg = ttk.Frame(out)
+        seg.grid(row=5, column=1, columnspan=2, sticky=tk.W)
+        self.segment_min_spin = ttk.Spinbox(
+            seg, from_=0, to=1440, textvariable=self.segment_minutes_var, width=5
+        )
+        self.segment_min_spin.pack(side=tk.LEFT)
+        ttk.Label(seg, text="min or").pack(side=tk.LEFT, padx=(4, 8))
+        self.segment_mb_spin = ttk.Spinbox(
+            seg,
+            from_=0,
+            to=100000,
+            increment=100,
+            textvariable=self.segment_mb_var,
+            width=7,
+        )
+        self.segment_mb_spin.pack(side=tk.LEFT)
+        ttk.Label(
+            seg, text="MB (0 = off; {seq} in the template numbers the files)"
+        ).pack(side=tk.LEFT, padx=(4, 0))
+        # Instant replay
+        self.replay_chk = ttk.Checkbutton(
+            out, text="Instant replay, keep last", variable=self.replay_var
+        )
+        self.replay_chk.grid(row=6, column=0, sticky=tk.W, padx=(8, 4), pady=4)
+        rpl = ttk.Frame(out)
+        rpl.grid(row=6, column=1, columnspan=2, sticky=tk.W)
+        self.replay_secs_spin = ttk.Spinbox(
+            rpl, from_=5, to=3600, textvariable=self.replay_secs_var, width=5
+        )
+        self.replay_secs_spin.pack(side=tk.LEFT)
+        ttk.Label(
+            rpl, text="s (nothing is saved until Save Replay / Alt+Shift+B)"
+        ).pack(side=tk.LEFT, padx=(4, 0))
+        self.index_chk = ttk.Checkbutton(
+            out, text="Write seek index", variable=self.index_var
+        )
+        self.index_chk.grid(row=6, column=3, sticky=tk.W, padx=(8, 4))
+        # Output scaling
+        ttk.Label(out, text="Output size:").grid(
+            row=7, column=0, sticky=tk.W, padx=(8, 4), pady=4
+        )
+        self.output_scale_menu = ttk.OptionMenu(
+            out,
+            self.output_scale_var,
+            self.output_scale_var.get(),
+            *self.OUTPUT_SCALES,
+            command=lambda _=None: self._refresh_region(),
+        )
+        self.output_scale_menu.grid(row=7, column=1, sticky=tk.W)
+        self.adaptive_chk = ttk.Checkbutton(
+            out, text="Adaptive quality under load", variable=self.adaptive_var
+        )
+        self.adaptive_chk.grid(row=7, column=2, sticky=tk.W, padx=(8, 4))
+        self.spool_chk = ttk.Checkbutton(
+            out, text="Encode after recording", variable=self.spool_var
+        )
+        self.spool_chk.grid(row=7, column=3, sticky=tk.W, padx=(8, 4))
 
         # Stats overlay
         stats = ttk.Labelframe(root, text="Live Stats Overlay")
         stats.pack(side=tk.TOP, fill=tk.X, **padding)
-        self.stats_show_chk = ttk.Checkbutton(stats, text="Show stats", variable=self.show_stats_var, command=self._update_stats_overlay)
-        self.stats_show_chk.grid(row=0, column=0, sticky=tk.W, padx=(8,4))
+        self.stats_show_chk = ttk.Checkbutton(
+            stats,
+            text="Show stats",
+            variable=self.show_stats_var,
+            command=self._update_stats_overlay,
+        )
+        self.stats_show_chk.grid(row=0, column=0, sticky=tk.W, padx=(8, 4))
         ttk.Label(stats, text="Opacity").grid(row=0, column=1, sticky=tk.W)
-        self.stats_alpha = ttk.Spinbox(stats, from_=0.2, to=1.0, increment=0.05, textvariable=self.stats_alpha_var, width=6, command=self._update_stats_overlay)
+        self.stats_alpha = ttk.Spinbox(
+            stats,
+            from_=0.2,
+            to=1.0,
+            increment=0.05,
+            textvariable=self.stats_alpha_var,
+            width=6,
+            command=self._update_stats_overlay,
+        )
         self.stats_alpha.grid(row=0, column=2, sticky=tk.W)
         ttk.Label(stats, text="Font").grid(row=0, column=3, sticky=tk.W)
-        self.stats_font = ttk.Spinbox(stats, from_=8, to=24, textvariable=self.stats_font_size_var, width=6, command=self._update_stats_overlay)
+        self.stats_font = ttk.Spinbox(
+            stats,
+            from_=8,
+            to=24,
+            textvariable=self.stats_font_size_var,
+            width=6,
+            command=self._update_stats_overlay,
+        )
         self.stats_font.grid(row=0, column=4, sticky=tk.W)
         ttk.Label(stats, text="Size WxH").grid(row=0, column=5, sticky=tk.W)
-        self.stats_w = ttk.Spinbox(stats, from_=140, to=600, textvariable=self.stats_width_var, width=6, command=self._update_stats_overlay)
+        self.stats_w = ttk.Spinbox(
+            stats,
+            from_=140,
+            to=600,
+            textvariable=self.stats_width_var,
+            width=6,
+            command=self._update_stats_overlay,
+        )
         self.stats_w.grid(row=0, column=6, sticky=tk.W)
-        self.stats_h = ttk.Spinbox(stats, from_=40, to=400, textvariable=self.stats_height_var, width=6, command=self._update_stats_overlay)
+        self.stats_h = ttk.Spinbox(
+            stats,
+            from_=40,
+            to=400,
+            textvariable=self.stats_height_var,
+            width=6,
+            command=self._update_stats_overlay,
+        )
         self.stats_h.grid(row=0, column=7, sticky=tk.W)
         ttk.Label(stats, text="Position").grid(row=0, column=8, sticky=tk.W)
-        pos_menu = ttk.OptionMenu(stats, self.stats_position_var, self.stats_position_var.get(), "Top-Left","Top-Right","Bottom-Left","Bottom-Right", command=lambda _=None: self._update_stats_overlay())
+        pos_menu = ttk.OptionMenu(
+            stats,
+            self.stats_position_var,
+            self.stats_position_var.get(),
+            "Top-Left",
+            "Top-Right",
+            "Bottom-Left",
+            "Bottom-Right",
+            command=lambda _=None: self._update_stats_overlay(),
+        )
         pos_menu.grid(row=0, column=9, sticky=tk.W)
+        self.trace_chk = ttk.Checkbutton(
+            stats,
+            text="Record timeline trace (open in Perfetto)",
+            variable=self.trace_var,
+        )
+        self.trace_chk.grid(row=1, column=0, columnspan=5, sticky=tk.W, padx=(8, 4))
 
         # Region selection
         actions = ttk.Frame(root)
         actions.pack(side=tk.TOP, fill=tk.X, **padding)
-        ttk.Button(actions, text="Select Area...", command=self._start_area_selection).pack(side=tk.LEFT)
+        ttk.Button(
+            actions, text="Select Area...", command=self._start_area_selection
+        ).pack(side=tk.LEFT)
+        self.preview_chk = ttk.Checkbutton(
+            actions,
+            text="Live preview",
+            variable=self.preview_var,
+            command=self._toggle_preview,
+        )
+        self.preview_chk.pack(side=tk.LEFT, padx=8)
 
         # Buttons
         btns = ttk.Frame(root)
@@ -220,15 +5824,26 @@ class ScreenRecorderApp:
         self.start_btn = ttk.Button(btns, text="Start", command=self.start_recording)
         self.start_btn.pack(side=tk.LEFT, padx=5)
 
-        self.pause_btn = ttk.Button(btns, text="Pause", command=self.pause_recording, state=tk.DISABLED)
+        self.pause_btn = ttk.Button(
+            btns, text="Pause", command=self.pause_recording, state=tk.DISABLED
+        )
         self.pause_btn.pack(side=tk.LEFT, padx=5)
 
-        self.resume_btn = ttk.Button(btns, text="Resume", command=self.resume_recording, state=tk.DISABLED)
+        self.resume_btn = ttk.Button(
+            btns, text="Resume", command=self.resume_recording, state=tk.DISABLED
+        )
         self.resume_btn.pack(side=tk.LEFT, padx=5)
 
-        self.stop_btn = ttk.Button(btns, text="Stop", command=self.stop_recording, state=tk.DISABLED)
+        self.stop_btn = ttk.Button(
+            btns, text="Stop", command=self.stop_recording, state=tk.DISABLED
+        )
         self.stop_btn.pack(side=tk.LEFT, padx=5)
 
+        self.save_replay_btn = ttk.Button(
+            btns, text="Save Replay", command=self.save_replay, state=tk.DISABLED
+        )
+        self.save_replay_btn.pack(side=tk.LEFT, padx=5)
+
         # Status bar
         status_frame = ttk.Frame(root)
         status_frame.pack(side=tk.BOTTOM, fill=tk.X, **padding)
@@ -238,48 +5853,84 @@ class ScreenRecorderApp:
         ttk.Label(status_frame, text="Elapsed:").pack(side=tk.LEFT, padx=(16, 4))
         self.elapsed_lbl = ttk.Label(status_frame, textvariable=self.elapsed_var)
         self.elapsed_lbl.pack(side=tk.LEFT)
+        # Background encode of spooled recordings (shown only while it runs)
+        self.transcode_cancel_btn = ttk.Button(
+            status_frame, text="Cancel encoding", command=self.cancel_transcode
+        )
+        self.transcode_bar = ttk.Progressbar(
+            status_frame, mode="determinate", maximum=100.0, length=160
+        )
+
+        # Live preview (packed only while enabled)
+        self.preview_frame = ttk.Labelframe(root, text="Live Preview")
+        self.preview_lbl = ttk.Label(
+            self.preview_frame,
+            text="The preview appears while recording",
+            anchor=tk.CENTER,
+        )
+        self.preview_lbl.pack(side=tk.TOP, padx=8, pady=4)
+        self.preview_info_var = tk.StringVar(value="")
+        ttk.Label(self.preview_frame, textvariable=self.preview_info_var).pack(
+            side=tk.TOP, anchor=tk.W, padx=8
+        )
 
     # ----------------------- REGION LOGIC -----------------------
     def _get_primary_monitor_rect(self) -> BBox:
-        """Detect the primary monitor via mss.
-        In mss, monitors[1] is usually the primary monitor on most platforms.
-        """
-        with mss.mss() as sct:
-            monitors = sct.monitors
-            if len(monitors) > 1:
-                m = monitors[1]
-            else:
-                m = monitors[0]
-            return BBox(left=m["left"], top=m["top"], width=m["width"], height=m["height"])
+        return get_primary_monitor_rect()
 
-    @staticmethod
-    def _even(n: int) -> int:
-        return int(n) - (int(n) % 2)
+    _even = staticmethod(even)
 
     def _calc_centered_bbox(self, ratio: Optional[Tuple[int, int]]) -> BBox:
-        mon = self._get_primary_monitor_rect()
-        if ratio is None:
-            # Full screen
-            width = self._even(mon.width)
-            height = self._even(mon.height)
-            return BBox(mon.left, mon.top, width, height)
-
-        rw, rh = ratio
-        W, H = mon.width, mon.height
-        # Compute the largest rectangle of aspect rw:rh that fits within W x H
-        # Try width-constrained
-        h_by_w = int(W * rh / rw)
-        if h_by_w <= H:
-            width = W
-            height = h_by_w
+        return calc_centered_bbox(self._selected_monitor_rect(), ratio)
+
+    MONITOR_CHOICES = (
+        "Primary",
+        "All monitors (one file)",
+        "Each monitor (separate files)",
+    )
+
+    def _monitor_choices(self) -> list:
+        try:
+            count = len(list_monitors()) - 1
+        except Exception:
+            count = 1
+        choices = list(self.MONITOR_CHOICES)
+        if count > 1:
+            choices += [f"Monitor {i}" for i in range(1, count + 1)]
+        return choices
+
+    def _list_monitors_in_menu(self, force: bool = False) -> None:
+        """Add 'Monitor N' entries; listing monitors opens mss, so not at startup."""
+        if self._monitors_listed and not force:
+            return
+        self._monitors_listed = True
+        self.monitor_menu.set_menu(self.monitor_var.get(), *self._monitor_choices())
+
+    def _toggle_border(self) -> None:
+        if self.show_border_var.get() and self.capture_bbox is None:
+            self._refresh_region()  # shows the border too
         else:
-            width = int(H * rw / rh)
-            height = H
-        width = self._even(width)
-        height = self._even(height)
-        left = mon.left + (W - width) // 2
-        top = mon.top + (H - height) // 2
-        return BBox(left, top, width, height)
+            self._update_border()
+
+    def _monitor_selection(self) -> str:
+        val = self.monitor_var.get()
+        if val.startswith("All"):
+            return MONITOR_ALL
+        if val.startswith("Each"):
+            return MONITOR_EACH
+        if val.startswith("Monitor "):
+            return val.split()[1]
+        return MONITOR_PRIMARY
+
+    def _selected_monitor_rect(self) -> BBox:
+        """Monitor the region is computed on ('each' previews on the primary one)."""
+        selection = self._monitor_selection()
+        if selection == MONITOR_EACH:
+            selection = MONITOR_PRIMARY
+        try:
+            return monitor_rect(selection)
+        except ValueError:
+            return self._get_primary_monitor_rect()
 
     def _ratio_tuple(self) -> Optional[Tuple[int, int]]:
         val = self.ratio_var.get()
@@ -292,20 +5943,145 @@ class ScreenRecorderApp:
         # Full Screen
         return None
 
-    def _refresh_region(self) -> None:
-        bbox = self._calc_centered_bbox(self._ratio_tuple())
+    FPS_CHOICES = ("15", "24", "30", "60", "120")
+
+    # label -> (scale, max output width)
+    OUTPUT_SCALES = {
+        "Original": (1.0, None),
+        "75%": (0.75, None),
+        "50%": (0.5, None),
+        "Fit 1920 px": (1.0, 1920),
+        "Fit 1280 px": (1.0, 1280),
+    }
+
+    def _output_scaling(self) -> Tuple[float, Optional[int]]:
+        return self.OUTPUT_SCALES.get(self.output_scale_var.get(), (1.0, None))
+
+    def _set_area(self, bbox: BBox) -> None:
         self.capture_bbox = bbox
-        self.writer_size = (bbox.width, bbox.height)
-        self.size_var.set(f"Area: {bbox.width}x{bbox.height} @ ({bbox.left},{bbox.top})")
+        self.writer_size = scaled_size(bbox.width, bbox.height, *self._output_scaling())
+        text = f"Area: {bbox.width}x{bbox.height} @ ({bbox.left},{bbox.top})"
+        if self.writer_size != (bbox.width, bbox.height):
+            text += f" -> output {self.writer_size[0]}x{self.writer_size[1]}"
+        self.size_var.set(text)
         # Update overlay border if enabled
         self._update_border()
 
+    # ------------------------ ENCODER BENCHMARK ------------------------
+    def benchmark_encoders_now(self) -> None:
+        """Benchmark button: measure the encoders at the current output size again."""
+        self._start_encoder_benchmark(self._auto_encoder_sizes(), refresh=True)
+
+    def _auto_encoder_sizes(self) -> list:
+        """Output sizes the next recording picks an 'auto' encoder for."""
+        if self._monitor_selection() != MONITOR_EACH:
+            return [self.writer_size]
+        scaling = self._output_scaling()
+        sizes = set()
+        for mon in list_monitors()[1:]:
+            bbox = calc_centered_bbox(mon, self._ratio_tuple())
+            sizes.add(scaled_size(bbox.width, bbox.height, *scaling))
+        return sorted(sizes)
+
+    def _needs_encoder_benchmark(self) -> bool:
+        """True when an 'auto' recording is about to start at a size not looked up
+        yet; the benchmark then runs first (only if nothing is cached) and Start
+        continues once it is done.
+        """
+        if self.encoder_var.get() != ENCODER_AUTO or self.spool_var.get():
+            return False
+        preset = self.x264_preset_var.get()
+        known = {size for size, p in self._benchmarked if p == preset}
+        sizes = [size for size in self._auto_encoder_sizes() if size not in known]
+        if not sizes:
+            return False
+        self._record_after_benchmark = True
+        self._start_encoder_benchmark(sizes)
+        return True
+
+    def _start_encoder_benchmark(self, sizes: list, refresh: bool = False) -> None:
+        if self.is_recording or (
+            self._benchmark_thread is not None and self._benchmark_thread.is_alive()
+        ):
+            return  # a running benchmark posts when done, which resumes Start
+        preset = self.x264_preset_var.get()
+        self._benchmark_cancel = cancel = threading.Event()
+        self.benchmark_btn.config(state=tk.DISABLED)
+
+        def run() -> None:
+            _lower_thread_priority()
+            done = []
+            try:
+                for size in sizes:
+                    # The cache lookup imports cv2, so it stays off the Tk thread too
+                    if refresh or load_encoder_benchmarks(size, preset) is None:
+                        self.ui.post(
+                            "status",
+                            f"Benchmarking encoders at {size[0]}x{size[1]} (once; "
+                            "cached for later recordings)...",
+                        )
+                        if (
+                            benchmark_encoders(size, preset=preset, cancel=cancel)
+                            is None
+                        ):
+                            break  # cancelled by Start or by closing the window
+                    done.append(size)
+            except Exception:
+                done = sizes  # auto falls back to the built-in order
+            self.ui.post("encoder_benchmark", (done, preset))
+
+        self._benchmark_thread = threading.Thread(
+            target=run, name="EncoderBenchmark", daemon=True
+        )
+        self._benchmark_thread.start()
+
+    def _on_encoder_benchmark(self, value) -> None:
+        sizes, preset = value
+        self._benchmarked.update((size, preset) for size in sizes)
+        if not self.is_recording:
+            self.benchmark_btn.config(state=tk.NORMAL)
+        if self._record_after_benchmark:
+            self._record_after_benchmark = False
+            self.start_recording()
+        elif sizes and not self.is_recording:
+            size = sizes[0]
+            best = rank_encoders(size, self.encoder_profile_var.get(), preset)[0]
+            self.status_var.set(
+                f"Encoder benchmark done: auto uses {best} at {size[0]}x{size[1]}"
+            )
+
+    def _refresh_region(self) -> None:
+        self._set_area(self._calc_centered_bbox(self._ratio_tuple()))
+
+    def _on_topology_changed(self) -> None:
+        if self._monitors_listed:
+            self._list_monitors_in_menu(force=True)
+        if not self.is_recording and self.capture_bbox is not None:
+            self._refresh_region()
+
     # ----------------------- BUTTON HANDLERS -----------------------
+    @property
+    def is_recording(self) -> bool:
+        return self.engine is not None and self.engine.is_recording
+
+    @property
+    def is_paused(self) -> bool:
+        return self.engine is not None and self.engine.is_paused
+
     def start_recording(self) -> None:
-        if self.is_recording:
-            return
+        if self.is_recording or self._finish_pending or self._record_after_benchmark:
+            return  # also while the previous recording is still being finished
+        # Without RandR notifications, re-read the monitor layout once per recording
+        if not display_topology.watching:
+            display_topology.invalidate()
         # Ensure region set
         self._refresh_region()
+        # 'auto' ranks the encoders by a benchmark cached per output size; the first
+        # recording at a new size measures them before it starts
+        if self._needs_encoder_benchmark():
+            return
+        # A Benchmark-button run would compete with the recording for CPU
+        self._benchmark_cancel.set()
 
         # Optional countdown overlay (before writer starts)
         cd = max(0, int(self.countdown_secs_var.get()))
@@ -313,102 +6089,382 @@ class ScreenRecorderApp:
             if not self._show_countdown(cd):
                 return
 
-        # Prepare writer (use chosen directory + template)
-        timestamp = datetime.datetime.now()
+        # Prepare engine (use chosen directory + template)
+        filename = build_output_path(
+            self.output_dir_var.get().strip() or os.getcwd(),
+            self.filename_tpl_var.get(),
+        )
+        config = RecorderConfig(
+            output_path=filename,
+            bbox=self.capture_bbox,
+            writer_size=self.writer_size,
+            target_fps=float(self.fps_var.get()),
+            queue_depth=self.queue_depth,
+            drop_policy=self.drop_policy,
+            show_cursor=self.show_cursor_var.get(),
+            show_clicks=self.show_clicks_var.get(),
+            follow_fullscreen=self.follow_var.get(),
+            encoder=self.encoder_var.get(),
+            encoder_profile=self.encoder_profile_var.get(),
+            x264_preset=self.x264_preset_var.get(),
+            crf=int(self.crf_var.get()),
+            encode_workers=int(self.encode_workers_var.get()),
+            skip_unchanged=self.skip_unchanged_var.get(),
+            vfr=self.vfr_var.get(),
+            frame_index=self.index_var.get(),
+            segment_seconds=60.0 * int(self.segment_minutes_var.get()),
+            segment_mb=float(self.segment_mb_var.get()),
+            segment_template=os.path.join(
+                self.output_dir_var.get().strip() or os.getcwd(),
+                self.filename_tpl_var.get(),
+            ),
+            replay_seconds=(
+                float(self.replay_secs_var.get()) if self.replay_var.get() else 0.0
+            ),
+            output_scale=self._output_scaling()[0],
+            output_max_width=self._output_scaling()[1],
+            trace_path=(
+                os.path.splitext(filename)[0] + ".trace.json"
+                if self.trace_var.get()
+                else None
+            ),
+            adaptive_quality=self.adaptive_var.get(),
+            spool=self.spool_var.get(),
+        )
+        if self._monitor_selection() == MONITOR_EACH:
+            # One file per monitor, same aspect preset centered on each
+            configs = []
+            for i, mon in enumerate(list_monitors()[1:], start=1):
+                bbox = calc_centered_bbox(mon, self._ratio_tuple())
+                configs.append(
+                    dataclasses.replace(
+                        config,
+                        output_path=per_monitor_path(filename, i),
+                        bbox=bbox,
+                        writer_size=None,
+                        follow_fullscreen=False,
+                        segment_template=per_monitor_path(config.segment_template, i),
+                        trace_path=(
+                            config.trace_path and per_monitor_path(config.trace_path, i)
+                        ),
+                    )
+                )
+            engine = MultiMonitorRecorder(
+                configs,
+                use_processes=self.monitor_processes_var.get(),
+                on_status=self._on_engine_status,
+                on_stats=self._on_engine_stats,
+                on_finished=self._on_engine_finished,
+            )
+        else:
+            engine = RecorderEngine(
+                config,
+                on_status=self._on_engine_status,
+                on_stats=self._on_engine_stats,
+                on_bbox_changed=self._on_engine_bbox_changed,
+                on_finished=self._on_engine_finished,
+            )
         try:
-            base = timestamp.strftime(self.filename_tpl_var.get())
-        except Exception:
-            base = timestamp.strftime("HRaJi_%Y-%m-%d_%H-%M-%S.mp4")
-        out_dir = self.output_dir_var.get().strip() or os.getcwd()
-        os.makedirs(out_dir, exist_ok=True)
-        filename = os.path.join(out_dir, base)
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")  # widely supported
-        w, h = self.writer_size
-        self.writer = cv2.VideoWriter(filename, fourcc, self.target_fps, (int(w), int(h)))
-        if not self.writer or not self.writer.isOpened():
-            self.writer = None
-            messagebox.showerror("Error", "Failed to create video writer. Check codec and permissions.")
+            engine.start()
+        except RuntimeError as e:
+            messagebox.showerror("Error", str(e))
             return
+        self.engine = engine
+        self._finish_pending = True
+        if config.spool:
+            paths = (
+                [c.output_path for c in engine.configs]
+                if isinstance(engine, MultiMonitorRecorder)
+                else [filename]
+            )
+            self._pending_spools = [spool_path_for(p) for p in paths]
 
-        # Update state & UI
-        self.is_recording = True
-        self.is_paused = False
-        self.stop_event.clear()
-        self.status_var.set("Recording...")
+        # Update UI
+        self.status_var.set(
+            "Instant replay running..." if config.replay_seconds > 0 else "Recording..."
+        )
         self._set_buttons_state(recording=True, paused=False)
 
-        # Start background thread
-        self.record_thread = threading.Thread(target=self._record_loop, name="ScreenRecorderThread", daemon=True)
-        self.record_thread.start()
-
         # Start timer and open mini control window
         self._timer_reset()
         self._timer_resume()
         self._open_mini_window()
 
-        # Initialize frame schedule
-        self._next_frame_time = time.monotonic() + (1.0 / float(self.target_fps))
-        self._paused_at = None
-
         # Start overlays as needed
-        self._start_mouse_listener()
         self._update_stats_overlay()
+        if self.preview_var.get():
+            self._start_preview()
+
+    def save_replay(self) -> None:
+        """Write the instant-replay buffer to disk; recording continues."""
+        if not self.is_recording or not self.replay_var.get():
+            return
+        self.engine.save_replay()
 
     def pause_recording(self) -> None:
         if not self.is_recording or self.is_paused:
             return
-        self.is_paused = True
+        self.engine.pause()
         self.status_var.set("Paused")
         self._set_buttons_state(recording=True, paused=True)
         self._timer_pause()
-        # Note pause moment to shift schedule on resume
-        self._paused_at = time.monotonic()
 
     def resume_recording(self) -> None:
         if not self.is_recording or not self.is_paused:
             return
-        self.is_paused = False
+        self.engine.resume()
         self.status_var.set("Recording...")
         self._set_buttons_state(recording=True, paused=False)
         self._timer_resume()
-        # Shift next frame time by paused duration to keep timeline contiguous
-        if self._paused_at is not None and self._next_frame_time is not None:
-            paused_dur = max(0.0, time.monotonic() - self._paused_at)
-            self._next_frame_time += paused_dur
-        self._paused_at = None
 
     def stop_recording(self) -> None:
-        if not self.is_recording:
+        if not self.is_recording or self._stop_thread is not None:
             return
-        # Signal thread to stop
-        self.status_var.set("Saving video...")
-        self.stop_event.set()
-        try:
-            if self.record_thread and self.record_thread.is_alive():
-                self.record_thread.join(timeout=5.0)
-        except Exception:
-            pass
-        finally:
-            self.record_thread = None
-            self.is_recording = False
-            self.is_paused = False
+        self._stop_preview()
+        self.status_var.set("Finishing...")
+        self._timer_pause()
+        self._destroy_mini_window()
+        for btn in (
+            self.start_btn,
+            self.pause_btn,
+            self.resume_btn,
+            self.stop_btn,
+            self.save_replay_btn,
+        ):
+            btn.config(state=tk.DISABLED)
+        # Draining the pipeline, joining parts, remuxing and finalizing the index
+        # can take minutes: stop on a worker, whose "finished" post resets the UI
+        self._stop_thread = threading.Thread(
+            target=self._stop_engine,
+            args=(self.engine,),
+            name="ScreenRecorderStop",
+            daemon=True,
+        )
+        self._stop_thread.start()
 
-        # Release writer
+    def _stop_engine(self, engine) -> None:
         try:
-            if self.writer is not None:
-                self.writer.release()
+            engine.stop()
+        except Exception as e:
+            engine.last_error = engine.last_error or str(e)
         finally:
-            self.writer = None
+            self.ui.post("finished")
+
+    def _sync_engine_options(self) -> None:
+        if self.engine is None:
+            return
+        # Multi-monitor recordings in separate processes keep their start settings
+        multi = isinstance(self.engine, MultiMonitorRecorder)
+        for engine in getattr(self.engine, "engines", [self.engine]):
+            cfg = engine.config
+            cfg.follow_fullscreen = bool(self.follow_var.get()) and not multi
+            cfg.show_cursor = bool(self.show_cursor_var.get())
+            cfg.show_clicks = bool(self.show_clicks_var.get())
+            cfg.skip_unchanged = bool(self.skip_unchanged_var.get())
+
+    # ----------------------- ENGINE CALLBACKS -----------------------
+    def _active_trace(self) -> Optional[TraceRecorder]:
+        engine = self.engine
+        if engine is not None and getattr(engine, "engines", None):
+            engine = engine.engines[0]
+        return getattr(engine, "trace", None)
+
+    def _traced(self, name: str, fn: Callable) -> Callable:
+        """Wrap a Tk callback so it shows up as a span in the recording's trace."""
+
+        def run(*args):
+            trace = self._active_trace()
+            if trace is None:
+                return fn(*args)
+            with trace.span(name, "tk"):
+                return fn(*args)
+
+        return run
 
-        # Reset UI
-        self.status_var.set("Ready")
+    # Called from worker threads: only post snapshots, the UI bridge applies them
+    def _on_engine_status(self, text: str) -> None:
+        self.ui.post("status", text)
+
+    def _on_engine_stats(self, stats: dict) -> None:
+        self.ui.post("stats", stats)
+
+    def _on_engine_bbox_changed(self, bbox: BBox) -> None:
+        self.ui.post("bbox", bbox)
+
+    def _on_engine_finished(self) -> None:
+        self.ui.post("finished")
+
+    def _register_ui_handlers(self) -> None:
+        handlers = {
+            "status": self.status_var.set,
+            "stats": self._show_stats,
+            "bbox": self._apply_engine_bbox,
+            "finished": lambda _: self._reset_after_recording(),
+            "topology": lambda _: self._on_topology_changed(),
+            "hotkey_start_stop": lambda _: (
+                self.stop_recording() if self.is_recording else self.start_recording()
+            ),
+            "hotkey_pause": lambda _: self.pause_recording(),
+            "hotkey_resume": lambda _: self.resume_recording(),
+            "hotkey_save_replay": lambda _: self.save_replay(),
+            "transcode": self._on_transcode_progress,
+            "transcode_done": self._on_transcode_done,
+            "encoder_benchmark": self._on_encoder_benchmark,
+            "preview": self._show_preview,
+        }
+        for kind, handler in handlers.items():
+            self.ui.on(kind, self._traced(kind, handler))
+
+    def _apply_engine_bbox(self, bbox: BBox) -> None:
+        self.capture_bbox = bbox
+        self._update_border()
+
+    def _reset_after_recording(self) -> None:
+        # Runs once per recording, however it ended; a late duplicate post is ignored
+        if self._stop_thread is not None:
+            if self._stop_thread.is_alive():
+                return  # the engine is done, stop() is not: _stop_engine posts again
+            self._stop_thread = None
+        if not self._finish_pending:
+            return
+        self._finish_pending = False
+        self._stop_preview()
         self._set_buttons_state(recording=False, paused=False)
+        error = self.engine.last_error if self.engine is not None else None
+        self.status_var.set(f"Error: {error}" if error else "Ready")
         self._timer_reset()
         self._destroy_mini_window()
         # Keep border visible if toggled; update in case ratio changed during rec
         self._update_border()
-        self._stop_mouse_listener()
         self._destroy_stats_overlay()
+        self._queue_spools()
+
+    # ----------------------- LIVE PREVIEW -----------------------
+    def _toggle_preview(self) -> None:
+        if self.preview_var.get():
+            self.preview_frame.pack(side=tk.TOP, fill=tk.X, padx=10, pady=10)
+            if self.is_recording:
+                self._start_preview()
+        else:
+            self._stop_preview()
+            self.preview_frame.pack_forget()
+        self.master.geometry("")  # grow or shrink the window to fit
+
+    def _start_preview(self) -> None:
+        if self.preview is not None or self.engine is None:
+            return
+        self.preview = PreviewSampler(
+            self.engine.latest_frame,
+            lambda ppm, size: self.ui.post("preview", (ppm, size)),
+            frame_seq=self.engine.latest_frame_seq,
+        )
+        self.preview.trace = getattr(self.engine, "trace", None)
+        self.preview.start()
+        self.preview_info_var.set(f"Sampling up to {PREVIEW_FPS:g} fps...")
+
+    def _stop_preview(self) -> None:
+        preview, self.preview = self.preview, None
+        if preview is None:
+            return
+        preview.stop()
+        self.preview_lbl.config(image="", text="The preview appears while recording")
+        self.preview_info_var.set("")
+
+    def _show_preview(self, value) -> None:
+        # Runs on the Tk thread: only loads the ready-made PPM into the PhotoImage
+        if self.preview is None:
+            return  # a frame posted just before the preview was stopped
+        ppm, _size = value
+        if self._preview_photo is None:
+            self._preview_photo = tk.PhotoImage(master=self.master)
+        self._preview_photo.configure(data=ppm)
+        self.preview_lbl.config(image=self._preview_photo, text="")
+        cost = self.preview.cost()
+        self.preview_info_var.set(
+            f"{cost['fps']:.1f} fps, {cost['ms']:.1f} ms per frame "
+            f"({cost['cpu_pct']:.1f}% of one core)"
+        )
+
+    # ----------------------- ENCODE LATER -----------------------
+    def _queue_spools(self) -> None:
+        """Hand the finished recording's spools to the background transcoder."""
+        spools, self._pending_spools = self._pending_spools, []
+        self._spool_queue.extend(p for p in spools if os.path.exists(p))
+        self._start_next_transcode()
+
+    def _offer_leftover_spools(self) -> None:
+        directory = self.output_dir_var.get().strip() or os.getcwd()
+        spools = [p for p in find_spools(directory) if p not in self._spool_queue]
+        if not spools:
+            return
+        try:
+            if messagebox.askyesno(
+                "Unfinished recordings",
+                f"{len(spools)} recording(s) in {directory} were not encoded yet. "
+                "Encode them now?",
+            ):
+                self._spool_queue.extend(spools)
+                self._start_next_transcode()
+        except Exception:
+            pass
+
+    def _start_next_transcode(self) -> None:
+        if self.transcoder is not None and self.transcoder.is_alive():
+            return
+        self.transcoder = None
+        while self._spool_queue:
+            spool = self._spool_queue.popleft()
+            if os.path.exists(spool):
+                break
+        else:
+            self._show_transcode_progress(False)
+            return
+        self.transcoder = SpoolTranscoder(
+            spool,
+            on_progress=lambda done, total: self.ui.post("transcode", (done, total)),
+            on_done=lambda job: self.ui.post("transcode_done", job),
+        )
+        self.transcoder.start()
+        self._show_transcode_progress(True)
+        self.status_var.set(f"Encoding {os.path.basename(spool)}...")
+
+    def cancel_transcode(self) -> None:
+        """Stop encoding; the spool and finished parts are kept and resume next time."""
+        self._spool_queue.clear()
+        if self.transcoder is not None:
+            self.transcoder.cancel()
+
+    def _show_transcode_progress(self, visible: bool) -> None:
+        try:
+            if visible:
+                self.transcode_bar.config(value=0.0)
+                self.transcode_cancel_btn.pack(side=tk.RIGHT)
+                self.transcode_bar.pack(side=tk.RIGHT, padx=6)
+            else:
+                self.transcode_bar.pack_forget()
+                self.transcode_cancel_btn.pack_forget()
+        except Exception:
+            pass
+
+    def _on_transcode_progress(self, progress: Tuple[int, int]) -> None:
+        done, total = progress
+        pct = 100.0 * done / total if total else 0.0
+        self.transcode_bar.config(value=pct)
+        if not self.is_recording and self.transcoder is not None:
+            self.status_var.set(
+                f"Encoding {os.path.basename(self.transcoder.spool_path)}: {pct:.0f}%"
+            )
+
+    def _on_transcode_done(self, job: SpoolTranscoder) -> None:
+        if job.error:
+            text = f"Encoding failed: {job.error}"
+        elif job.cancelled:
+            text = "Encoding cancelled; it resumes the next time the app starts"
+        else:
+            text = f"Saved: {job.output_path}"
+        if not self.is_recording:
+            self.status_var.set(text)
+        self._start_next_transcode()
 
     def _set_buttons_state(self, recording: bool, paused: bool) -> None:
         if not recording:
@@ -419,12 +6475,51 @@ class ScreenRecorderApp:
             self.stop_btn.config(state=tk.DISABLED)
             self.ratio_menu.config(state=tk.NORMAL)
             self.follow_chk.config(state=tk.NORMAL)
+            self.encoder_menu.config(state=tk.NORMAL)
+            self.encoder_profile_menu.config(state=tk.NORMAL)
+            self.vfr_chk.config(state=tk.NORMAL)
+            self.monitor_menu.config(state=tk.NORMAL)
+            self.monitor_proc_chk.config(state=tk.NORMAL)
+            self.workers_spin.config(state=tk.NORMAL)
+            if self._benchmark_thread is None or not self._benchmark_thread.is_alive():
+                self.benchmark_btn.config(state=tk.NORMAL)
+            self.segment_min_spin.config(state=tk.NORMAL)
+            self.segment_mb_spin.config(state=tk.NORMAL)
+            self.replay_chk.config(state=tk.NORMAL)
+            self.replay_secs_spin.config(state=tk.NORMAL)
+            self.output_scale_menu.config(state=tk.NORMAL)
+            self.adaptive_chk.config(state=tk.NORMAL)
+            self.spool_chk.config(state=tk.NORMAL)
+            self.index_chk.config(state=tk.NORMAL)
+            self.fps_menu.config(state=tk.NORMAL)
+            self.trace_chk.config(state=tk.NORMAL)
+            self.save_replay_btn.config(state=tk.DISABLED)
         else:
             # During recording
             self.start_btn.config(state=tk.DISABLED)
             self.stop_btn.config(state=tk.NORMAL)
             self.ratio_menu.config(state=tk.DISABLED)
             self.follow_chk.config(state=tk.NORMAL)
+            self.encoder_menu.config(state=tk.DISABLED)
+            self.encoder_profile_menu.config(state=tk.DISABLED)
+            self.vfr_chk.config(state=tk.DISABLED)
+            self.monitor_menu.config(state=tk.DISABLED)
+            self.monitor_proc_chk.config(state=tk.DISABLED)
+            self.workers_spin.config(state=tk.DISABLED)
+            self.benchmark_btn.config(state=tk.DISABLED)
+            self.segment_min_spin.config(state=tk.DISABLED)
+            self.segment_mb_spin.config(state=tk.DISABLED)
+            self.replay_chk.config(state=tk.DISABLED)
+            self.replay_secs_spin.config(state=tk.DISABLED)
+            self.output_scale_menu.config(state=tk.DISABLED)
+            self.adaptive_chk.config(state=tk.DISABLED)
+            self.spool_chk.config(state=tk.DISABLED)
+            self.index_chk.config(state=tk.DISABLED)
+            self.fps_menu.config(state=tk.DISABLED)
+            self.trace_chk.config(state=tk.DISABLED)
+            self.save_replay_btn.config(
+                state=tk.NORMAL if self.replay_var.get() else tk.DISABLED
+            )
             if paused:
                 self.pause_btn.config(state=tk.DISABLED)
                 self.resume_btn.config(state=tk.NORMAL)
@@ -433,7 +6528,12 @@ class ScreenRecorderApp:
                 self.resume_btn.config(state=tk.DISABLED)
 
         # Mirror state to mini window buttons if present
-        if self.mini_win is not None and self._mini_btn_pause is not None and self._mini_btn_continue is not None and self._mini_btn_stop is not None:
+        if (
+            self.mini_win is not None
+            and self._mini_btn_pause is not None
+            and self._mini_btn_continue is not None
+            and self._mini_btn_stop is not None
+        ):
             if not recording:
                 self._mini_btn_pause.config(state=tk.DISABLED)
                 self._mini_btn_continue.config(state=tk.DISABLED)
@@ -447,197 +6547,45 @@ class ScreenRecorderApp:
                     self._mini_btn_pause.config(state=tk.NORMAL)
                     self._mini_btn_continue.config(state=tk.DISABLED)
 
-    # ----------------------- RECORDING LOOP -----------------------
-    def _record_loop(self) -> None:
-        """
-        Runs in a background thread. Captures frames using MSS and writes them via OpenCV.
-        - Caps FPS to ~target_fps.
-        - Honors pause without tearing down the writer.
-        - If "Follow Full Screen" is enabled, periodically updates the capture bbox
-          (writer frame size stays constant; frames are resized to writer_size if needed).
-        """
-        frame_interval = 1.0 / float(self.target_fps)
-        last_follow_check = 0.0
-
-        try:
-            with mss.mss() as sct:
-                while not self.stop_event.is_set():
-                    start_time = time.monotonic()
-
-                    if self.is_paused:
-                        # When paused, don't capture or write frames; keep CPU usage low
-                        time.sleep(0.1)
-                        # Optionally still respond to follow fullscreen
-                        if self.follow_var.get() and (start_time - last_follow_check) >= 0.5:
-                            self._maybe_update_bbox_follow(sct)
-                            last_follow_check = start_time
-                        continue
-
-                    # Follow full-screen window if enabled (best-effort)
-                    if self.follow_var.get() and (start_time - last_follow_check) >= 0.5:
-                        self._maybe_update_bbox_follow(sct)
-                        last_follow_check = start_time
-
-                    bbox = self.capture_bbox
-                    if bbox is None:
-                        time.sleep(0.05)
-                        continue
-
-                    # Capture frame
-                    img = sct.grab(bbox.as_mss())
-                    frame = np.array(img, dtype=np.uint8)  # BGRA
-                    frame_bgr = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)  # BGRA -> BGR
-                    # Overlay cursor and clicks if enabled
-                    frame_bgr = self._draw_cursor_and_clicks(frame_bgr, bbox)
-                    self._last_frame_bgr = frame_bgr
-
-                    # Write frames according to schedule to maintain CFR duration
-                    now = time.monotonic()
-                    if self._next_frame_time is None:
-                        self._next_frame_time = now
-
-                    # Prepare sized frame once; duplicates reuse it
-                    w0, h0 = frame_bgr.shape[1], frame_bgr.shape[0]
-                    w, h = self.writer_size
-                    if (w0 != w) or (h0 != h):
-                        interp = cv2.INTER_AREA if (w0 > w or h0 > h) else cv2.INTER_LINEAR
-                        sized_frame = cv2.resize(frame_bgr, (int(w), int(h)), interpolation=interp)
-                    else:
-                        sized_frame = frame_bgr
-
-                    duplicates_written = 0
-                    max_dup_per_loop = 5  # safety bound
-                    while (not self.is_paused) and (not self.stop_event.is_set()) and (now + 1e-5) >= self._next_frame_time:
-                        if self.writer is not None:
-                            self.writer.write(sized_frame)
-                            self._write_count_current += 1
-                            if duplicates_written > 0:
-                                self._dup_count_current += 1
-                        self._next_frame_time += frame_interval
-                        duplicates_written += 1
-                        if duplicates_written >= max_dup_per_loop:
-                            break
-                        now = time.monotonic()
-
-                    # Sleep until next frame time to avoid busy loop
-                    now = time.monotonic()
-                    sleep_for = self._next_frame_time - now
-                    if sleep_for > 0:
-                        time.sleep(min(sleep_for, 0.02))
-                    # Update capture count and maybe refresh stats overlay
-                    self._capture_count_current += 1
-                    self._maybe_update_stats()
-        except Exception as e:
-            # Ensure UI reflects failure and we attempt a clean stop
-            self.status_var.set(f"Error: {e}")
-        finally:
-            # Safe release in case of exceptions
-            try:
-                if self.writer is not None:
-                    self.writer.release()
-            finally:
-                self.writer = None
-                self.is_recording = False
-                self.is_paused = False
-                self.stop_event.set()
-                # UI updates must be scheduled on the main thread
-                self.master.after(0, lambda: self._set_buttons_state(recording=False, paused=False))
-                self.master.after(0, lambda: self.status_var.set("Ready"))
-                self.master.after(0, self._timer_reset)
-                self.master.after(0, self._destroy_mini_window)
-                self.master.after(0, self._update_border)
-                self.master.after(0, self._destroy_stats_overlay)
-
-    # -------------------- FOLLOW FULL SCREEN (X11) --------------------
-    def _maybe_update_bbox_follow(self, sct: mss.mss) -> None:
-        """Best-effort detection of active full-screen window on X11.
-        Requires 'xprop' and 'xwininfo'. If not available or error occurs, silently ignore.
-        The capture bbox is updated if a full-screen app is detected.
-        """
-        try:
-            bbox = self._detect_active_fullscreen_bbox(sct)
-            if bbox is not None:
-                self.capture_bbox = bbox
-                # Schedule border update on main thread
-                self.master.after(0, self._update_border)
-                # Keep writer_size unchanged; we will resize frames as needed
-        except Exception:
-            pass
-
-    def _detect_active_fullscreen_bbox(self, sct: mss.mss) -> Optional[BBox]:
-        # Tools required
-        if shutil.which("xprop") is None or shutil.which("xwininfo") is None:
-            return None
-        # Get active window id
-        try:
-            out = subprocess.check_output(["xprop", "-root", "_NET_ACTIVE_WINDOW"], stderr=subprocess.DEVNULL, text=True)
-            # Example: _NET_ACTIVE_WINDOW(WINDOW): window id # 0x06000007
-            wid_hex = out.strip().split()[-1]
-            if wid_hex == "0x0":
-                return None
-        except Exception:
-            return None
-
-        # Check if window is fullscreen
-        try:
-            state_out = subprocess.check_output(["xprop", "-id", wid_hex, "_NET_WM_STATE"], stderr=subprocess.DEVNULL, text=True)
-            is_fullscreen = "_NET_WM_STATE_FULLSCREEN" in state_out
-        except Exception:
-            is_fullscreen = False
-
-        # Get window geometry
-        try:
-            winfo = subprocess.check_output(["xwininfo", "-id", wid_hex], stderr=subprocess.DEVNULL, text=True)
-        except Exception:
-            return None
-
-        # Parse geometry
-        # Lines of interest:
-        #   Absolute upper-left X:  0
-        #   Absolute upper-left Y:  0
-        #   Width: 1920
-        #   Height: 1080
-        x = y = w = h = None
-        for line in winfo.splitlines():
-            line = line.strip()
-            if line.startswith("Absolute upper-left X:"):
-                x = int(line.split(":")[1])
-            elif line.startswith("Absolute upper-left Y:"):
-                y = int(line.split(":")[1])
-            elif line.startswith("Width:"):
-                w = int(line.split(":")[1])
-            elif line.startswith("Height:"):
-                h = int(line.split(":")[1])
-        if None in (x, y, w, h):
-            return None
-
-        # If not marked fullscreen, heuristically check if it matches monitor size
-        mon = self._get_primary_monitor_rect()
-        if not is_fullscreen:
-            if abs(w - mon.width) <= 2 and abs(h - mon.height) <= 2:
-                is_fullscreen = True
-        if not is_fullscreen:
-            return None
-
-        # Ensure even dims
-        w = self._even(w)
-        h = self._even(h)
-        return BBox(left=x, top=y, width=w, height=h)
-
     # -------------------------- LIFECYCLE --------------------------
     def on_close(self) -> None:
+        if self._closing:
+            return  # already waiting for the recording to be saved
         if self.is_recording:
-            if messagebox.askyesno("Quit", "Recording is in progress. Stop and quit?"):
-                try:
-                    self.stop_recording()
-                finally:
-                    self.master.after(100, self.master.destroy)
-            else:
+            if not messagebox.askyesno(
+                "Quit", "Recording is in progress. Stop and quit?"
+            ):
                 return
-        else:
-            self.master.destroy()
+            self.stop_recording()
+        elif (
+            self._stop_thread is None
+            and self.transcoder is not None
+            and self.transcoder.is_alive()
+        ):
+            if not messagebox.askyesno(
+                "Quit",
+                "A recording is still being encoded. Quit anyway? "
+                "Encoding resumes the next time the app starts.",
+            ):
+                return
+        self._closing = True
+        self._close_when_stopped()
+
+    def _close_when_stopped(self) -> None:
+        # Destroying the window while the engine finalizes would cut the file short
+        if self._stop_thread is not None and self._stop_thread.is_alive():
+            self.status_var.set("Finishing... closing once the video is saved")
+            self.master.after(100, self._close_when_stopped)
+            return
+        self.master.destroy()
+        # Spools not encoded yet stay on disk and are offered again at the next start
+        self._benchmark_cancel.set()
+        self._stop_preview()
+        self.cancel_transcode()
+        if self.transcoder is not None:
+            self.transcoder.join(timeout=5.0)
+        self.ui.stop()
         self._stop_hotkeys()
-        self._stop_mouse_listener()
 
     # --------------------- BORDER OVERLAY WINDOWS ---------------------
     def _ensure_border_windows(self) -> None:
@@ -685,10 +6633,10 @@ class ScreenRecorderApp:
         # Calculate geometries
         x, y, w, h = bbox.left, bbox.top, bbox.width, bbox.height
         sides = {
-            "top":    (x, y, w, bw),
+            "top": (x, y, w, bw),
             "bottom": (x, y + h - bw, w, bw),
-            "left":   (x, y, bw, h),
-            "right":  (x + w - bw, y, bw, h),
+            "left": (x, y, bw, h),
+            "right": (x + w - bw, y, bw, h),
         }
         for key, geom in sides.items():
             wdw = self._border_windows.get(key)
@@ -742,16 +6690,19 @@ class ScreenRecorderApp:
 
     # ------------------------ GLOBAL HOTKEYS ------------------------
     def _start_hotkeys(self) -> None:
-        if not _HAVE_PYNPUT:
+        if not _have_pynput():
             return
         if self._hotkey_listener is not None:
             return
         try:
-            self._hotkey_listener = keyboard.GlobalHotKeys({
-                '<alt>+<shift>+s': self._hotkey_start_stop,
-                '<alt>+<shift>+p': self._hotkey_pause,
-                '<alt>+<shift>+r': self._hotkey_resume,
-            })
+            self._hotkey_listener = keyboard.GlobalHotKeys(
+                {
+                    "<alt>+<shift>+s": self._hotkey_start_stop,
+                    "<alt>+<shift>+p": self._hotkey_pause,
+                    "<alt>+<shift>+r": self._hotkey_resume,
+                    "<alt>+<shift>+b": self._hotkey_save_replay,
+                }
+            )
             self._hotkey_listener.start()
         except Exception:
             self._hotkey_listener = None
@@ -773,96 +6724,50 @@ class ScreenRecorderApp:
         except Exception:
             pass
 
+    # Hotkeys fire on the pynput listener thread; the UI bridge hands them to Tk
     def _hotkey_start_stop(self) -> None:
         # Alt+Shift+S: Start or Stop depending on state
-        self.master.after(0, lambda: self.stop_recording() if self.is_recording else self.start_recording())
+        self.ui.post("hotkey_start_stop")
 
     def _hotkey_pause(self) -> None:
         if self.is_recording and not self.is_paused:
-            self.master.after(0, self.pause_recording)
+            self.ui.post("hotkey_pause")
 
     def _hotkey_resume(self) -> None:
         if self.is_recording and self.is_paused:
-            self.master.after(0, self.resume_recording)
-
-    # -------------------- MOUSE CURSOR & CLICKS --------------------
-    def _start_mouse_listener(self) -> None:
-        if not _HAVE_PYNPUT or self._mouse_listener is not None:
-            return
-        try:
-            def on_move(x, y):
-                with self._mouse_lock:
-                    self._mouse_pos_abs = (x, y)
-            def on_click(x, y, button, pressed):
-                if pressed and self.show_clicks_var.get():
-                    with self._mouse_lock:
-                        self._click_ripples.append((time.monotonic(), (x, y), str(button)))
-            self._mouse_listener = pynput_mouse.Listener(on_move=on_move, on_click=on_click)
-            self._mouse_listener.start()
-        except Exception:
-            self._mouse_listener = None
-
-    def _stop_mouse_listener(self) -> None:
-        if self._mouse_listener is not None:
-            try:
-                self._mouse_listener.stop()
-            except Exception:
-                pass
-            self._mouse_listener = None
+            self.ui.post("hotkey_resume")
 
-    def _draw_cursor_and_clicks(self, frame_bgr: np.ndarray, bbox: BBox) -> np.ndarray:
-        h, w = frame_bgr.shape[:2]
-        # Cursor overlay
-        with self._mouse_lock:
-            mx, my = self._mouse_pos_abs
-            ripples = list(self._click_ripples)
-        # Translate absolute to local bbox
-        cx = mx - bbox.left
-        cy = my - bbox.top
-        # Draw cursor dot if enabled and in bounds
-        if self.show_cursor_var.get() and 0 <= cx < w and 0 <= cy < h:
-            cv2.circle(frame_bgr, (int(cx), int(cy)), 6, (0, 255, 255), thickness=-1)  # yellow dot
-            cv2.circle(frame_bgr, (int(cx), int(cy)), 10, (0, 200, 200), thickness=2)
-        # Draw click ripples (fade over 0.6s)
-        if self.show_clicks_var.get():
-            now = time.monotonic()
-            new_ripples = deque()
-            for t0, (rx, ry), btn in ripples:
-                age = now - t0
-                if age > 0.6:
-                    continue
-                lx = rx - bbox.left
-                ly = ry - bbox.top
-                if 0 <= lx < w and 0 <= ly < h:
-                    radius = int(10 + 60 * (age / 0.6))
-                    alpha = max(0.0, 1.0 - (age / 0.6))
-                    color = (0, 0, 255) if 'left' in btn else (255, 0, 0)
-                    cv2.circle(frame_bgr, (int(lx), int(ly)), radius, color, thickness=2)
-                    # A simple fade by drawing thinner circles
-                new_ripples.append((t0, (rx, ry), btn))
-            with self._mouse_lock:
-                self._click_ripples = new_ripples
-        return frame_bgr
+    def _hotkey_save_replay(self) -> None:
+        # Alt+Shift+B: save the instant-replay buffer
+        if self.is_recording:
+            self.ui.post("hotkey_save_replay")
 
     # -------------------------- STATS OVERLAY --------------------------
-    def _maybe_update_stats(self) -> None:
+    def _show_stats(self, stats: dict) -> None:
         if not self.show_stats_var.get():
             return
-        now = time.monotonic()
-        if now - self._last_stats_time < 1.0:
-            return
-        # Compute rates and reset counters
-        dt = now - self._last_stats_time
-        cap_fps = self._capture_count_current / dt if dt > 0 else 0.0
-        write_fps = self._write_count_current / dt if dt > 0 else 0.0
-        dup = self._dup_count_current
-        self._capture_count_current = 0
-        self._write_count_current = 0
-        self._dup_count_current = 0
-        self._last_stats_time = now
         # Update overlay text
         if self._stats_lbl is not None:
-            txt = f"Capture FPS: {cap_fps:.1f}\nWritten FPS: {write_fps:.1f}\nDup frames/s: {dup}"
+            txt = (
+                f"Capture FPS: {stats['capture_fps']:.1f}"
+                f"\nWritten FPS: {stats['write_fps']:.1f}"
+                f"\nDup frames/s: {stats['dup_per_s']}"
+                f"\nDropped/s: {stats['dropped_per_s']}"
+                f"\nStatic: {stats['unchanged_pct']:.0f}%"
+                f"  Tiles changed: {stats['tiles_changed_pct']:.0f}%"
+                f"\nLate: {stats.get('late_ms_avg', 0.0):.2f} ms avg,"
+                f" {stats.get('late_ms_max', 0.0):.2f} max"
+            )
+            if stats.get("quality"):
+                txt += f"\nQuality: {stats['quality']}"
+            if "spool_mb" in stats:
+                txt += f"\nSpool: {stats['spool_mb']:.0f} MB"
+            stages = stats.get("stages")
+            if stages:
+                txt += "\np95 ms: " + "  ".join(
+                    f"{name} {stages[name]['p95_ms']:.1f}"
+                    for name in ("grab", "convert", "overlay", "write")
+                )
             try:
                 self._stats_lbl.config(text=txt)
             except Exception:
@@ -921,7 +6826,7 @@ class ScreenRecorderApp:
 
     # ----------------------- AREA SELECTION -----------------------
     def _start_area_selection(self) -> None:
-        mon = self._get_primary_monitor_rect()
+        mon = self._selected_monitor_rect()
         sel = tk.Toplevel(self.master)
         sel.overrideredirect(True)
         try:
@@ -960,10 +6865,7 @@ class ScreenRecorderApp:
             width = self._even(width)
             height = self._even(height)
             if width >= 4 and height >= 4:
-                self.capture_bbox = BBox(left=left, top=top, width=width, height=height)
-                self.writer_size = (width, height)
-                self.size_var.set(f"Area: {width}x{height} @ ({left},{top})")
-                self._update_border()
+                self._set_area(BBox(left=left, top=top, width=width, height=height))
             sel.destroy()
 
         canvas.bind('<ButtonPress-1>', on_down)
@@ -1023,9 +6925,10 @@ class ScreenRecorderApp:
                 self.mini_timer_var.set(text)
             # Continue ticking while recording
             if self.is_recording:
-                self._timer_after_id = self.master.after(200, _tick)
+                self._timer_after_id = self.master.after(200, tick)
 
-        self._timer_after_id = self.master.after(200, _tick)
+        tick = self._traced("timer_tick", _tick)
+        self._timer_after_id = self.master.after(200, tick)
 
     # --------------------- MINI CONTROL WINDOW ---------------------
     def _open_mini_window(self) -> None:
@@ -1114,31 +7017,705 @@ def ensure_dependencies() -> bool:
     """Optional check to provide a helpful message if MSS/OpenCV are missing.
     Returns True when everything looks okay.
     """
-    missing = []
-    try:
-        import mss as _  # noqa: F401
-    except Exception:
-        missing.append("mss")
-    try:
-        import cv2 as _  # noqa: F401
-    except Exception:
-        missing.append("opencv-python")
-    try:
-        import numpy as _  # noqa: F401
-    except Exception:
-        missing.append("numpy")
+    # Only look the packages up; they are imported on first use
+    required = (("mss", "mss"), ("cv2", "opencv-python"), ("numpy", "numpy"))
+    missing = [
+        package
+        for module, package in required
+        if importlib.util.find_spec(module) is None
+    ]
 
     if missing:
         msg = (
-            "Missing dependencies: " + ", ".join(missing) +
-            "\nInstall them with:\n  pip install mss opencv-python numpy"
+            "Missing dependencies: "
+            + ", ".join(missing)
+            + "\nInstall them with:\n  pip install mss opencv-python numpy"
         )
         print(msg, file=sys.stderr)
         return False
     return True
 
 
-if __name__ == "__main__":
+# ----------------------------- CLI -----------------------------
+def _build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="screen_recorder",
+        description="HRaJi Screen Recorder. Run without a command to open the GUI.",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="On exit, print lazy import times and startup milestones (window shown, "
+        "first frame captured/written) on stderr",
+    )
+    parser.add_argument(
+        "--startup-profile-json",
+        metavar="PATH",
+        default=None,
+        help="Append the startup profile as a JSON line to PATH "
+        "(for benchmark tracking)",
+    )
+    sub = parser.add_subparsers(dest="command")
+    rec = sub.add_parser(
+        "record", help="Record without the GUI (no Tk window is created)"
+    )
+    rec.add_argument(
+        "--region",
+        default="full",
+        help="'full', an aspect ratio centered on the primary monitor (e.g. 16:9), "
+        "or WIDTHxHEIGHT+LEFT+TOP (default: full)",
+    )
+    rec.add_argument(
+        "--monitor",
+        default=MONITOR_PRIMARY,
+        help="'primary', 'all' (virtual desktop, one file), 'each' (one file per "
+        "monitor, recorded in parallel) or a monitor number (default: primary)",
+    )
+    rec.add_argument(
+        "--processes",
+        action="store_true",
+        help="With --monitor each: run every monitor's pipeline in its own process",
+    )
+    rec.add_argument(
+        "--source",
+        choices=("screen", "synthetic", "replay"),
+        default="screen",
+        help="Frame source: live screen, a synthetic test pattern, or a replayed file",
+    )
+    rec.add_argument(
+        "--input", help="Video file or raw dump (.bgra/.raw/.bgr) for --source replay"
+    )
+    rec.add_argument(
+        "--size",
+        default="1920x1080",
+        help="WIDTHxHEIGHT of the synthetic pattern or of raw dump frames "
+        "(default: 1920x1080)",
+    )
+    rec.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Output size relative to the region, applied right after capture "
+        "(e.g. 0.5)",
+    )
+    rec.add_argument(
+        "--max-width",
+        type=int,
+        default=None,
+        help="Shrink the output to at most this width",
+    )
+    rec.add_argument(
+        "--metrics",
+        metavar="PATH",
+        default=None,
+        help="Write per-stage latency percentiles, queue depths and drops every "
+        "second: JSON lines, or a Prometheus textfile if PATH ends in .prom",
+    )
+    rec.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Under CPU/encoder load, halve the frame rate, then use faster x264 "
+        "presets instead of stuttering; restored when there is headroom (changes are "
+        "logged)",
+    )
+    rec.add_argument(
+        "--spool",
+        action="store_true",
+        help="Capture now, encode later: store frames in a memory-mapped spool while "
+        "recording (no video encoding) and encode it at low priority after stop",
+    )
+    rec.add_argument(
+        "--spool-codec",
+        choices=SPOOL_CODECS,
+        default=SPOOL_AUTO,
+        help="Spool frame compression: raw (no CPU, most disk), lz4 (needs the lz4 "
+        "package) or zlib; auto prefers lz4 (default: auto)",
+    )
+    rec.add_argument(
+        "--trace",
+        metavar="PATH",
+        default=None,
+        help="Write a Chrome trace-event timeline of the pipeline threads at stop "
+        "(open in Perfetto)",
+    )
+    rec.add_argument(
+        "--trace-events",
+        type=int,
+        default=200000,
+        help="Trace ring size; older events are overwritten (default: 200000)",
+    )
+    rec.add_argument(
+        "--fps",
+        type=float,
+        default=30.0,
+        help=f"Target frames per second, up to {MAX_TARGET_FPS:g} (default: 30)",
+    )
+    rec.add_argument(
+        "--duration",
+        type=float,
+        default=None,
+        help="Seconds to record (default: until Ctrl+C or SIGTERM)",
+    )
+    rec.add_argument(
+        "-o",
+        "--output",
+        default="HRaJi_%Y-%m-%d_%H-%M-%S.mp4",
+        help="Output file; strftime placeholders are expanded",
+    )
+    rec.add_argument(
+        "--no-cursor",
+        dest="show_cursor",
+        action="store_false",
+        help="Do not draw the cursor",
+    )
+    rec.add_argument(
+        "--no-clicks",
+        dest="show_clicks",
+        action="store_false",
+        help="Do not draw click ripples",
+    )
+    rec.add_argument(
+        "--follow",
+        action="store_true",
+        help="Follow the active full-screen window (X11)",
+    )
+    rec.add_argument(
+        "--no-skip-unchanged",
+        dest="skip_unchanged",
+        action="store_false",
+        help="Process every frame even when the screen did not change",
+    )
+    rec.add_argument(
+        "--vfr",
+        action="store_true",
+        help="Variable frame rate: write each distinct frame once with its timestamp "
+        "(timecode sidecar; muxed to .mkv when mkvmerge is available)",
+    )
+    rec.add_argument(
+        "--no-index",
+        dest="frame_index",
+        action="store_false",
+        help="Do not write the '<output>.idx' seek index used by 'seek' and 'trim'",
+    )
+    rec.add_argument(
+        "--encoder",
+        choices=ENCODERS,
+        default=ENCODER_AUTO,
+        help="Video encoder; auto picks the fastest benchmarked backend of "
+        "--encoder-profile (default: auto)",
+    )
+    rec.add_argument(
+        "--encoder-profile",
+        choices=tuple(ENCODER_PROFILES),
+        default=PROFILE_DEFAULT,
+        help="What auto optimizes for: small files (H.264), balanced (also MPEG-4), "
+        "fastest (also MJPEG) or lossless (FFV1) (default: small)",
+    )
+    rec.add_argument(
+        "--no-benchmark",
+        dest="benchmark",
+        action="store_false",
+        help="With auto, do not benchmark encoders on first use; fall back to x264, "
+        "else mp4v",
+    )
+    rec.add_argument(
+        "--preset",
+        choices=X264_PRESETS,
+        default="veryfast",
+        help="x264 preset (default: veryfast)",
+    )
+    rec.add_argument(
+        "--crf", type=int, default=23, help="x264 CRF quality, 0-51 (default: 23)"
+    )
+    rec.add_argument(
+        "--encode-workers",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Encode GOP-sized chunks in N parallel processes and join them at stop "
+        "(needs ffmpeg)",
+    )
+    rec.add_argument(
+        "--chunk-seconds",
+        type=float,
+        default=2.0,
+        help="Chunk length for --encode-workers (default: 2)",
+    )
+    rec.add_argument(
+        "--segment-seconds",
+        type=float,
+        default=0.0,
+        help="Start a new file every N seconds of video (0 = off)",
+    )
+    rec.add_argument(
+        "--segment-mb",
+        type=float,
+        default=0.0,
+        help="Start a new file every N MB (0 = off)",
+    )
+    rec.add_argument(
+        "--replay",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Instant replay: keep the last SECONDS in memory and write them on "
+        "SIGUSR1 and when recording ends, instead of recording everything",
+    )
+    rec.add_argument(
+        "--replay-mb",
+        type=float,
+        default=512.0,
+        help="Memory cap of the replay buffer (default: 512)",
+    )
+    rec.add_argument(
+        "--queue-depth",
+        type=int,
+        default=4,
+        help="Frames buffered between pipeline stages",
+    )
+    rec.add_argument(
+        "--drop-policy",
+        choices=DROP_POLICIES,
+        default=DROP_OLDEST,
+        help="What to do when a pipeline stage falls behind",
+    )
+    enc = sub.add_parser(
+        "encoders", help="Benchmark the encoder backends and show what auto picks"
+    )
+    enc.add_argument(
+        "--size",
+        default=None,
+        help="WIDTHxHEIGHT to benchmark (default: the primary monitor)",
+    )
+    enc.add_argument(
+        "--preset",
+        choices=X264_PRESETS,
+        default="veryfast",
+        help="x264 preset (default: veryfast)",
+    )
+    enc.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Benchmark again even if results are cached",
+    )
+    sk = sub.add_parser(
+        "seek",
+        help="Find the frame and keyframe for a moment of a recording (uses its .idx)",
+    )
+    sk.add_argument("video", help="Recorded video with a seek index")
+    sk.add_argument(
+        "--at", default=None, help="Time into the video: seconds or [HH:]MM:SS[.f]"
+    )
+    sk.add_argument(
+        "--wall",
+        default=None,
+        help="Wall-clock moment: ISO date-time, or HH:MM[:SS] on the day the "
+        "recording started",
+    )
+    tm = sub.add_parser(
+        "trim",
+        help="Cut a range out of a recording at keyframes without re-encoding "
+        "(needs ffmpeg)",
+    )
+    tm.add_argument("video", help="Recorded video with a seek index")
+    tm.add_argument(
+        "--from",
+        dest="start",
+        default=None,
+        help="Start: seconds or [HH:]MM:SS[.f] (default: beginning)",
+    )
+    tm.add_argument(
+        "--to",
+        dest="end",
+        default=None,
+        help="End, same format (default: end of the video)",
+    )
+    tm.add_argument(
+        "--wall",
+        action="store_true",
+        help="--from/--to are wall-clock moments (see 'seek --wall')",
+    )
+    tm.add_argument(
+        "-o", "--output", default=None, help="Clip path (default: <video>_trim.<ext>)"
+    )
+    tr = sub.add_parser(
+        "transcode",
+        help="Encode spools left by 'record --spool' (resumes interrupted encodes)",
+    )
+    tr.add_argument(
+        "spools", nargs="+", metavar="SPOOL", help="Spool file(s) to encode"
+    )
+    tr.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="Video path for a single spool (default: next to the spool)",
+    )
+    tr.add_argument(
+        "--keep-spool",
+        action="store_true",
+        help="Do not delete the spool after encoding",
+    )
+    return parser
+
+
+def _parse_size(text: str) -> Tuple[int, int]:
+    m = re.fullmatch(r"(\d+)x(\d+)", text.strip().lower())
+    if m is None:
+        raise ValueError(f"Invalid size '{text}': expected WIDTHxHEIGHT")
+    return int(m.group(1)), int(m.group(2))
+
+
+def _make_frame_source(args: argparse.Namespace) -> FrameSource:
+    if args.source == "synthetic":
+        w, h = _parse_size(args.size)
+        return SyntheticFrameSource(w, h, fps=args.fps)
+    if args.source == "replay":
+        if not args.input:
+            raise ValueError("--source replay needs --input PATH")
+        return ReplayFrameSource(args.input, size=_parse_size(args.size))
+    return MssFrameSource()
+
+
+def run_record(args: argparse.Namespace) -> int:
+    """Headless recording for scripts and cron jobs."""
+    if not 0 < args.fps <= MAX_TARGET_FPS:
+        print(f"--fps must be in (0, {MAX_TARGET_FPS:g}]", file=sys.stderr)
+        return 2
+    if not 0 < args.scale <= 1 or (args.max_width is not None and args.max_width < 16):
+        print("--scale must be in (0, 1] and --max-width at least 16", file=sys.stderr)
+        return 2
+    if args.monitor != MONITOR_PRIMARY and args.source != "screen":
+        print("--monitor needs --source screen", file=sys.stderr)
+        return 2
+    if args.encode_workers > 1 and shutil.which("ffmpeg") is None:
+        print("--encode-workers needs ffmpeg to join the parts", file=sys.stderr)
+        return 2
+    try:
+        source = _make_frame_source(args)
+        mon = (
+            source.bounds()
+            if args.monitor in (MONITOR_PRIMARY, MONITOR_EACH)
+            else monitor_rect(args.monitor)
+        )
+        bbox = parse_region(args.region, mon)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    out_dir, template = os.path.split(args.output)
+    config = RecorderConfig(
+        output_path=build_output_path(out_dir or os.getcwd(), template),
+        bbox=bbox,
+        target_fps=args.fps,
+        queue_depth=args.queue_depth,
+        drop_policy=args.drop_policy,
+        show_cursor=args.show_cursor,
+        show_clicks=args.show_clicks,
+        follow_fullscreen=args.follow,
+        source=source,
+        encoder=args.encoder,
+        encoder_profile=args.encoder_profile,
+        x264_preset=args.preset,
+        crf=args.crf,
+        encode_workers=args.encode_workers,
+        chunk_seconds=args.chunk_seconds,
+        segment_seconds=args.segment_seconds,
+        segment_mb=args.segment_mb,
+        segment_template=os.path.join(out_dir or os.getcwd(), template),
+        skip_unchanged=args.skip_unchanged,
+        vfr=args.vfr,
+        frame_index=args.frame_index,
+        replay_seconds=args.replay,
+        replay_mb=args.replay_mb,
+        output_scale=args.scale,
+        output_max_width=args.max_width,
+        metrics_path=args.metrics,
+        trace_path=args.trace,
+        trace_events=args.trace_events,
+        adaptive_quality=args.adaptive,
+        spool=args.spool,
+        spool_codec=args.spool_codec,
+    )
+    if args.monitor == MONITOR_EACH:
+        spec = args.region.strip().lower()
+        if re.fullmatch(r"\d+x\d+.*", spec):
+            print("--monitor each needs --region full or W:H", file=sys.stderr)
+            return 2
+        # Every engine opens its own mss handle (they are not shareable across threads)
+        configs = [
+            dataclasses.replace(
+                config,
+                output_path=per_monitor_path(config.output_path, i),
+                bbox=parse_region(spec, mon),
+                source=None,
+                follow_fullscreen=False,
+                segment_template=per_monitor_path(config.segment_template, i),
+                metrics_path=(
+                    config.metrics_path and per_monitor_path(config.metrics_path, i)
+                ),
+                trace_path=config.trace_path and per_monitor_path(config.trace_path, i),
+            )
+            for i, mon in enumerate(list_monitors()[1:], start=1)
+        ]
+        engine = MultiMonitorRecorder(
+            configs,
+            use_processes=args.processes,
+            on_status=lambda text: print(text, file=sys.stderr),
+        )
+    else:
+        engine = RecorderEngine(
+            config, on_status=lambda text: print(text, file=sys.stderr)
+        )
+
+    if args.encoder == ENCODER_AUTO and args.benchmark and not args.spool:
+        multi = isinstance(engine, MultiMonitorRecorder)
+        sizes = {
+            scaled_size(c.bbox.width, c.bbox.height, c.output_scale, c.output_max_width)
+            for c in (engine.configs if multi else [config])
+        }
+        for size in sorted(sizes):
+            if load_encoder_benchmarks(size, args.preset) is None:
+                print(
+                    f"Benchmarking encoders at {size[0]}x{size[1]} "
+                    f"(once; cached in {encoder_cache_path()})...",
+                    file=sys.stderr,
+                )
+                benchmark_encoders(size, fps=args.fps, preset=args.preset, crf=args.crf)
+
+    # SIGTERM (e.g. from a scheduler) finishes the file just like Ctrl+C
+    stop_requested = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_requested.set())
+    if args.replay > 0 and hasattr(signal, "SIGUSR1"):
+        # kill -USR1 <pid> saves the instant-replay buffer without stopping
+        signal.signal(signal.SIGUSR1, lambda *_: engine.save_replay())
+
+    try:
+        engine.start()
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    deadline = None if args.duration is None else time.monotonic() + args.duration
+    try:
+        while engine.is_recording and not stop_requested.is_set():
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            stop_requested.wait(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.replay > 0:
+            engine.save_replay()
+        engine.stop()
+        if args.replay > 0:
+            for e in getattr(engine, "engines", [engine]):
+                e.wait_for_replays()
+    if isinstance(engine, MultiMonitorRecorder):
+        paths = engine.output_paths
+    elif engine.replay is not None:
+        paths = engine.replay_paths
+    else:
+        paths = engine.segment_paths or [engine.output_path]
+    for e in getattr(engine, "engines", [engine]):
+        pacing = e.pacing_summary()
+        if pacing is not None and pacing["frames"]:
+            print(
+                f"Pacing: {pacing['frames']} frames late by "
+                f"{pacing['mean_ms']:.2f} ms mean, {pacing['p99_ms']:.2f} ms p99, "
+                f"{pacing['max_ms']:.2f} ms max",
+                file=sys.stderr,
+            )
+    rc = 1 if engine.last_error else 0
+    if args.spool:
+        spools = [spool_path_for(p) for p in paths if os.path.exists(spool_path_for(p))]
+        paths, transcode_rc = _transcode_spools(spools, stop=stop_requested)
+        rc = rc or transcode_rc
+    for path in paths:
+        print(path)
+    return rc
+
+
+def _transcode_spools(
+    spools: list,
+    output: Optional[str] = None,
+    keep_spool: bool = False,
+    stop: Optional[threading.Event] = None,
+) -> Tuple[list, int]:
+    """Encode spools one after another at low priority with progress on stderr.
+    Ctrl+C or `stop` cancels; finished parts are kept so a later run resumes.
+    Returns (video paths, exit code).
+    """
+    paths, rc = [], 0
+    for spool in spools:
+        name = os.path.basename(spool)
+
+        def progress(done: int, total: int) -> None:
+            print(
+                f"\rEncoding {name}: {100.0 * done / max(1, total):5.1f}% "
+                f"({done}/{total} frames)",
+                end="",
+                file=sys.stderr,
+                flush=True,
+            )
+
+        job = SpoolTranscoder(
+            spool, output, on_progress=progress, keep_spool=keep_spool
+        )
+        job.start()
+        try:
+            while job.is_alive():
+                if stop is not None and stop.is_set():
+                    job.cancel()
+                job.join(0.2)
+        except KeyboardInterrupt:
+            job.cancel()
+            job.join()
+        print(file=sys.stderr)
+        if job.cancelled:
+            print(
+                f"Encoding cancelled; resume with: screen_recorder transcode {spool}",
+                file=sys.stderr,
+            )
+            return paths, 130
+        if job.error:
+            print(f"Encoding {spool} failed: {job.error}", file=sys.stderr)
+            rc = 1
+            continue
+        paths.append(job.output_path)
+    return paths, rc
+
+
+def run_encoders(args: argparse.Namespace) -> int:
+    """Benchmark the encoder backends (or show cached ones) and each profile's pick."""
+    try:
+        if args.size:
+            w, h = _parse_size(args.size)
+        else:
+            mon = monitor_rect(MONITOR_PRIMARY)
+            w, h = mon.width, mon.height
+    except (ValueError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    size = (even(w), even(h))
+    results = None if args.refresh else load_encoder_benchmarks(size, args.preset)
+    if results is None:
+        print(f"Benchmarking encoders at {size[0]}x{size[1]}...", file=sys.stderr)
+        results = benchmark_encoders(size, preset=args.preset)
+    print(f"{'encoder':<22}{'class':<11}{'fps':>8}{'KB/frame':>10}  status")
+    for name, backend in ENCODER_REGISTRY.items():
+        r = results.get(name, {})
+        status = "ok" if r.get("ok") else r.get("error", "not benchmarked")
+        fps, kb = r.get("fps", 0.0), r.get("bytes_per_frame", 0) / 1024
+        print(f"{name:<22}{backend.quality:<11}{fps:>8.1f}{kb:>10.1f}  {status}")
+    print()
+    for profile in ENCODER_PROFILES:
+        print(f"auto ({profile}): {rank_encoders(size, profile, args.preset)[0]}")
+    print(f"Results cached in {encoder_cache_path()}", file=sys.stderr)
+    return 0
+
+
+def _parse_clock(text: str) -> float:
+    """Seconds from '12.5', '01:02' or '1:02:03.5'."""
+    parts = text.strip().split(":")
+    if not 1 <= len(parts) <= 3:
+        raise ValueError(f"Invalid time '{text}': expected seconds or [HH:]MM:SS")
+    try:
+        values = [float(p) for p in parts]
+    except ValueError:
+        raise ValueError(f"Invalid time '{text}': expected seconds or [HH:]MM:SS")
+    seconds = 0.0
+    for v in values:
+        seconds = seconds * 60 + v
+    return seconds
+
+
+def _parse_wall(text: str, index: FrameIndex) -> float:
+    """Epoch seconds from an ISO date-time or a time of day on the recording's day."""
+    try:
+        return datetime.datetime.fromisoformat(text.strip()).timestamp()
+    except ValueError:
+        pass
+    day = datetime.datetime.fromtimestamp(index.wall_start).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    if text.count(":") not in (1, 2):
+        raise ValueError(
+            f"Invalid wall-clock time '{text}': expected an ISO date-time or HH:MM[:SS]"
+        )
+    seconds = _parse_clock(text if text.count(":") == 2 else text + ":00")
+    return (day + datetime.timedelta(seconds=seconds)).timestamp()
+
+
+def _format_wall(epoch: float) -> str:
+    return datetime.datetime.fromtimestamp(epoch).isoformat(
+        sep=" ", timespec="milliseconds"
+    )
+
+
+def run_seek(args: argparse.Namespace) -> int:
+    """Print where a moment of a recording is: frame, file time, keyframe, offset."""
+    try:
+        index = FrameIndex.for_video(args.video)
+        if args.wall is not None:
+            point = index.seek(wall=_parse_wall(args.wall, index))
+        else:
+            point = index.seek(pts=_parse_clock(args.at or "0"))
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(
+        f"frame {point.frame} at {point.pts:.3f} s, captured {_format_wall(point.wall)}"
+    )
+    if point.keyframe is None:
+        print("keyframe unknown (the index has no keyframe information)")
+    else:
+        where = f", byte offset {point.offset}" if point.offset is not None else ""
+        print(f"keyframe {point.keyframe} at {point.keyframe_pts:.3f} s{where}")
+    for frame, paused, resumed in index.pauses():
+        resumed_text = _format_wall(resumed) if resumed is not None else "end"
+        print(f"paused before frame {frame}: {_format_wall(paused)} -> {resumed_text}")
+    return 0
+
+
+def run_trim(args: argparse.Namespace) -> int:
+    """Cut a range out of a recording without re-encoding."""
+    try:
+        index = FrameIndex.for_video(args.video)
+
+        def file_time(text: Optional[str], default: float) -> float:
+            if text is None:
+                return default
+            if args.wall:
+                # Wall-clock moments map to frames and from there to file time
+                return float(index.pts[index.frame_at_wall(_parse_wall(text, index))])
+            return _parse_clock(text)
+
+        start, end = file_time(args.start, 0.0), file_time(args.end, index.duration)
+        path, cut_start, cut_end = trim_video(args.video, start, end, args.output)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    if cut_start < start - 1e-3:
+        print(f"Start moved back to the keyframe at {cut_start:.3f} s", file=sys.stderr)
+    print(path)
+    return 0
+
+
+def run_transcode(args: argparse.Namespace) -> int:
+    """Encode (or resume encoding) spools left by encode-later recordings."""
+    if args.output and len(args.spools) > 1:
+        print("--output needs a single spool", file=sys.stderr)
+        return 2
+    stop_requested = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_requested.set())
+    paths, rc = _transcode_spools(
+        args.spools, args.output, args.keep_spool, stop_requested
+    )
+    for path in paths:
+        print(path)
+    return rc
+
+
+def run_gui() -> None:
     if not ensure_dependencies():
         # Continue launching anyway; tkinter UI will still show
         pass
@@ -1153,4 +7730,48 @@ if __name__ == "__main__":
         pass
 
     app = ScreenRecorderApp(root)
+    startup_profile.mark("ui built")
+
+    def on_map(_event=None):
+        startup_profile.mark("window shown")
+        root.unbind("<Map>")
+
+    root.bind("<Map>", on_map)
     root.mainloop()
+
+
+def write_startup_profile(target: str) -> None:
+    """Print the startup profile ('-') or append it as a JSON line to `target`."""
+    if target == "-":
+        print(startup_profile.report(), file=sys.stderr)
+        return
+    record = dict(startup_profile.as_dict(), time=time.time(), argv=sys.argv[1:])
+    with open(target, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def main(argv: Optional[list] = None) -> int:
+    startup_profile.mark("main")
+    args = _build_arg_parser().parse_args(argv)
+    try:
+        if args.command == "record":
+            return run_record(args)
+        if args.command == "transcode":
+            return run_transcode(args)
+        if args.command == "encoders":
+            return run_encoders(args)
+        if args.command == "seek":
+            return run_seek(args)
+        if args.command == "trim":
+            return run_trim(args)
+        run_gui()
+        return 0
+    finally:
+        if args.startup_profile:
+            write_startup_profile("-")
+        if args.startup_profile_json:
+            write_startup_profile(args.startup_profile_json)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,639 @@
+"""Headless tests of the recorder's building blocks: no display, Tk or screen capture
+is needed.
+"""
+
+import datetime
+import os
+import subprocess
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import screen_recorder as sr
+
+BOX = sr.BBox(0, 0, 64, 48)
+
+
+# ----------------------- FRAME QUEUE -----------------------
+def packet(seq: int, repeats: int = 1) -> sr.FramePacket:
+    return sr.FramePacket(seq=seq, t_capture=0.0, repeats=repeats, bbox=BOX, frame=None)
+
+
+def drain(q: sr.FrameQueue) -> list:
+    out = []
+    while q.qsize():
+        out.append(q.get())
+    return out
+
+
+def test_drop_oldest_evicts_queued_frame_and_keeps_its_slots():
+    q = sr.FrameQueue(2, sr.DROP_OLDEST)
+    stop = threading.Event()
+    assert all(q.put(packet(i), stop) for i in range(3))
+    assert q.dropped == 1
+    got = drain(q)
+    assert [p.seq for p in got] == [1, 2]
+    assert [p.repeats for p in got] == [1, 2]  # frame 0's slot becomes a duplicate
+
+
+def test_drop_newest_discards_incoming_frame_and_carries_its_slots():
+    q = sr.FrameQueue(2, sr.DROP_NEWEST)
+    stop = threading.Event()
+    assert q.put(packet(0), stop) and q.put(packet(1), stop)
+    assert not q.put(packet(2), stop)
+    assert q.dropped == 1
+    assert q.get().seq == 0
+    assert q.put(packet(3), stop)
+    got = drain(q)
+    assert [(p.seq, p.repeats) for p in got] == [(1, 1), (3, 2)]
+
+
+def test_block_waits_for_the_consumer_until_stopped():
+    q = sr.FrameQueue(1, sr.DROP_BLOCK)
+    stop = threading.Event()
+    assert q.put(packet(0), stop)
+    consumer = threading.Timer(0.2, q.get)
+    consumer.start()
+    t0 = time.monotonic()
+    assert q.put(packet(1), stop)
+    assert time.monotonic() - t0 >= 0.15
+    consumer.join()
+    stop.set()
+    assert not q.put(packet(2), stop)  # full and stopping: gives up
+    assert q.dropped == 0
+    assert [p.seq for p in drain(q)] == [1]
+
+
+def test_close_lets_the_consumer_drain_queued_frames_first():
+    q = sr.FrameQueue(2, sr.DROP_OLDEST)
+    q.put(packet(0), threading.Event())
+    q.close()
+    assert q.get().seq == 0
+    assert q.get() is None
+
+
+def test_unknown_drop_policy_is_rejected():
+    with pytest.raises(ValueError):
+        sr.FrameQueue(2, "drop-random")
+
+
+# ----------------------- CHANGE DETECTION -----------------------
+def test_change_detector_reports_changed_tiles():
+    det = sr.ChangeDetector(tile=64)
+    frame = np.zeros((128, 128, 4), dtype=np.uint8)
+    assert det.check(frame.copy()) == (True, 1.0)  # no reference yet
+    assert det.check(frame.copy()) == (False, 0.0)
+    changed = frame.copy()
+    changed[70, 10, 1] = 255  # one pixel in the bottom-left tile
+    assert det.check(changed) == (True, 0.25)
+    assert det.check(np.zeros((64, 64, 4), dtype=np.uint8)) == (True, 1.0)  # resized
+
+
+def test_change_detector_handles_bgr_frames():
+    det = sr.ChangeDetector(tile=32)
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    det.check(frame.copy())
+    changed = frame.copy()
+    changed[0, 0, 2] = 1
+    assert det.check(changed) == (True, 0.25)
+
+
+def test_change_detector_stride_forces_periodic_refresh():
+    det = sr.ChangeDetector(tile=64, stride=4, refresh_every=3)
+    frame = np.zeros((128, 128, 4), dtype=np.uint8)
+    det.check(frame.copy())
+    hidden = frame.copy()
+    hidden[1, 1, 0] = 255  # between sampled pixels
+    results = [det.check(f)[0] for f in (hidden, hidden.copy(), hidden.copy())]
+    assert results == [False, False, True]
+
+
+# ----------------------- REGIONS AND FILE NAMES -----------------------
+def test_parse_region():
+    mon = sr.BBox(0, 0, 1920, 1200)
+    assert sr.parse_region("full", mon) == mon
+    assert sr.parse_region("16:9", mon) == sr.BBox(0, 60, 1920, 1080)
+    assert sr.parse_region("641x481+10-20") == sr.BBox(10, -20, 640, 480)
+    assert sr.parse_region(" 800X600 ") == sr.BBox(0, 0, 800, 600)
+    for bad in ("abc", "800x", "2x2"):
+        with pytest.raises(ValueError):
+            sr.parse_region(bad, mon)
+
+
+def test_build_output_path():
+    when = datetime.datetime(2024, 5, 6, 7, 8, 9)
+    path = sr.build_output_path("out", "rec_%Y-%m-%d_%H%M%S.mp4", when)
+    assert path == os.path.join("out", "rec_2024-05-06_070809.mp4")
+
+
+def test_scaled_size():
+    assert sr.scaled_size(1920, 1080) == (1920, 1080)
+    assert sr.scaled_size(3840, 2160, 0.5) == (1920, 1080)
+    assert sr.scaled_size(1920, 1080, max_width=1280) == (1280, 720)
+    assert sr.scaled_size(1001, 501) == (1000, 500)  # even for yuv420p
+    assert sr.scaled_size(3, 3, 0.1) == (2, 2)
+
+
+def test_segment_path():
+    when = datetime.datetime(2024, 5, 6, 7, 8, 9)
+    path = sr.segment_path("rec_%Y-%m-%d_{seq}.mp4", 3, when)
+    assert path == "rec_2024-05-06_003.mp4"
+    assert sr.segment_path("rec_{seq:02d}.mkv", 7, when) == "rec_07.mkv"
+    assert sr.segment_path("rec_%H%M.mp4", 12, when) == "rec_0708_012.mp4"
+
+
+# ----------------------- METRICS -----------------------
+def test_latency_histogram_quantiles():
+    hist = sr.LatencyHistogram()
+    assert hist.quantiles((0.5, 0.99)) == [0.0, 0.0]
+    for ms in range(1, 101):
+        hist.observe(ms / 1000.0)
+    p50, p95, p99 = hist.quantiles((0.5, 0.95, 0.99))
+    # Buckets are 25% apart
+    assert p50 == pytest.approx(0.050, rel=0.25)
+    assert p95 == pytest.approx(0.095, rel=0.25)
+    assert p99 == pytest.approx(0.099, rel=0.25)
+    assert p50 < p95 <= p99
+    since = hist.snapshot()
+    for _ in range(10):
+        hist.observe(1.0)
+    assert hist.count == 110
+    assert hist.quantiles((0.5,), since=since)[0] == pytest.approx(1.0, rel=0.25)
+
+
+# ----------------------- ADAPTIVE QUALITY -----------------------
+def load_stats(load: float, fps: float = 30.0, dropped: int = 0) -> dict:
+    """One second of stats with the write stage busy `load` of the time."""
+    idle = {"count": 30, "mean_ms": 0.0}
+    return {
+        "capture_fps": fps,
+        "dropped_per_s": dropped,
+        "stages": {
+            "grab": {"count": 30, "mean_ms": 1.0},
+            "convert": idle,
+            "overlay": idle,
+            "resize": idle,
+            "write": {"count": 30, "mean_ms": load * 1000.0 / 30},
+        },
+    }
+
+
+def overload(qc: sr.QualityController, start: int, seconds: int) -> list:
+    stats = load_stats(0.95)
+    return [qc.update(stats, float(t)) for t in range(start, start + seconds)]
+
+
+def test_quality_ladder_halves_frame_rate_before_faster_presets():
+    assert [level.describe(30.0) for level in sr.quality_ladder("veryfast")] == [
+        "30 fps, veryfast",
+        "15 fps, veryfast",
+        "15 fps, superfast",
+        "15 fps, ultrafast",
+    ]
+    assert [level.stride for level in sr.quality_ladder()] == [1, 2]
+
+
+def test_quality_controller_steps_down_after_sustained_overload():
+    qc = sr.QualityController(sr.quality_ladder("veryfast"), 30.0)
+    reasons = overload(qc, 1, 4)  # two warm-up seconds, then two overloaded ones
+    assert reasons[:3] == [None, None, None]
+    assert reasons[3].startswith("overloaded")
+    assert qc.level == 1
+    # Still overloaded, but the next step waits for the cooldown
+    assert overload(qc, 5, 2) == [None, None]
+    assert overload(qc, 7, 1)[0] is not None
+    assert qc.level == 2
+
+
+def test_quality_controller_steps_up_only_with_headroom():
+    qc = sr.QualityController(sr.quality_ladder(), 30.0)
+    overload(qc, 1, 4)
+    assert qc.level == 1
+    # 40% load would be 80% at the full frame rate: above the target, so stay
+    assert [qc.update(load_stats(0.4), float(t)) for t in range(5, 20)] == [None] * 15
+    assert qc.level == 1
+    # 25% load predicts 50%: step up after HEADROOM_TICKS such seconds
+    reasons = [qc.update(load_stats(0.25), float(t)) for t in range(20, 20 + 5)]
+    assert reasons[:4] == [None] * 4
+    assert reasons[4].startswith("headroom")
+    assert qc.level == 0
+
+
+def test_quality_controller_treats_drops_as_overload():
+    qc = sr.QualityController(sr.quality_ladder(), 30.0)
+    reasons = [qc.update(load_stats(0.1, dropped=3), float(t)) for t in range(1, 5)]
+    assert reasons[3] is not None
+    assert qc.level == 1
+
+
+# ----------------------- VIDEO WRITERS -----------------------
+FFMPEG = sr.find_ffmpeg_x264()
+NEEDS_FFMPEG = pytest.mark.skipif(FFMPEG is None, reason="ffmpeg with libx264 needed")
+
+
+def moving_square(i: int) -> np.ndarray:
+    frame = np.full((240, 320, 3), 60, dtype=np.uint8)
+    frame[:, :, 2] = np.arange(320, dtype=np.uint8)[None, :] // 2
+    x = (i * 7) % 260
+    frame[90:150, x : x + 60] = (40, 200, 240)
+    return frame
+
+
+@NEEDS_FFMPEG
+def test_preset_switch_output_decodes_across_the_join(tmp_path):
+    out = str(tmp_path / "switch.mp4")
+    writer = sr.PresetSwitchWriter(out, 30, (320, 240), preset="medium", ffmpeg=FFMPEG)
+    for i in range(90):
+        if i in (30, 60):
+            writer.set_preset("ultrafast" if i == 30 else "fast")
+        writer.write(moving_square(i))
+    writer.release()
+    # Drop any in-band SPS/PPS so the decoder has only the file's single avcC to go
+    # by, like players that ignore in-band parameter sets
+    stripped = str(tmp_path / "stripped.mp4")
+    cmd = [FFMPEG, "-v", "error", "-i", out, "-c", "copy"]
+    cmd += ["-bsf:v", "filter_units=remove_types=7|8", stripped]
+    subprocess.run(cmd, check=True)
+    decode = [FFMPEG, "-v", "error", "-i", stripped, "-f", "null", "-"]
+    assert subprocess.run(decode, capture_output=True, text=True).stderr == ""
+    cap = cv2.VideoCapture(stripped)
+    errors = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        diff = cv2.absdiff(frame, moving_square(len(errors)))
+        errors.append(float(diff.mean()))
+    cap.release()
+    assert len(errors) == 90
+    assert max(errors) < 4.0
+
+
+@NEEDS_FFMPEG
+def test_pipe_writer_is_not_blocked_by_ffmpeg_log_output(tmp_path):
+    # Debug logging fills a 64 KiB stderr pipe within a few frames
+    args = ["-loglevel", "debug", "-c:v", "libx264", "-preset", "ultrafast"]
+    writer = sr.FfmpegPipeWriter(
+        str(tmp_path / "chatty.mp4"), 30, (64, 48), ffmpeg=FFMPEG, codec_args=args
+    )
+
+    def record():
+        for i in range(1000):
+            writer.write(np.full((48, 64, 3), i % 256, dtype=np.uint8))
+        writer.release()
+
+    t = threading.Thread(target=record, daemon=True)
+    t.start()
+    t.join(timeout=30.0)
+    assert not t.is_alive()
+    assert os.path.getsize(tmp_path / "chatty.mp4") > 0
+
+
+@NEEDS_FFMPEG
+def test_pipe_writer_reports_why_ffmpeg_exited(tmp_path):
+    args = ["-c:v", "libx264", "-preset", "no-such-preset"]
+    writer = sr.FfmpegPipeWriter(
+        str(tmp_path / "broken.mp4"), 30, (64, 48), ffmpeg=FFMPEG, codec_args=args
+    )
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    with pytest.raises(RuntimeError, match="invalid preset 'no-such-preset'"):
+        for _ in range(1000):
+            writer.write(frame)
+    writer.release()
+
+
+# ----------------------- ENCODE LATER -----------------------
+NEEDS_LZ4 = pytest.mark.skipif(not sr._have_lz4(), reason="lz4 not installed")
+SPOOL_CODECS = ["raw", "zlib", pytest.param("lz4", marks=NEEDS_LZ4)]
+
+
+@pytest.fixture
+def small_spools(monkeypatch):
+    # Keep the preallocation small; 256 MB steps are meant for real recordings
+    monkeypatch.setattr(sr.FrameSpool, "GROW_BYTES", 64 * 1024)
+
+
+def frames(count: int) -> list:
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (48, 64, 3), dtype=np.uint8) for _ in range(count)]
+
+
+@pytest.mark.parametrize("codec", SPOOL_CODECS)
+def test_spool_round_trip(tmp_path, small_spools, codec):
+    f0, f1 = frames(2)
+    path = str(tmp_path / "rec.spool")
+    spool = sr.FrameSpool(path, (64, 48), 10.0, codec=codec, meta={"ext": ".mp4"})
+    spool.add(f0, 0.0)
+    spool.add(f0, 0.1, reused=True)  # unchanged: only bumps the repeat count
+    spool.add(f1, 0.2, repeats=2)
+    spool.close()
+    with sr.SpoolReader(path) as reader:
+        assert reader.codec == codec
+        assert reader.size == (64, 48)
+        assert reader.header["ext"] == ".mp4"
+        assert [(r[2], r[3]) for r in reader.records] == [(2, 0.0), (2, 0.2)]
+        assert reader.frames == spool.frames == 4
+        for index, frame in enumerate((f0, f1)):
+            expected = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+            assert np.array_equal(reader.frame_i420(index), expected)
+
+
+def test_truncated_spool_reads_up_to_last_complete_frame(tmp_path, small_spools):
+    path = str(tmp_path / "cut.spool")
+    spool = sr.FrameSpool(path, (64, 48), 10.0, codec="zlib")
+    for i, frame in enumerate(frames(3)):
+        spool.add(frame, i / 10.0)
+    spool.close()
+    with open(path, "r+b") as fh:
+        fh.truncate(os.path.getsize(path) - 10)  # cut into the last payload
+    with sr.SpoolReader(path) as reader:
+        assert len(reader.records) == 2
+        assert reader.frames == 2
+
+
+def test_spool_of_crashed_recording_stops_at_preallocated_space(tmp_path, small_spools):
+    path = str(tmp_path / "crash.spool")
+    spool = sr.FrameSpool(path, (64, 48), 10.0, codec="raw")
+    for i, frame in enumerate(frames(2)):
+        spool.add(frame, i / 10.0)
+    try:
+        # Not closed: the file still ends in zeroed, preallocated space
+        assert os.path.getsize(path) > spool.nbytes
+        with sr.SpoolReader(path) as reader:
+            assert len(reader.records) == 2
+    finally:
+        spool.close()
+
+
+def test_transcoder_plan_splits_parts_on_record_boundaries():
+    records = [(0, 0, repeats, 0.0) for repeats in (3, 3, 3, 3, 1)]
+    plan = sr.SpoolTranscoder._plan(records, 5)
+    assert plan == [(0, 2, 6), (2, 4, 6), (4, 5, 1)]
+    assert sr.SpoolTranscoder._plan(records, 0) == [(0, 5, 13)]  # no ffmpeg: one part
+    assert sr.SpoolTranscoder._plan([], 5) == []
+
+
+# ----------------------- FRAME INDEX -----------------------
+def write_index(path: str) -> None:
+    """Ten frames at 10 fps, keyframes at 0 and 5, paused for 5 s before frame 5."""
+    rows = []
+    for i in range(10):
+        if i == 5:
+            rows.append((sr.INDEX_PAUSE, 0, 5, 0.5, 100.45, 0))
+            rows.append((sr.INDEX_RESUME, 0, 5, 0.5, 105.45, 0))
+        flags = sr.INDEX_KEYFRAME if i in (0, 5) else 0
+        t_capture = 100.0 + i / 10.0 + (5.0 if i >= 5 else 0.0)
+        rows.append((sr.INDEX_FRAME, flags, i, i / 10.0, t_capture, i * 100))
+    records = np.zeros(len(rows), dtype=sr.INDEX_FIELDS)
+    names = ("kind", "flags", "frame", "pts", "t_capture", "offset")
+    for name, column in zip(names, zip(*rows)):
+        records[name] = column
+    header = {
+        "version": 1,
+        "video": "rec.mp4",
+        "fps": 10.0,
+        "wall_offset": 1000.0,
+        "vfr": False,
+        "keyframes": True,
+        "offsets": True,
+    }
+    sr.write_frame_index(path, header, records)
+
+
+def test_frame_index_seek(tmp_path):
+    path = str(tmp_path / "rec.mp4.idx")
+    write_index(path)
+    index = sr.FrameIndex(path)
+    assert len(index) == 10
+    assert index.duration == pytest.approx(1.0)
+    assert index.wall_start == pytest.approx(1100.0)
+    point = index.seek(pts=0.72)
+    assert (point.frame, point.keyframe, point.offset) == (7, 5, 500)
+    assert point.keyframe_pts == pytest.approx(0.5)
+    assert point.wall == pytest.approx(1105.7)
+    assert index.seek(pts=0.3).keyframe == 0
+    assert index.seek(pts=-1.0).frame == 0
+    assert index.seek(wall=1105.75).frame == 7
+
+
+def test_frame_index_pauses_and_wall_clock(tmp_path):
+    path = str(tmp_path / "rec.mp4.idx")
+    write_index(path)
+    index = sr.FrameIndex(path)
+    assert index.pauses() == [(5, pytest.approx(1100.45), pytest.approx(1105.45))]
+    assert index.frame_at_wall(0.0) == 0
+    assert index.frame_at_wall(1100.45) == 4
+    assert index.frame_at_wall(1102.0) == 4  # paused: still showing the last frame
+    assert index.frame_at_wall(1105.55) == 5
+
+
+def test_empty_frame_index_cannot_seek(tmp_path):
+    path = str(tmp_path / "empty.mp4.idx")
+    sr.write_frame_index(
+        path, {"version": 1, "fps": 10.0}, np.zeros(0, dtype=sr.INDEX_FIELDS)
+    )
+    index = sr.FrameIndex(path)
+    assert len(index) == 0 and index.duration == 0.0
+    with pytest.raises(ValueError):
+        index.seek(pts=0.0)
+
+
+# ----------------------- MULTI-MONITOR -----------------------
+def test_merged_stats_follow_any_monitor_and_drop_stale_rows(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(sr.time, "monotonic", lambda: clock[0])
+    published = []
+    recorder = sr.MultiMonitorRecorder([], on_stats=published.append)
+
+    def report(index, t, fps):
+        clock[0] = t
+        recorder._on_child_stats(index, {"capture_fps": fps, "late_ms_max": fps})
+
+    report(1, 100.0, 10)  # not only monitor 0 triggers a publish
+    report(0, 100.3, 20)  # within the interval: held back
+    report(1, 101.0, 10)
+    report(0, 102.3, 20)  # monitor 1 last heard 1.3 s ago: still counted
+    report(0, 103.3, 20)  # 2.3 s ago: dropped
+    assert [p["capture_fps"] for p in published] == [10, 30, 30, 20]
+    assert published[-1]["late_ms_max"] == 20
+
+
+# ----------------------- UI BRIDGE -----------------------
+class FakeTk:
+    """Just the `after` scheduling UiBridge uses."""
+
+    def __init__(self) -> None:
+        self.scheduled = []
+
+    def after(self, ms: int, fn):
+        self.scheduled.append(fn)
+        return len(self.scheduled)
+
+    def after_cancel(self, after_id) -> None:
+        pass
+
+    def run_next(self) -> None:
+        self.scheduled.pop(0)()
+
+
+def test_ui_bridge_coalesces_posts_per_kind():
+    master = FakeTk()
+    bridge = sr.UiBridge(master)
+    seen = []
+    bridge.on("stats", lambda value: seen.append(("stats", value)))
+    bridge.on("status", lambda value: seen.append(("status", value)))
+    bridge.on("bbox", lambda value: 1 / 0)
+    bridge.start()
+
+    def post_stats():
+        for i in range(500):
+            bridge.post("stats", i)
+
+    posters = [threading.Thread(target=post_stats) for _ in range(4)]
+    for t in posters:
+        t.start()
+    for t in posters:
+        t.join()
+    bridge.post("bbox")
+    bridge.post("status", "Recording...")
+    bridge.post("unhandled", 1)
+    master.run_next()
+    assert seen == [("status", "Recording..."), ("stats", 499)]
+    assert len(master.scheduled) == 1  # rescheduled despite the failing handler
+    master.run_next()
+    assert len(seen) == 2  # nothing new posted
+    bridge.stop()
+
+
+def test_ui_bridge_delivers_every_status_in_order():
+    master = FakeTk()
+    bridge = sr.UiBridge(master)
+    seen = []
+    bridge.on("status", seen.append)
+    bridge.on("error", lambda value: seen.append(f"error: {value}"))
+    bridge.start()
+    bridge.post("status", "Saved part 1")
+    bridge.post("error", "disk full")
+    bridge.post("status", "Saved part 2")
+    master.run_next()
+    assert seen == ["Saved part 1", "error: disk full", "Saved part 2"]
+    for i in range(sr.UiBridge.QUEUE_LIMIT + 5):
+        bridge.post("status", i)
+    master.run_next()
+    assert seen[3:] == list(range(5, sr.UiBridge.QUEUE_LIMIT + 5))
+    bridge.stop()
+
+
+# ----------------------- LIVE PREVIEW -----------------------
+def test_preview_sampler_renders_ppm_and_skips_unchanged_frames():
+    frame = sr.FrameBufferPool().acquire((90, 160, 3))
+    frame.array[:] = 50
+    seq = [1]
+    got = []
+    sampler = sr.PreviewSampler(
+        frame.retain,
+        lambda ppm, size: got.append((ppm, size)),
+        fps=50.0,
+        frame_seq=lambda: seq[0],
+    )
+    sampler.start()
+    time.sleep(0.3)
+    seq[0] = 2  # a new frame: exactly one more preview
+    time.sleep(0.3)
+    sampler.stop()
+    assert len(got) == 2
+    ppm, size = got[0]
+    header = b"P6 160 90 255\n"
+    assert size == (160, 90)
+    assert ppm[: len(header)] == header and len(ppm) == len(header) + 160 * 90 * 3
+    assert set(ppm[len(header) :]) == {50}
+
+
+# ----------------------- RECORDING -----------------------
+def test_engine_records_without_tk(tmp_path):
+    out = str(tmp_path / "engine.mp4")
+    config = sr.RecorderConfig(
+        output_path=out,
+        bbox=sr.BBox(0, 0, 160, 120),
+        target_fps=20,
+        show_cursor=False,
+        show_clicks=False,
+        source=sr.SyntheticFrameSource(160, 120, fps=20),
+    )
+    finished = threading.Event()
+    engine = sr.RecorderEngine(config, on_finished=finished.set)
+    engine.start()
+    time.sleep(0.3)
+    engine.pause()
+    assert engine.is_paused
+    engine.resume()
+    time.sleep(0.3)
+    engine.stop()
+    assert finished.is_set()
+    assert not engine.is_recording and engine.last_error is None
+    assert os.path.getsize(out) > 0
+
+
+def test_record_command_configures_the_engine(tmp_path, monkeypatch):
+    engines = []
+
+    class FakeEngine(sr.RecorderEngine):
+        """Keeps the config instead of recording."""
+
+        def start(self) -> None:
+            engines.append(self)
+            self.is_recording = True
+
+        def stop(self, timeout: float = 5.0) -> None:
+            self.is_recording = False
+
+    monkeypatch.setattr(sr, "RecorderEngine", FakeEngine)
+    template = str(tmp_path / "cli_%Y.mp4")
+    argv = [
+        "record",
+        "--source",
+        "synthetic",
+        "--size",
+        "640x480",
+        "--region",
+        "320x240+10+20",
+        "--fps",
+        "12",
+        "--duration",
+        "0",
+        "--no-cursor",
+        "-o",
+        template,
+    ]
+    assert sr.main(argv) == 0
+    config = engines[0].config
+    assert isinstance(config.source, sr.SyntheticFrameSource)
+    assert config.bbox == sr.BBox(10, 20, 320, 240)
+    assert config.target_fps == 12.0
+    assert not config.show_cursor and config.show_clicks
+    year = datetime.date.today().year
+    assert config.output_path == str(tmp_path / f"cli_{year}.mp4")
+    assert not engines[0].is_recording
+
+
+def test_synthetic_recording_writes_video_and_index(tmp_path):
+    out = str(tmp_path / "synthetic.mp4")
+    config = sr.RecorderConfig(
+        output_path=out,
+        bbox=sr.BBox(0, 0, 320, 240),
+        target_fps=20,
+        encoder=sr.ENCODER_MP4V,
+        source=sr.SyntheticFrameSource(320, 240, fps=20),
+    )
+    engine = sr.RecorderEngine(config)
+    engine.start()
+    time.sleep(0.5)
+    engine.stop()
+    assert engine.last_error is None
+    assert os.path.getsize(out) > 0
+    index = sr.FrameIndex.for_video(out)
+    assert len(index) > 0
+    assert index.seek(pts=0.0).keyframe == 0